@@ -0,0 +1,133 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+
+if "answer_cache.py" in sys.argv[0]:
+	print("[-] Instead of poking around just try: python main.py --help")
+	sys.exit(-1)
+
+import time
+import collections
+
+import dns_proto
+
+# Precompiled answer section for one (record type, num, length) request. The
+# framing is stored in pieces: (chunk, start, end) means the chunk is followed
+# by text[start:end] of the random payload, the tail closes the section.
+class Answer_Template(object):
+	__slots__ = ("answer_num", "additional_record_num", "pieces", "tail", "payload_length", "expires", "used")
+
+	def __init__(self, answer_num, additional_record_num, pieces, tail, payload_length, expires):
+		self.answer_num = answer_num
+		self.additional_record_num = additional_record_num
+		self.pieces = pieces
+		self.tail = tail
+		self.payload_length = payload_length
+		self.expires = expires
+		self.used = 0
+
+# LRU cache of answer templates. A response is the header with the new
+# transaction ID, the echoed question and the template with fresh payload.
+# Templates are recompiled after max_age seconds, so time based fields (RRSIG
+# validity) do not go stale. Compressed names may point into the question,
+# so the length of the question is part of the key.
+class Answer_Cache():
+	def __init__(self, DNS_proto, payload, size=256, max_age=3600):
+		self.DNS_proto = DNS_proto
+		self.payload = payload
+		self.size = size
+		self.max_age = max_age
+		self.templates = {}
+
+		# every lookup is a tick, the least recently used template has the
+		# smallest tick and is evicted when a new one does not fit
+		self.tick = 0
+		self.hits = 0
+		self.misses = 0
+
+	def build_answer(self, transaction_id, record_type, RRtype, num, length, domain, orig_question):
+		key = (record_type, num, length, len(orig_question))
+		template = self.templates.get(key)
+		if (template is None) or (template.expires < time.time()):
+			self.misses += 1
+			template = self.compile(record_type, RRtype, num, length, domain, orig_question)
+			if (key not in self.templates) and (len(self.templates) >= self.size):
+				del self.templates[min(self.templates, key=lambda k: self.templates[k].used)]
+			self.templates[key] = template
+		else:
+			self.hits += 1
+		self.tick += 1
+		template.used = self.tick
+
+		if template.pieces is None:
+			# could not be compiled, built the normal way
+			encoded_text = []
+			for i in xrange(num):
+				encoded_text.append(RRtype.packer(self.payload.get(length)))
+			return self.DNS_proto.build_answer(transaction_id, [record_type, "", encoded_text, num, domain], orig_question)
+
+		text = self.payload.get(template.payload_length)
+		parts = [dns_proto.header_struct.pack(transaction_id, 0x8500, 1, template.answer_num, 0, template.additional_record_num), orig_question]
+		append = parts.append
+		for (chunk, start, end) in template.pieces:
+			append(chunk)
+			append(text[start:end])
+		append(template.tail)
+
+		return "".join(parts)
+
+	def compile(self, record_type, RRtype, num, length, domain, orig_question):
+		# the answer is built twice with different filler payloads, the bytes
+		# that differ are the payload, everything else is framing
+		answers = []
+		for filler in ("\x00", "\xff"):
+			encoded_text = [RRtype.packer(filler * length)] * num
+			answers.append(self.DNS_proto.build_answer(0, [record_type, "", encoded_text, num, domain], orig_question))
+		(first, second) = answers
+		expires = time.time() + self.max_age
+
+		# a framing field changed in between (e.g. the RRSIG timestamps)
+		if (len(first) != len(second)) or (first[:12] != second[:12]):
+			return Answer_Template(0, 0, None, None, 0, expires)
+		(transaction_id, flags, nquestions, answer_num, nauthority, additional_record_num) = dns_proto.header_struct.unpack_from(first, 0)
+
+		pieces = []
+		payload_length = 0
+		start = 12 + len(orig_question)
+		i = start
+		end = len(first)
+		while i < end:
+			if first[i] == second[i]:
+				i += 1
+				continue
+			j = i
+			while (j < end) and (first[j] != second[j]):
+				j += 1
+			pieces.append((first[start:i], payload_length, payload_length + j - i))
+			payload_length += j - i
+			start = i = j
+
+		if payload_length != num * length:
+			return Answer_Template(0, 0, None, None, 0, expires)
+
+		return Answer_Template(answer_num, additional_record_num, pieces, first[start:], payload_length, expires)
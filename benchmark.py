@@ -0,0 +1,299 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+import os
+import random
+import timeit
+import getopt
+import json
+import platform
+import struct
+
+import payload
+import dns_proto
+import encoding
+
+ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789"
+DOMAIN = "example.com."
+
+# the benchmarks are run in REPEAT rounds of about DURATION seconds each and
+# the best round counts. The rounds go over all benchmarks, so a slow phase
+# of a busy machine does not hit all runs of the same benchmark.
+DURATION = 0.05
+REPEAT = 20
+# slowdown that is reported as a regression by --compare, can be changed
+# with --threshold. Runs of the same code differ by up to 20% on a busy
+# machine (after the correction for its speed, see compare()), and a
+# benchmark that looks slower is measured once more before it is reported.
+THRESHOLD = 0.30
+
+# (num, length) of a minimal answer and of one that fills a 4KB EDNS packet
+ANSWER_SIZES = {
+	"A": [(1, 4), (250, 4)],
+	"AAAA": [(1, 16), (140, 16)],
+	"CNAME": [(1, 10), (20, 180)],
+	"MX": [(1, 10), (20, 180)],
+	"SRV": [(1, 10), (20, 180)],
+	"TXT": [(1, 10), (16, 250)],
+	"NULL": [(1, 10), (16, 250)],
+	"PRIVATE": [(1, 10), (16, 250)],
+	"DNSKEY": [(1, 10), (16, 250)],
+	"RRSIG": [(1, 10), (16, 200)],
+}
+
+# (group title, [(name, func, number)]) in the order they were added
+cases = []
+# (name, faster, slower) pairs that are printed as a speedup
+speedups = []
+results = {}
+# calls per round of every benchmark
+numbers = {}
+# operations per second of machine_loop()
+machine = {}
+
+def group(title):
+	cases.append((title, []))
+
+def bench(name, func, number=None):
+	cases[-1][1].append((name, func, number))
+
+def calibrate(func, duration=DURATION):
+	# fast and slow functions take about the same time, one round of each
+	# takes about duration
+	number = 1
+	while True:
+		elapsed = timeit.timeit(func, number=number)
+		if elapsed >= duration / 10:
+			break
+		number *= 10
+
+	return max(1, int(number * duration / elapsed))
+
+# Pure Python work of the same kind as the benchmarks (labels, struct,
+# slices, joins) that uses none of the code under test. Its speed is the
+# speed of the machine, --compare measures the changes against it.
+def machine_loop():
+	labels = []
+	for i in xrange(20):
+		label = ALPHABET[i:i+10]
+		labels.append(struct.pack("B", len(label)) + label)
+	data = "".join(labels)
+	offset = 0
+	parts = []
+	while offset < len(data):
+		length = struct.unpack("B", data[offset])[0]
+		parts.append(data[offset+1:offset+1+length])
+		offset += length + 1
+
+	return ".".join(parts)
+
+# operations per second of the best round
+def measure(func, number):
+	return number / min([timeit.timeit(func, number=number) for i in xrange(REPEAT)])
+
+def run():
+	best = {}
+	for title, group_cases in cases:
+		for (name, func, number) in group_cases:
+			numbers[name] = number or calibrate(func)
+	# short and before every benchmark, so the best of many runs spread over
+	# all rounds is the speed of the machine
+	machine_number = calibrate(machine_loop, DURATION / 5)
+	machine_best = None
+	for i in xrange(REPEAT):
+		for title, group_cases in cases:
+			for (name, func, number) in group_cases:
+				elapsed = timeit.timeit(machine_loop, number=machine_number)
+				machine_best = min(machine_best or elapsed, elapsed)
+				elapsed = timeit.timeit(func, number=numbers[name])
+				best[name] = min(best.get(name, elapsed), elapsed)
+
+	machine["ops"] = machine_number / machine_best
+	for title, group_cases in cases:
+		print("[*] " + title)
+		for (name, func, number) in group_cases:
+			ops = numbers[name] / best[name]
+			results[name] = {"ops": ops}
+			print("{0:<45} {1:>12.0f} ops/s".format(name, ops))
+			for (speedup_name, faster, slower) in speedups:
+				if speedup_name == name:
+					print("{0:<45} {1:>12.1f}x".format("speedup", results[faster]["ops"] / results[slower]["ops"]))
+
+def bench_payload():
+	group("Random payload generation")
+	pool = payload.Payload_Pool(ALPHABET)
+	for length in (16, 100, 1000):
+		number = 200000 / length
+		old = "random.choice() {0} bytes".format(length)
+		new = "Payload_Pool.get() {0} bytes".format(length)
+		bench(old, lambda length=length: "".join([random.choice(ALPHABET) for i in xrange(length)]), number)
+		bench(new, lambda length=length: pool.get(length), number)
+		speedups.append((new, new, old))
+
+def make_hostname(record_type, num, length, domain_length):
+	pool = payload.Payload_Pool(ALPHABET)
+	random_string = pool.get(domain_length)
+	labels = [random_string[i:i+63] for i in xrange(0, len(random_string), 63)]
+
+	return "{0:03d}{1:03d}{2}.{3}.".format(num, length, record_type.lower(), ".".join(labels))
+
+def make_answer(DNS_proto, record_type, num, length):
+	pool = payload.Payload_Pool(ALPHABET)
+	RRtype = DNS_proto.RR_types.get_by_name(record_type)
+	hostname = make_hostname(record_type, num, length, 15)
+	question = dns_proto.hostname_to_hostnamebin(hostname + DOMAIN) + dns_proto.question_struct.pack(RRtype.code, 1)
+	record = [record_type, "", [RRtype.packer(pool.get(length)) for i in xrange(num)], num, DOMAIN]
+
+	return (record, question)
+
+def bench_hostname():
+	group("Hostname conversion")
+	for domain_length in (15, 200):
+		hostname = make_hostname("cname", 1, 10, domain_length) + DOMAIN
+		hostnamebin = dns_proto.hostname_to_hostnamebin(hostname)
+		bench("hostname_to_hostnamebin() {0} bytes".format(len(hostname)), lambda hostname=hostname: dns_proto.hostname_to_hostnamebin(hostname))
+		bench("hostnamebin_to_hostname() {0} bytes".format(len(hostnamebin)), lambda hostnamebin=hostnamebin: dns_proto.hostnamebin_to_hostname(hostnamebin))
+
+def bench_query():
+	group("Query building")
+	for edns in (0, 1):
+		# every case has its own instance, the EDNS setting is per instance
+		DNS_proto = dns_proto.DNS_Proto()
+		DNS_proto.set_edns(edns)
+		for domain_length in (15, 200):
+			hostname = make_hostname("cname", 1, 10, domain_length)
+			bench("build_query() edns={0} {1} bytes name".format(edns, len(hostname)), lambda DNS_proto=DNS_proto, hostname=hostname: DNS_proto.build_query(1234, hostname, DOMAIN, 5))
+
+def bench_answer():
+	group("Answer building")
+	DNS_proto = dns_proto.DNS_Proto()
+	for record_type in sorted(ANSWER_SIZES):
+		for (num, length) in ANSWER_SIZES[record_type]:
+			(record, question) = make_answer(DNS_proto, record_type, num, length)
+			size = len(DNS_proto.build_answer(1234, record, question))
+			bench("build_answer() {0} {1}x{2} ({3} bytes)".format(record_type, num, length, size), lambda record=record, question=question: DNS_proto.build_answer(1234, record, question))
+
+def bench_parse():
+	group("Answer parsing")
+	DNS_proto = dns_proto.DNS_Proto()
+	for (record_type, num, length) in (("A", 1, 4), ("CNAME", 1, 10), ("CNAME", 20, 180), ("TXT", 16, 250)):
+		(record, question) = make_answer(DNS_proto, record_type, num, length)
+		answer = DNS_proto.build_answer(1234, record, question)
+		name = "{0} {1}x{2} ({3} bytes)".format(record_type, num, length, len(answer))
+		bench("is_valid_dns() " + name, lambda answer=answer: DNS_proto.is_valid_dns(answer, DOMAIN))
+		bench("parse_dns() " + name, lambda answer=answer: DNS_proto.parse_dns(answer, DOMAIN))
+		bench("parse_message() " + name, lambda answer=answer: DNS_proto.parse_message(answer, DOMAIN))
+
+def bench_encoding():
+	group("Encoding")
+	data = os.urandom(1000)
+	for encoding_class in encoding.ENCODINGS:
+		text = encoding_class.encode(data)
+		bench("{0} encode() {1} bytes".format(encoding_class.get_name(), len(data)), lambda encoding_class=encoding_class: encoding_class.encode(data))
+		bench("{0} decode() {1} bytes".format(encoding_class.get_name(), len(text)), lambda encoding_class=encoding_class, text=text: encoding_class.decode(text))
+
+def save(filename):
+	f = open(filename, "w")
+	json.dump({"python": platform.python_version(), "machine": machine["ops"], "results": results}, f, indent=4, sort_keys=True)
+	f.close()
+	print("[+] Results saved to {0}".format(filename))
+
+# Returns the number of benchmarks that got slower than the threshold. The
+# speed of a shared or throttled machine drifts by a third between runs, all
+# benchmarks together, so the changes are measured against the change of
+# machine_loop(). A slower helper that every benchmark uses still shows up.
+def compare(filename, threshold):
+	f = open(filename, "r")
+	saved = json.load(f)
+	f.close()
+	baseline = saved["results"]
+
+	names = [name for name in sorted(results) if name in baseline]
+	ratios = sorted([results[name]["ops"] / baseline[name]["ops"] for name in names])
+	print("")
+	print("[*] Compared to {0}".format(filename))
+	if saved.get("machine"):
+		speed = machine["ops"] / saved["machine"]
+		print("[*] {0:<45} {1:>+8.1f}%".format("speed of the machine", (speed - 1) * 100))
+	else:
+		speed = 1.0
+		print("[-] No speed of the machine in {0}, the changes are not corrected".format(filename))
+	if ratios:
+		print("[*] {0:<45} {1:>+8.1f}%".format("all benchmarks (median)", (ratios[len(ratios) / 2] / speed - 1) * 100))
+	funcs = dict([(name, func) for (title, group_cases) in cases for (name, func, number) in group_cases])
+	regressions = 0
+	for name in names:
+		change = results[name]["ops"] / baseline[name]["ops"] / speed - 1
+		if change < -threshold:
+			# a busy moment of the machine is not a regression, it has to
+			# be slower the second time as well
+			change = max(change, measure(funcs[name], numbers[name]) / baseline[name]["ops"] / speed - 1)
+		if change < -threshold:
+			regressions += 1
+			print("[-] {0:<45} {1:>+8.1f}% REGRESSION".format(name, change * 100))
+		else:
+			print("[*] {0:<45} {1:>+8.1f}%".format(name, change * 100))
+
+	return regressions
+
+def usage():
+	print("[*] Usage: python benchmark.py [options]:\nOptions:\n-h\t--help\t\tusage of the benchmark (this help), results are in operations per second, allocations are not measured\n\t--save\t\tsave the results to this JSON file\n\t--compare\tcompare the results to a saved JSON file, exit code 1 on regressions\n\t--threshold\tslowdown in percent that counts as a regression (default: {0:.0f})\n\t--only\t\tcomma separated groups to run: payload,hostname,query,answer,parse,encoding".format(THRESHOLD * 100))
+
+if __name__ == "__main__":
+	groups = [("payload", bench_payload), ("hostname", bench_hostname), ("query", bench_query), ("answer", bench_answer), ("parse", bench_parse), ("encoding", bench_encoding)]
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], "h", ["help", "save=", "compare=", "threshold=", "only="])
+	except getopt.GetoptError as e:
+		usage()
+		sys.exit(-1)
+
+	save_file = None
+	compare_file = None
+	threshold = THRESHOLD
+	only = [name for (name, function) in groups]
+	for opt, arg in opts:
+		if opt in ("-h", "--help"):
+			usage()
+			sys.exit(0)
+		elif opt in ("--save"):
+			save_file = arg
+		elif opt in ("--compare"):
+			compare_file = arg
+		elif opt in ("--threshold"):
+			try:
+				threshold = float(arg) / 100
+			except ValueError:
+				usage()
+				sys.exit(-1)
+		elif opt in ("--only"):
+			only = arg.split(",")
+
+	for (name, function) in groups:
+		if name in only:
+			function()
+	run()
+
+	if save_file:
+		save(save_file)
+	if compare_file and compare(compare_file, threshold):
+		sys.exit(1)
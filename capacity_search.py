@@ -0,0 +1,284 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+
+if "capacity_search.py" in sys.argv[0]:
+	print("[-] Instead of poking around just try: python main.py --help")
+	sys.exit(-1)
+
+import struct
+import collections
+
+import query_engine
+
+# record types that the server builds from num and length, with the payload
+# length used while the number of answers is searched. A and AAAA carry a
+# fixed size address, only their number of answers is searched.
+SEARCH_TYPES = [
+	("A", 4, True),
+	("AAAA", 16, True),
+	("CNAME", 10, False),
+	("MX", 10, False),
+	("SRV", 10, False),
+	("TXT", 10, False),
+	("NULL", 10, False),
+	("PRIVATE", 10, False),
+	("DNSKEY", 10, False),
+	("RRSIG", 128, False)
+]
+
+# num and length are sent as three digits in the query name
+MAX_VALUE = 999
+# largest UDP payload over IPv4
+MAX_MESSAGE_SIZE = 65507
+# TCP messages have a 16 bit length prefix
+MAX_TCP_MESSAGE_SIZE = 65535
+# length of the random part of the query names
+DOMAIN_LENGTH = 15
+
+# advertised UDP payload sizes of the EDNS size discovery: the classic
+# limit, the DNS flag day 2020 default, the largest payload of an unfragmented
+# Ethernet frame (1500-20-8), common defaults and one that always needs IP
+# fragments
+EDNS_SIZES = [512, 1232, 1472, 2048, 4096, 8192]
+# payload lengths the discovery builds its answers from, the size of an
+# answer only grows in steps of one answer above that
+SIZE_LENGTHS = 255
+
+# result of one search, value is the largest that worked (0 if none did)
+Search_Result = collections.namedtuple("Search_Result", "record_type dimension edns tcp value limit queries")
+
+# result of one EDNS size search: the largest answer that arrived (bytes on
+# the wire) with edns_size advertised, and why the next bigger one did not:
+# "truncated", "lost" or the error message, None if nothing failed
+Size_Result = collections.namedtuple("Size_Result", "edns_size value received failure queries")
+
+# Binary search for the largest num or length of one record type that goes
+# through the resolver. good is the largest value that worked, bad is the
+# smallest that failed, the search ends when they are next to each other.
+class Search():
+	def __init__(self, record_type, dimension, edns, tcp, base_length, limit):
+		self.record_type = record_type
+		self.dimension = dimension
+		self.edns = edns
+		self.tcp = tcp
+		# advertised EDNS size, None keeps the current one
+		self.edns_size = None
+		self.base_length = base_length
+		self.limit = limit
+
+		self.good = 0
+		self.bad = limit + 1
+		self.queries = 0
+		self.retried = False
+
+	def done(self):
+		return self.bad - self.good <= 1
+
+	def next_value(self):
+		return (self.good + self.bad) / 2
+
+	def probe(self, value):
+		if self.dimension == "num":
+			return query_engine.Probe(self.record_type, self.record_type, value, self.base_length, DOMAIN_LENGTH, 0, tcp=self.tcp)
+
+		return query_engine.Probe(self.record_type, self.record_type, 1, value, DOMAIN_LENGTH, 0, tcp=self.tcp)
+
+	def update(self, value, probe):
+		self.queries += 1
+		if probe.result:
+			self.good = value
+		elif (probe.rtt is None) and not self.retried:
+			# no answer at all might be packet loss, the same value is asked
+			# once more before it is counted as too big
+			self.retried = True
+			return
+		else:
+			self.bad = value
+		self.retried = False
+
+	def result(self):
+		return Search_Result(self.record_type, self.dimension, self.edns, self.tcp, self.good, self.limit, self.queries)
+
+# Binary search for the largest answer (in bytes) that arrives while
+# edns_size is advertised. answers(size) gives the num and length of CNAME
+# answers that make up a packet of at most that size, minimum is the
+# smallest one, the basic CNAME check has already got that through.
+class Size_Search(Search):
+	def __init__(self, edns_size, answers, minimum):
+		Search.__init__(self, "CNAME", "size", 1, False, 0, edns_size)
+		self.edns_size = edns_size
+		self.answers = answers
+		self.good = minimum
+		self.received = 0
+		self.failure = None
+
+	def probe(self, value):
+		(num, length) = self.answers(value)
+
+		return query_engine.Probe(self.record_type, self.record_type, num, length, DOMAIN_LENGTH, 0)
+
+	def update(self, value, probe):
+		bad = self.bad
+		Search.update(self, value, probe)
+		if probe.result:
+			self.received = max(self.received, probe.size)
+		elif self.bad != bad:
+			if probe.truncated:
+				self.failure = "truncated"
+			elif probe.rtt is None:
+				self.failure = "lost"
+			else:
+				self.failure = probe.message
+
+	def result(self):
+		return Size_Result(self.edns_size, self.good, self.received, self.failure, self.queries)
+
+# Runs the searches of all record types in lockstep: every round sends the
+# next probe of each unfinished search as one batch, so a round takes one
+# round trip (or one timeout) regardless of the number of searches.
+# edns_limit is the largest answer that got through with EDNS, the EDNS
+# searches do not try bigger ones.
+class Capacity_Search():
+	def __init__(self, engine, DNS_proto, domain, edns_limit=None):
+		self.engine = engine
+		self.DNS_proto = DNS_proto
+		self.domain = domain
+		self.edns_limit = edns_limit
+
+	def answer_size(self, record_type, num, length):
+		RRtype = self.DNS_proto.RR_types.get_by_name(record_type)
+		encoded_text = [RRtype.packer("x" * length)] * num
+		# header + "NNNLLLtype." + random labels + domain + question fields
+		question = "\x00" * (len(record_type) + DOMAIN_LENGTH + len(self.domain) + 13)
+		try:
+			return len(self.DNS_proto.build_answer(0, [record_type, "", encoded_text, num, self.domain], question))
+		except (struct.error, ValueError):
+			return None
+
+	# largest value that the server can build and send at all, so the
+	# network search does not waste queries on impossible answers
+	def local_limit(self, record_type, dimension, base_length, max_size=MAX_MESSAGE_SIZE):
+		def fits(value):
+			if dimension == "num":
+				size = self.answer_size(record_type, value, base_length)
+			else:
+				size = self.answer_size(record_type, 1, value)
+
+			return (size is not None) and (size <= max_size)
+
+		(good, bad) = (0, MAX_VALUE + 1)
+		while bad - good > 1:
+			value = (good + bad) / 2
+			if fits(value):
+				good = value
+			else:
+				bad = value
+
+		return good
+
+	# with tcp every record type is searched over TCP as well, without EDNS
+	# that does not limit the size there
+	def create_searches(self, record_types, edns_modes, tcp=False):
+		searches = []
+		for (record_type, base_length, fixed_length) in SEARCH_TYPES:
+			if record_type not in record_types:
+				continue
+			dimensions = ["num"]
+			if not fixed_length:
+				dimensions.append("length")
+			for dimension in dimensions:
+				limit = self.local_limit(record_type, dimension, base_length)
+				for edns in edns_modes:
+					if edns and self.edns_limit:
+						searches.append(Search(record_type, dimension, edns, False, base_length, self.local_limit(record_type, dimension, base_length, min(MAX_MESSAGE_SIZE, self.edns_limit))))
+					else:
+						searches.append(Search(record_type, dimension, edns, False, base_length, limit))
+				if tcp:
+					searches.append(Search(record_type, dimension, 0, True, base_length, self.local_limit(record_type, dimension, base_length, MAX_TCP_MESSAGE_SIZE)))
+
+		return searches
+
+	# generator that submits one round of probes at a time and yields them,
+	# it has to be resumed when they are done. The results are appended to
+	# the results list at the end.
+	def rounds(self, record_types, edns_modes, results, tcp=False):
+		return self.search_rounds(self.create_searches(record_types, edns_modes, tcp), results)
+
+	# (num, length) of the CNAME answers that make up the biggest packet of
+	# at most size bytes, the size grows linearly with the number of answers
+	def size_answers(self, steps, size):
+		best = None
+		for (length, first, step) in steps:
+			if first > size:
+				continue
+			num = min(MAX_VALUE, (size - first) / step + 1)
+			total = first + (num - 1) * step
+			if (best is None) or (total > best[0]):
+				best = (total, num, length)
+
+		return (best[1], best[2])
+
+	# EDNS size discovery: for every advertised size the biggest answer that
+	# arrives, the results are Size_Results
+	def size_rounds(self, results, edns_sizes=EDNS_SIZES):
+		steps = []
+		for length in xrange(1, SIZE_LENGTHS + 1):
+			first = self.answer_size("CNAME", 1, length)
+			steps.append((length, first, self.answer_size("CNAME", 2, length) - first))
+		answers = lambda size: self.size_answers(steps, size)
+		minimum = min([first for (length, first, step) in steps])
+
+		return self.search_rounds([Size_Search(edns_size, answers, minimum) for edns_size in edns_sizes], results)
+
+	def search_rounds(self, searches, results):
+		edns = self.DNS_proto.edns
+		edns_size = self.DNS_proto.edns_size
+
+		active = [search for search in searches if not search.done()]
+		while active:
+			batch = []
+			for search in active:
+				value = search.next_value()
+				probe = search.probe(value)
+				# the query is built on submit, with the EDNS setting of the search
+				self.DNS_proto.set_edns(search.edns)
+				self.DNS_proto.set_edns_size(search.edns_size or edns_size)
+				self.engine.submit(probe)
+				batch.append((search, value, probe))
+			self.DNS_proto.set_edns(edns)
+			self.DNS_proto.set_edns_size(edns_size)
+
+			yield [probe for (search, value, probe) in batch]
+			for (search, value, probe) in batch:
+				search.update(value, probe)
+			active = [search for search in searches if not search.done()]
+
+		results.extend([search.result() for search in searches])
+
+	def run(self, record_types, edns_modes=(0, 1), tcp=False):
+		results = []
+		for probes in self.rounds(record_types, edns_modes, results, tcp):
+			self.engine.wait(probes)
+
+		return results
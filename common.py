@@ -0,0 +1,210 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+import re
+import time
+import select
+import errno
+
+def internal_dot_print(feedback):
+	colour = 1
+	if feedback == True:
+		if colour:
+			text = "\033[92m"
+		text += "."
+	if feedback == False:
+		if colour:
+			text = "\033[91m"
+		text += "!"
+	sys.stdout.write(text)
+		
+
+def internal_print(message, newline = 1, feedback = 0, verbosity = 0, severity = 0):
+	debug = ""
+	colour = 1
+	prefix = ""
+	if severity == 2:
+		debug = "DEBUG: "
+	if verbosity >= severity:
+		if feedback == -1:
+			if colour:
+				prefix = "\033[91m"
+			prefix += "[-]"
+		if feedback == 0:
+			if colour:
+				prefix = "\033[39m"
+			prefix += "[*]"
+		if feedback == 1:
+			if colour:
+				prefix = "\033[92m"
+			prefix += "[+]"
+		if colour:
+			sys.stdout.write("{0} {1}{2}\033[39m".format(prefix, debug, message))
+		else:
+			sys.stdout.write("{0} {1}{2}".format(prefix, debug, message))
+		if newline:
+			sys.stdout.write("\n")
+
+def is_hostname(s):
+	return bool(re.match("^(([a-zA-Z0-9]|[a-zA-Z0-9][a-zA-Z0-9\-]*[a-zA-Z0-9])\.)*([A-Za-z0-9]|[A-Za-z0-9][A-Za-z0-9\-]*[A-Za-z0-9])$", s))
+
+def is_ipv4(s):
+	return bool(re.match("^(([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])\.){3}([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])$", s))
+
+def _get_monotonic_clock():
+	# Python 3.3+
+	if hasattr(time, "monotonic"):
+		return time.monotonic
+
+	# Python 2 on Linux: CLOCK_MONOTONIC through libc
+	try:
+		import ctypes
+		import ctypes.util
+
+		class timespec(ctypes.Structure):
+			_fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+		libc = ctypes.CDLL(ctypes.util.find_library("rt") or ctypes.util.find_library("c"), use_errno=True)
+		clock_gettime = libc.clock_gettime
+		clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+		ts = timespec()
+		ts_ref = ctypes.byref(ts)
+		CLOCK_MONOTONIC = 1
+
+		def monotonic():
+			clock_gettime(CLOCK_MONOTONIC, ts_ref)
+			return ts.tv_sec + ts.tv_nsec * 1e-9
+
+		monotonic()
+		return monotonic
+	except (OSError, AttributeError, TypeError):
+		# wall clock as a last resort
+		return time.time
+
+monotonic = _get_monotonic_clock()
+
+# Token bucket rate limiter: rate tokens per second, at most burst tokens
+class Token_Bucket():
+	def __init__(self, rate, burst):
+		self.rate = float(rate)
+		self.burst = float(burst)
+		self.tokens = float(burst)
+		self.last = monotonic()
+
+	def refill(self, now):
+		self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+		self.last = now
+
+	def consume(self, now, tokens=1):
+		self.refill(now)
+		if self.tokens >= tokens:
+			self.tokens -= tokens
+			return True
+
+		return False
+
+	# seconds until the tokens become available
+	def wait_time(self, tokens=1):
+		if self.tokens >= tokens:
+			return 0.0
+
+		return (tokens - self.tokens) / self.rate
+
+# Waits for readable/writable descriptors with epoll where it exists and
+# select() elsewhere. Every registered descriptor is watched for reading,
+# writing only on request.
+class Poller():
+	def __init__(self):
+		self.epoll = None
+		if hasattr(select, "epoll"):
+			self.epoll = select.epoll()
+		self.read = set()
+		self.write = set()
+
+	def register(self, fd, write=False):
+		self.read.add(fd)
+		if write:
+			self.write.add(fd)
+		if self.epoll:
+			self.epoll.register(fd, self.events(write))
+
+	# read=False stops watching for reading, e.g. after the end of a stream
+	def modify(self, fd, write, read=True):
+		if ((fd in self.write) == write) and ((fd in self.read) == read):
+			return
+		if write:
+			self.write.add(fd)
+		else:
+			self.write.discard(fd)
+		if read:
+			self.read.add(fd)
+		else:
+			self.read.discard(fd)
+		if self.epoll:
+			self.epoll.modify(fd, self.events(write, read))
+
+	def unregister(self, fd):
+		self.read.discard(fd)
+		self.write.discard(fd)
+		if self.epoll:
+			try:
+				self.epoll.unregister(fd)
+			except (IOError, OSError, ValueError):
+				# closed descriptors are removed by the kernel
+				pass
+
+	def events(self, write, read=True):
+		events = 0
+		if read:
+			events |= select.EPOLLIN
+		if write:
+			events |= select.EPOLLOUT
+
+		return events
+
+	# returns (fd, readable, writable) tuples, timeout is in seconds, None
+	# waits forever
+	def poll(self, timeout=None):
+		if self.epoll:
+			if timeout is None:
+				timeout = -1
+			try:
+				events = self.epoll.poll(timeout)
+			except IOError as e:
+				if e.errno != errno.EINTR:
+					raise
+				return []
+			# errors and hang ups show up as readable, the read finds out
+			return [(fd, bool(event & (select.EPOLLIN | select.EPOLLERR | select.EPOLLHUP)), bool(event & select.EPOLLOUT)) for (fd, event) in events]
+
+		try:
+			(readable, writable, exceptional) = select.select(list(self.read), list(self.write), [], timeout)
+		except select.error as e:
+			if e.args[0] != errno.EINTR:
+				raise
+			return []
+		readable = set(readable)
+		writable = set(writable)
+
+		return [(fd, fd in readable, fd in writable) for fd in readable | writable]
+
@@ -0,0 +1,326 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+
+if "datagram_io.py" in sys.argv[0]:
+	print("[-] Instead of poking around just try: python main.py --help")
+	sys.exit(-1)
+
+import os
+import socket
+import select
+import struct
+import errno
+
+# largest query that is read, the same as the old recvfrom(4096)
+RECV_SIZE = 4096
+# datagrams read or sent with one system call
+BATCH = 64
+# queued answers are sent when they add up to this many bytes, a burst of
+# big answers would overflow the receive buffer of the other side
+FLUSH_SIZE = 65536
+
+MSG_DONTWAIT = 0x40
+SOCKADDR_IN_SIZE = 16
+sockaddr_in_struct = struct.Struct("=H2s4s8x")
+length_struct = struct.Struct("=I")
+
+# recvmmsg() and sendmmsg() of the Linux libc, None where they are missing
+def _get_mmsg():
+	try:
+		import ctypes
+		import ctypes.util
+
+		class iovec(ctypes.Structure):
+			_fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+		class msghdr(ctypes.Structure):
+			_fields_ = [("msg_name", ctypes.c_void_p), ("msg_namelen", ctypes.c_uint32), ("msg_iov", ctypes.POINTER(iovec)),
+				("msg_iovlen", ctypes.c_size_t), ("msg_control", ctypes.c_void_p), ("msg_controllen", ctypes.c_size_t), ("msg_flags", ctypes.c_int)]
+
+		class mmsghdr(ctypes.Structure):
+			_fields_ = [("msg_hdr", msghdr), ("msg_len", ctypes.c_uint)]
+
+		libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+		recvmmsg = libc.recvmmsg
+		recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(mmsghdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+		recvmmsg.restype = ctypes.c_int
+		sendmmsg = libc.sendmmsg
+		sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(mmsghdr), ctypes.c_uint, ctypes.c_int]
+		sendmmsg.restype = ctypes.c_int
+
+		return (ctypes, iovec, mmsghdr, recvmmsg, sendmmsg)
+	except (OSError, AttributeError, TypeError):
+		return None
+
+mmsg = _get_mmsg()
+
+# I/O modes from the fastest, the default is the first one that works here
+def get_modes():
+	modes = []
+	if mmsg and hasattr(select, "epoll"):
+		modes.append("mmsg")
+	if hasattr(select, "epoll"):
+		modes.append("epoll")
+	modes.append("plain")
+
+	return modes
+
+# Reads every datagram that is queued on the socket when it wakes up and
+# sends the answers of a batch together. Modes:
+#   mmsg:  epoll and recvmmsg()/sendmmsg(), one system call per batch
+#   epoll: epoll and non-blocking recvfrom()/sendto() until the queue is empty
+#   plain: one blocking recvfrom()/sendto() per datagram
+class Datagram_IO():
+	def __init__(self, sock, mode=None, batch=BATCH):
+		self.sock = sock
+		self.mode = mode or get_modes()[0]
+		self.batch = batch
+
+		self.outgoing = []
+		self.outgoing_size = 0
+		self.batches = 0
+		# sockaddr -> (ip, port) and back, resolvers are few
+		self.addresses = {}
+		self.sockaddrs = {}
+
+		if self.mode == "plain":
+			self.sock.setblocking(1)
+			return
+
+		self.sock.setblocking(0)
+		self.epoll = select.epoll()
+		self.epoll.register(self.sock.fileno(), select.EPOLLIN)
+		if self.mode == "mmsg":
+			self.setup_mmsg()
+
+	# The buffers are contiguous blocks, so a whole batch is read or written
+	# with a few ctypes calls instead of several per datagram.
+	def setup_mmsg(self):
+		(ctypes, iovec, mmsghdr, recvmmsg, sendmmsg) = mmsg
+		self.fd = self.sock.fileno()
+		self.entry_size = ctypes.sizeof(mmsghdr)
+		self.msg_len_offset = mmsghdr.msg_len.offset
+
+		# received datagrams and their source addresses, the socket is IPv4,
+		# so the kernel always writes a sockaddr_in
+		self.recv_data = ctypes.create_string_buffer(RECV_SIZE * self.batch)
+		self.recv_names = ctypes.create_string_buffer(SOCKADDR_IN_SIZE * self.batch)
+		self.recv_iovecs = (iovec * self.batch)()
+		self.recv_vector = (mmsghdr * self.batch)()
+		for i in xrange(self.batch):
+			self.recv_iovecs[i].iov_base = ctypes.addressof(self.recv_data) + RECV_SIZE * i
+			self.recv_iovecs[i].iov_len = RECV_SIZE
+			header = self.recv_vector[i].msg_hdr
+			header.msg_name = ctypes.addressof(self.recv_names) + SOCKADDR_IN_SIZE * i
+			header.msg_namelen = SOCKADDR_IN_SIZE
+			header.msg_iov = ctypes.pointer(self.recv_iovecs[i])
+			header.msg_iovlen = 1
+
+		# only the iovecs and the addresses change from batch to batch
+		self.send_names = ctypes.create_string_buffer(SOCKADDR_IN_SIZE * self.batch)
+		self.send_iovecs = (iovec * self.batch)()
+		self.send_vector = (mmsghdr * self.batch)()
+		for i in xrange(self.batch):
+			header = self.send_vector[i].msg_hdr
+			header.msg_name = ctypes.addressof(self.send_names) + SOCKADDR_IN_SIZE * i
+			header.msg_namelen = SOCKADDR_IN_SIZE
+			header.msg_iov = ctypes.pointer(self.send_iovecs[i])
+			header.msg_iovlen = 1
+
+	# waits for datagrams and returns all of them as (data, address) pairs,
+	# at most batch of them, or an empty list on timeout
+	def receive(self, timeout=-1):
+		if self.mode == "plain":
+			if timeout >= 0:
+				try:
+					if not select.select([self.sock], [], [], timeout)[0]:
+						return []
+				except select.error as e:
+					if e.args[0] != errno.EINTR:
+						raise
+					return []
+			return [self.sock.recvfrom(RECV_SIZE)]
+
+		try:
+			if not self.epoll.poll(timeout):
+				return []
+		except IOError as e:
+			if e.errno != errno.EINTR:
+				raise
+			return []
+
+		return self.drain()
+
+	# reads the datagrams that are already queued without waiting, for
+	# callers that wait for the socket themselves. In plain mode that is one
+	# blocking read, so only call it when the socket is readable.
+	def drain(self):
+		if self.mode == "plain":
+			return [self.sock.recvfrom(RECV_SIZE)]
+		self.batches += 1
+
+		if self.mode == "mmsg":
+			return self.receive_mmsg()
+
+		packets = []
+		while len(packets) < self.batch:
+			try:
+				packets.append(self.sock.recvfrom(RECV_SIZE))
+			except socket.error as e:
+				if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+					break
+				raise
+
+		return packets
+
+	def receive_mmsg(self):
+		(ctypes, iovec, mmsghdr, recvmmsg, sendmmsg) = mmsg
+		count = recvmmsg(self.fd, self.recv_vector, self.batch, MSG_DONTWAIT, None)
+		if count < 0:
+			error = ctypes.get_errno()
+			if error in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+				return []
+			raise socket.error(error, os.strerror(error))
+		if not count:
+			return []
+
+		# one copy of each block is cheaper than a ctypes call per datagram
+		vector = ctypes.string_at(self.recv_vector, self.entry_size * count)
+		names = ctypes.string_at(self.recv_names, SOCKADDR_IN_SIZE * count)
+		lengths = [length_struct.unpack_from(vector, self.entry_size * i + self.msg_len_offset)[0] for i in xrange(count)]
+		data = ctypes.string_at(self.recv_data, RECV_SIZE * (count - 1) + lengths[-1])
+		packets = []
+		addresses = self.addresses
+		for i in xrange(count):
+			name = names[SOCKADDR_IN_SIZE*i:SOCKADDR_IN_SIZE*(i+1)]
+			address = addresses.get(name)
+			if address is None:
+				if len(addresses) > 4096:
+					addresses.clear()
+				(family, port, ip) = sockaddr_in_struct.unpack(name)
+				address = addresses[name] = (socket.inet_ntoa(ip), struct.unpack(">H", port)[0])
+			packets.append((data[RECV_SIZE*i:RECV_SIZE*i+lengths[i]], address))
+
+		return packets
+
+	# queues an answer, returns True when the queue should be flushed
+	def queue(self, packet, address):
+		self.outgoing.append((packet, address))
+		self.outgoing_size += len(packet)
+
+		return self.outgoing_size >= FLUSH_SIZE
+
+	# sends the queued answers, returns the number of sent and failed ones
+	def flush(self):
+		outgoing = self.outgoing
+		self.outgoing = []
+		self.outgoing_size = 0
+		if self.mode == "mmsg":
+			return self.flush_mmsg(outgoing)
+
+		sent = 0
+		failed = 0
+		for (packet, address) in outgoing:
+			while True:
+				try:
+					self.sock.sendto(packet, address)
+					sent += 1
+				except socket.error as e:
+					if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+						# send buffer is full, wait until it drains
+						self.wait_writable()
+						continue
+					# e.g. bigger than the largest UDP datagram
+					failed += 1
+				break
+
+		return (sent, failed)
+
+	def flush_mmsg(self, outgoing):
+		(ctypes, iovec, mmsghdr, recvmmsg, sendmmsg) = mmsg
+		sent = 0
+		failed = 0
+		start = 0
+		while start < len(outgoing):
+			count = min(self.batch, len(outgoing) - start)
+			batch = outgoing[start:start+count]
+
+			# the packets of the batch in one string, the iovecs point into it
+			# (pointer, size_t), size_t is an unsigned long on Linux
+			data = "".join([packet for (packet, address) in batch])
+			base = ctypes.cast(ctypes.c_char_p(data), ctypes.c_void_p).value
+			iovecs = []
+			offset = 0
+			for (packet, address) in batch:
+				iovecs.append(base + offset)
+				iovecs.append(len(packet))
+				offset += len(packet)
+			iovecs = struct.pack("PL" * count, *iovecs)
+			ctypes.memmove(self.send_iovecs, iovecs, len(iovecs))
+			names = "".join([self.get_sockaddr(address) for (packet, address) in batch])
+			ctypes.memmove(self.send_names, names, len(names))
+
+			result = sendmmsg(self.fd, self.send_vector, count, 0)
+			if result < 0:
+				error = ctypes.get_errno()
+				if error in (errno.EAGAIN, errno.EWOULDBLOCK):
+					self.wait_writable()
+					continue
+				if error == errno.EINTR:
+					continue
+				# the first one could not be sent, e.g. too big
+				failed += 1
+				start += 1
+				continue
+			sent += result
+			start += result
+
+		return (sent, failed)
+
+	def get_sockaddr(self, address):
+		sockaddr = self.sockaddrs.get(address)
+		if sockaddr is None:
+			if len(self.sockaddrs) > 4096:
+				self.sockaddrs.clear()
+			sockaddr = self.sockaddrs[address] = sockaddr_in_struct.pack(socket.AF_INET, struct.pack(">H", address[1]), socket.inet_aton(address[0]))
+
+		return sockaddr
+
+	def wait_writable(self):
+		try:
+			select.select([], [self.sock], [], 1.0)
+		except select.error as e:
+			if e.args[0] != errno.EINTR:
+				raise
+
+# sets the socket buffer sizes (0 keeps the default) and returns the sizes
+# the kernel actually uses, Linux doubles the value and caps it at
+# net.core.rmem_max/wmem_max
+def set_buffer_sizes(sock, rcvbuf, sndbuf):
+	if rcvbuf:
+		sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+	if sndbuf:
+		sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
+
+	return (sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF), sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF))
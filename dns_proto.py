@@ -30,10 +30,590 @@ import struct
 import socket
 import math
 import time
+import collections
+
+import common
+
+# precompiled structures, the parser unpacks them at an offset of the
+# original message instead of slicing it
+header_struct = struct.Struct(">HHHHHH")
+question_struct = struct.Struct(">HH")
+answer_struct = struct.Struct(">HHIH")
+
+# precompiled structures for the packet builder, the record specific ones
+# include the resource record header
+rr_header_struct = struct.Struct(">HHHIH")
+mx_struct = struct.Struct(">HHHIHH")
+srv_struct = struct.Struct(">HHHIHHHH")
+txt_struct = struct.Struct(">HHHIHB")
+dnskey_struct = struct.Struct(">HHHIHHBB")
+rrsig_struct = struct.Struct(">HHHIHHBBIIIH")
+soa_struct = struct.Struct(">IIIII")
+opt_struct = struct.Struct(">BHHBBHH")
+pointer_struct = struct.Struct(">H")
+header_placeholder = "\x00" * header_struct.size
+
+# a name has at most 127 labels, more jumps than that can only be a loop
+MAX_POINTERS = 127
+
+# UDP payload size advertised in the OPT record unless the client found a
+# better one
+DEFAULT_EDNS_SIZE = 4096
+
+# compact records returned by DNS_Proto.parse_message(), the parser creates
+# them with tuple.__new__ to skip the Python level constructor
+class Question(collections.namedtuple("Question", "name type qclass")):
+	__slots__ = ()
+
+# owner is the offset of the owner name in the message, the name and the
+# rdata are only decoded when they are asked for
+class ResourceRecord(collections.namedtuple("ResourceRecord", "owner type rclass ttl datalen msg offset")):
+	__slots__ = ()
+
+	@property
+	def name(self):
+		return hostnamebin_to_hostname(self.msg, self.owner)[1]
+
+	# raw rdata, only copied out of the message when it is needed
+	@property
+	def data(self):
+		return self.msg[self.offset:self.offset+self.datalen]
+
+	# rdata decoded with the unpacker of the record type, it gets the whole
+	# message, so compressed names in the rdata can be followed
+	@property
+	def rdata(self):
+		RRtype = RR_types.get(self.type)
+		if RRtype and RRtype.unpacker:
+			return RRtype.unpacker(self.msg, self.offset, self.datalen)
+		return self.data
+
+class Message(collections.namedtuple("Message", "transaction_id flags questions answers nauthority nadditional question_length length raw")):
+	__slots__ = ()
+
+	@property
+	def is_query(self):
+		return not ((self.flags >> 15) & 0x01)
+
+	@property
+	def rcode(self):
+		return self.flags & 0xF
+
+	@property
+	def orig_question(self):
+		return self.raw[12:12+self.question_length]
+
+# Collects the parts of a packet in a list that is reused for every packet
+# and joins them once at the end. The builder functions append directly to
+# parts, the header is set last when the record counts are known.
+# names is the suffix table for name compression (lower case name -> offset),
+# it is filled from the question when the first name is compressed.
+class Packet_Builder():
+	def __init__(self):
+		self.parts = []
+		self.names = None
+
+	def reset(self):
+		del self.parts[:]
+		self.names = None
+
+	def getvalue(self):
+		return "".join(self.parts)
+
+	# offset of the next byte in the packet
+	def tell(self):
+		return sum([len(part) for part in self.parts])
+
+	def index_question(self):
+		# parts[0] is the header, parts[1] the question of the query
+		self.names = {}
+		if len(self.parts) < 2:
+			return self.names
+		question = self.parts[1]
+		labels = []
+		offsets = []
+		i = 0
+		while (i < len(question)) and (0 < ord(question[i]) < 64):
+			l = ord(question[i])
+			labels.append(question[i+1:i+1+l].lower())
+			offsets.append(12 + i)
+			i += l + 1
+		for j in xrange(len(labels)):
+			if offsets[j] < 0x4000:
+				self.names[".".join(labels[j:]) + "."] = offsets[j]
+
+		return self.names
+
+def compress_hostname(builder, hostname, offset):
+	# RFC 1035 4.1.4: the longest suffix that is already in the packet is
+	# replaced by a pointer, the new suffixes are added to the table. offset
+	# is where the name will be written in the packet.
+	labels = hostname.split(".")
+	if not labels[-1]:
+		labels.pop()
+	names = builder.names
+	if names is None:
+		names = builder.index_question()
+
+	parts = []
+	for i in xrange(len(labels)):
+		suffix = ".".join(labels[i:]).lower() + "."
+		pointer = names.get(suffix)
+		if pointer is not None:
+			parts.append(pointer_struct.pack(0xC000 | pointer))
+			return "".join(parts)
+		if offset < 0x4000:
+			names[suffix] = offset
+		label = chr(len(labels[i])) + labels[i]
+		parts.append(label)
+		offset += len(label)
+	parts.append("\x00")
+
+	return "".join(parts)
+
+def hostname_to_hostnamebin(hostname):
+	# the closing dot is optional, the root label is always added
+	labels = hostname.split(".")
+	if not labels[-1]:
+		labels.pop()
+
+	return "".join([chr(len(label)) + label for label in labels]) + "\x00"
+
+# length of the name at offset without decoding it, 0 if it is malformed
+def skip_hostname(msg, offset=0):
+	i = offset
+	end = len(msg)
+	while i < end:
+		l = ord(msg[i])
+		if l == 0:
+			return i + 1 - offset
+		if l > 63:
+			if (l < 0xC0) or (i + 2 > end):
+				return 0
+			return i + 2 - offset
+		i += l + 1
+
+	return 0
+
+def hostnamebin_to_hostname(hostnamebin, offset=0):
+	# only the labels are copied, the message is walked by offset. Returns
+	# the length of the name at offset (a pointer ends it) and the name with
+	# the pointers followed, or (0, "") if the name is malformed.
+	labels = []
+	i = offset
+	end = len(hostnamebin)
+	length = None
+	pointers = 0
+
+	while True:
+		if i >= end:
+			return (0, "")
+		l = ord(hostnamebin[i])
+		if l == 0:
+			i += 1
+			break
+		if l > 63:
+			if (l < 0xC0) or (i + 2 > end):
+				# 0x40 and 0x80 are reserved label types
+				return (0, "")
+			target = pointer_struct.unpack_from(hostnamebin, i)[0] & 0x3FFF
+			# pointers only point backwards, which together with the limit
+			# on the number of jumps rules out loops
+			pointers += 1
+			if (target >= i) or (pointers > MAX_POINTERS):
+				return (0, "")
+			if length is None:
+				length = i + 2 - offset
+			i = target
+			continue
+		if i + 1 + l > end:
+			return (0, "")
+		labels.append(hostnamebin[i+1:i+1+l])
+		i += l + 1
+
+	if length is None:
+		length = i - offset
+	if labels:
+		return (length, ".".join(labels) + ".")
+
+	return (length, "")
+
+def calc_max_throughput_id(max_length, hostname, overhead, encoding_class):
+	return encoding_class.get_maximum_length(max_length - overhead)
+
+def pack_record_id(data):
+	return data
+
+# unpackers get the message, the offset and the length of the rdata, or
+# only the rdata itself
+def unpack_record_id(data, offset=0, length=None):
+	if length is None:
+		return data[offset:]
+
+	return data[offset:offset+length]
+
+def pack_record_hostname(data):
+	hostname = ""
+	for j in range(0,int(math.ceil(float(len(data))/63.0))):
+		hostname += data[j*63:(j+1)*63]+"."
+
+	return hostname
+
+def unpack_record_hostname(data, offset=0, length=None):
+	return hostnamebin_to_hostname(data, offset)[1].replace(".", "")
+
+# the target follows the preference
+def unpack_record_MX(data, offset=0, length=None):
+	return unpack_record_hostname(data, offset + 2)
+
+# the target follows the priority, weight and port
+def unpack_record_SRV(data, offset=0, length=None):
+	return unpack_record_hostname(data, offset + 6)
+
+# the character-strings of the rdata joined, without their length bytes
+def unpack_record_TXT(data, offset=0, length=None):
+	if length is None:
+		end = len(data)
+	else:
+		end = offset + length
+	strings = []
+	i = offset
+	while i < end:
+		l = ord(data[i])
+		strings.append(data[i+1:min(i+1+l, end)])
+		i += l + 1
+
+	return "".join(strings)
+
+# the key follows the flags, protocol and algorithm
+def unpack_record_DNSKEY(data, offset=0, length=None):
+	if length is None:
+		return data[offset+4:]
+
+	return data[offset+4:offset+length]
+
+# the signature follows the fixed fields and the signer's name
+def unpack_record_RRSIG(data, offset=0, length=None):
+	(hlen, signer) = hostnamebin_to_hostname(data, offset + 18)
+	if length is None:
+		return data[offset+18+hlen:]
+
+	return data[offset+18+hlen:offset+length]
+
+def calc_max_throughput_A(max_length, hostname, overhead, encoding_class):
+	# max - len("hostname.") - 1 - overhead - plus dots
+	max_length -= len(hostname) + 1
+	cap = 0
+	while max_length > 64:
+		cap += 63
+		max_length -= 64
+	cap += max_length - 1
+
+	return encoding_class.get_maximum_length(cap) - overhead
+
+def build_record_A(builder, record):
+	append = builder.parts.append
+	rr_header = rr_header_struct.pack(0xc00c, 1, 1, 5, 4)
+	for i in xrange(record[3]):
+		append(rr_header)
+		append(record[2][i])
+
+	return (record[3], 0)
+
+def build_record_AAAA(builder, record):
+	append = builder.parts.append
+	rr_header = rr_header_struct.pack(0xc00c, 28, 1, 5, 16)
+	for i in xrange(record[3]):
+		append(rr_header)
+		append(record[2][i])
+
+	return (record[3], 0)
+
+def build_record_NS(builder, record):
+	nameserver = compress_hostname(builder, record[2], builder.tell() + rr_header_struct.size)
+	builder.parts.append(rr_header_struct.pack(0xc00c, 2, 1, 3600, len(nameserver)))
+	builder.parts.append(nameserver)
+
+	#additional_record_num = 1
+	#additional_records = compress_hostname + struct.pack(">HHIH", 1, 1, 5, 4) + socket.inet_aton("1.1.1.1")
+
+	return (1, 0)
+
+def calc_max_throughput_CNAME(max_length, hostname, overhead, encoding_class):
+	# -1 for the zero byte at the end
+	max_length -= 1
+	cap = 0
+	while max_length > 64:
+		cap += 63
+		max_length -= 64
+	cap += max_length - 1
+
+	return encoding_class.get_maximum_length(cap) - overhead
+
+# the targets are the payload itself, they have no suffix in common with
+# the other names, so they are not compressed (that would also make the size
+# of the answer depend on the payload)
+def build_record_CNAME(builder, record):
+	append = builder.parts.append
+	pack = rr_header_struct.pack
+	for i in xrange(record[3]):
+		target = hostname_to_hostnamebin(record[2][i])
+		append(pack(0xc00c, 5, 1, 5, len(target)))
+		append(target)
+
+	return (record[3], 0)
+
+def build_record_MX(builder, record):
+	append = builder.parts.append
+	pack = mx_struct.pack
+	for i in xrange(record[3]):
+		target = hostname_to_hostnamebin(record[2][i])
+		append(pack(0xc00c, 15, 1, 5, len(target)+2, 10*i+10))
+		append(target)
+
+	return (record[3], 0)
+
+# RFC 2782: the target must not be compressed
+def build_record_SRV(builder, record):
+	append = builder.parts.append
+	pack = srv_struct.pack
+	for i in xrange(record[3]):
+		target = hostname_to_hostnamebin(record[2][i])
+		append(pack(0xc00c, 33, 1, 5, len(target)+6, 10*i+10, 20*i+10, 1337))
+		append(target)
+
+	return (record[3], 0)
+
+def build_record_DNSKEY(builder, record):
+	append = builder.parts.append
+	pack = dnskey_struct.pack
+	for i in xrange(record[3]):
+		append(pack(0xc00c, 48, 1, 5, len(record[2][i])+4, 0x0100, 3, 8))
+		append(record[2][i])
+
+	return (record[3], 0)
+
+# RFC 4034 3.1.7: the signer's name must not be compressed
+def build_record_RRSIG(builder, record):
+	append = builder.parts.append
+	pack = rrsig_struct.pack
+	signer = hostname_to_hostnamebin(record[4])
+	now = int(time.time())
+	for i in xrange(record[3]):
+		append(pack(0xc00c, 46, 1, 5, len(signer)+len(record[2][i])+18, 16, 10, 2, 5, now + 3600*36,
+			now + 3600*12, 31005))
+		append(signer)
+		append(record[2][i])
+
+	return (record[3], 0)
+
+
+def build_record_ANY(builder, record):
+	target = compress_hostname(builder, record[2], builder.tell() + rr_header_struct.size)
+	builder.parts.append(rr_header_struct.pack(0xc00c, 5, 1, 5, len(target)))
+	builder.parts.append(target)
+	builder.parts.append(rr_header_struct.pack(0xc00c, 1, 1, 5, 4))
+	builder.parts.append(socket.inet_aton(record[3]))
+
+	return (2, 0)
+
+def build_record_SOA(builder, record):
+	offset = builder.tell() + rr_header_struct.size
+	mname = compress_hostname(builder, record[2], offset)
+	rname = compress_hostname(builder, record[3], offset + len(mname))
+	data = mname + rname + soa_struct.pack(record[4], record[5], record[6], record[7], record[8])
+	builder.parts.append(rr_header_struct.pack(0xc00c, 6, 1, 5, len(data)))
+	builder.parts.append(data)
+
+	return (1, 0)
+
+def build_record_NULL(builder, record):
+	append = builder.parts.append
+	pack = rr_header_struct.pack
+	for i in xrange(record[3]):
+		append(pack(0xc00c, 10, 1, 0, len(record[2][i])))
+		append(record[2][i])
+
+	return (record[3], 0)
+
+def build_record_PRIVATE(builder, record):
+	append = builder.parts.append
+	pack = rr_header_struct.pack
+	for i in xrange(record[3]):
+		append(pack(0xc00c, 65399, 1, 0, len(record[2][i])))
+		append(record[2][i])
+
+	return (record[3], 0)
+
+def build_record_TXT(builder, record):
+	append = builder.parts.append
+	pack = txt_struct.pack
+	for i in xrange(record[3]):
+		append(pack(0xc00c, 16, 1, 0, len(record[2][i])+1, len(record[2][i])))
+		append(record[2][i])
+
+	return (record[3], 0)
+
+# Immutable description of a resource record type. The field order matches
+# the old RR_types lists, so RRtype[1] is still the builder. servable types
+# have a builder that takes a list of payloads, so the server can answer
+# queries for them.
+RR_Type = collections.namedtuple("RR_Type", "name builder packer unpacker capacity code servable")
+
+# the builders of these types take the fields of a zone record
+# (see get_record()) instead of payloads
+ZONE_TYPES = ("NS", "SOA", "*")
+
+# Record types indexed by code and by name. Entries are only added through
+# register(), which allows plug-in record types without editing the table.
+class RR_Registry():
+	def __init__(self):
+		self.by_code = {}
+		self.by_name = {}
+
+	def register(self, code, name, builder=None, packer=None, unpacker=None, capacity=None, replace=False, servable=True):
+		if not replace and ((code in self.by_code) or (name in self.by_name)):
+			raise ValueError("RR type {0} ({1}) is already registered".format(name, code))
+
+		if code in self.by_code:
+			del self.by_name[self.by_code[code].name]
+		if name in self.by_name:
+			del self.by_code[self.by_name[name].code]
+
+		RRtype = RR_Type(name, builder, packer, unpacker, capacity, code, bool(builder) and servable)
+		self.by_code[code] = RRtype
+		self.by_name[name] = RRtype
+
+		return RRtype
+
+	def __getitem__(self, code):
+		return self.by_code[code]
+
+	def __contains__(self, code):
+		return code in self.by_code
+
+	def __iter__(self):
+		return iter(self.by_code)
+
+	def __len__(self):
+		return len(self.by_code)
+
+	def get(self, code, default=None):
+		return self.by_code.get(code, default)
+
+	def get_by_name(self, name, default=None):
+		return self.by_name.get(name, default)
+
+RR_types = RR_Registry()
+for (code, name, builder, packer, unpacker, capacity) in (
+	(0, "", None, None, None, None), # answer with no answers
+	(1, "A", build_record_A, pack_record_id, unpack_record_id, calc_max_throughput_A),
+	(2, "NS", build_record_NS, pack_record_id, unpack_record_id, calc_max_throughput_id),
+	(3, "MD", None, None, None, None),
+	(4, "MF", None, None, None, None),
+	(5, "CNAME", build_record_CNAME, pack_record_hostname, unpack_record_hostname, calc_max_throughput_CNAME),
+	(6, "SOA", build_record_SOA, pack_record_id, unpack_record_id, calc_max_throughput_id),
+	(7, "MB", None, None, None, None),
+	(8, "MG", None, None, None, None),
+	(9, "MR", None, None, None, None),
+	(10, "NULL", build_record_NULL, pack_record_id, unpack_record_id, calc_max_throughput_id),
+	(11, "WKS", None, None, None, None),
+	(12, "PTR", None, None, None, None),
+	(13, "HINFO", None, None, None, None),
+	(14, "MINFO", None, None, None, None),
+	(15, "MX", build_record_MX, pack_record_hostname, unpack_record_MX, None),
+	(16, "TXT", build_record_TXT, pack_record_id, unpack_record_TXT, calc_max_throughput_id),
+	(17, "RP", None, None, None, None),
+	(18, "AFSDB", None, None, None, None),
+	(19, "X25", None, None, None, None),
+	(20, "ISDN", None, None, None, None),
+	(21, "RT", None, None, None, None),
+	(22, "NSAP", None, None, None, None),
+	(23, "NSAP-PTR", None, None, None, None),
+	(24, "SIG", None, None, None, None),
+	(25, "KEY", None, None, None, None),
+	(26, "PX", None, None, None, None),
+	(27, "GPOS", None, None, None, None),
+	(28, "AAAA", build_record_AAAA, pack_record_id, unpack_record_id, None),
+	(29, "LOC", None, None, None, None),
+	(30, "NXT", None, None, None, None),
+	(31, "EID", None, None, None, None),
+	(32, "NIMLOC", None, None, None, None),
+	(33, "SRV", build_record_SRV, pack_record_hostname, unpack_record_SRV, None),
+	(34, "ATMA", None, None, None, None),
+	(35, "NAPTR", None, None, None, None),
+	(36, "KX", None, None, None, None),
+	(37, "CERT", None, None, None, None),
+	(38, "A6", None, None, None, None),
+	(39, "DNAME", None, None, None, None),
+	(40, "SINK", None, None, None, None),
+	(41, "OPT", None, None, None, None),
+	(42, "APL", None, None, None, None),
+	(43, "DS", None, None, None, None),
+	(44, "SSHFP", None, None, None, None),
+	(45, "IPSECKEY", None, None, None, None),
+	(46, "RRSIG", build_record_RRSIG, pack_record_id, unpack_record_RRSIG, None),
+	(47, "NSEC", None, None, None, None),
+	(48, "DNSKEY", build_record_DNSKEY, pack_record_id, unpack_record_DNSKEY, None),
+	(49, "DHCID", None, None, None, None),
+	(50, "NSEC3", None, None, None, None),
+	(51, "NSEC3PARAM", None, None, None, None),
+	(52, "TLSA", None, None, None, None),
+	(53, "SMIMEA", None, None, None, None),
+	#(54, "Unassigned", None, None, None, None),
+	(55, "HIP", None, None, None, None),
+	(56, "NINFO", None, None, None, None),
+	(57, "RKEY", None, None, None, None),
+	(58, "TALINK", None, None, None, None),
+	(59, "CDS", None, None, None, None),
+	(60, "CDNSKEY", None, None, None, None),
+	(61, "OPENPGPKEY", None, None, None, None),
+	(62, "CSYNC", None, None, None, None),
+	## TEST
+	#63-98 : ["Unassigned", None, None, None, None],
+	(99, "SPF", None, None, None, None),
+	(100, "UINFO", None, None, None, None),
+	(101, "UID", None, None, None, None),
+	(102, "GID", None, None, None, None),
+	(103, "UNSPEC", None, None, None, None),
+	(104, "NID", None, None, None, None),
+	(105, "L32", None, None, None, None),
+	(106, "L64", None, None, None, None),
+	(107, "LP", None, None, None, None),
+	(108, "EUI48", None, None, None, None),
+	(109, "EUI64", None, None, None, None),
+	## TEST
+	#110-248 : ["Unassigned", None, None, None, None],
+	(249, "TKEY", None, None, None, None),
+	(250, "TSIG", None, None, None, None),
+	(251, "IXFR", None, None, None, None),
+	(252, "AXFR", None, None, None, None),
+	(253, "MAILB", None, None, None, None),
+	(254, "MAILA", None, None, None, None),
+	(255, "*", build_record_ANY, pack_record_id, unpack_record_id, calc_max_throughput_id),
+	(256, "URI", None, None, None, None),
+	(257, "CAA", None, None, None, None),
+	(258, "AVC", None, None, None, None),
+	## TEST
+	#259-32767 : ["Unassigned", None, None, None, None],
+	(32768, "TA", None, None, None, None),
+	(32769, "DLV", None, None, None, None),
+	(65399, "PRIVATE", build_record_PRIVATE, pack_record_id, unpack_record_id, calc_max_throughput_id),
+	## TEST
+	#65280-65534 : ["Private use", None, None, None, None],
+	## TEST
+	#65535 : "Reserved"
+):
+	RR_types.register(code, name, builder, packer, unpacker, capacity, servable=(name not in ZONE_TYPES))
 
 class DNS_Proto():
+	# shared module level registry, it is not rebuilt for every instance
+	RR_types = RR_types
+
 	def __init__(self):
 		self.edns = 0
+		self.edns_size = DEFAULT_EDNS_SIZE
+		self.builder = Packet_Builder()
 		self.response_codes = ["", 
 			"Query error: Format error - the DNS server does not support this format (maybe the query was too long)",
 			"Query error: Server failure - the DNS server failed (maybe the response was too long, or the server is not running)",
@@ -42,313 +622,14 @@ class DNS_Proto():
 			"Query error: Refused - DNS server is not willing to answer. (can the DNS server be used as relay?)",
 			"Other error, malformed request/response, etc."]
 
-		self.RR_types = {
-			0 : ["", None, None, None, None], # answer with no answers
-			1 : ["A", self.build_record_A, self.pack_record_id, self.unpack_record_hostname, self.calc_max_throughput_A],
-			2 : ["NS", self.build_record_NS, self.pack_record_id, self.unpack_record_id, self.calc_max_throughput_id],
-		    3 : ["MD", None, None, None, None],
-		    4 : ["MF", None, None, None, None],
-		    5 : ["CNAME", self.build_record_CNAME, self.pack_record_hostname, self.unpack_record_hostname, self.calc_max_throughput_CNAME],
-		    6 : ["SOA", self.build_record_SOA, self.pack_record_id, self.unpack_record_id, self.calc_max_throughput_id],
-		    7 : ["MB", None, None, None, None],
-		    8 : ["MG", None, None, None, None],
-		    9 : ["MR", None, None, None, None],
-		    10 : ["NULL", self.build_record_NULL, self.pack_record_id, self.unpack_record_id, self.calc_max_throughput_id],
-		    11 : ["WKS", None, None, None, None],
-		    12 : ["PTR", None, None, None, None],
-		    13 : ["HINFO", None, None, None, None],
-		    14 : ["MINFO", None, None, None, None],
-		    15 : ["MX", self.build_record_MX, self.pack_record_hostname, self.unpack_record_hostname, None],
-		    16 : ["TXT", self.build_record_TXT, self.pack_record_id, self.unpack_record_id, self.calc_max_throughput_id],
-		    17 : ["RP", None, None, None, None],
-		    18 : ["AFSDB", None, None, None, None],
-		    19 : ["X25", None, None, None, None],
-		    20 : ["ISDN", None, None, None, None],
-		    21 : ["RT", None, None, None, None],
-		    22 : ["NSAP", None, None, None, None],
-		    23 : ["NSAP-PTR", None, None, None, None],
-		    24 : ["SIG", None, None, None, None],
-		    25 : ["KEY", None, None, None, None],
-		    26 : ["PX", None, None, None, None],
-		    27 : ["GPOS", None, None, None, None],
-		    28 : ["AAAA", self.build_record_AAAA, self.pack_record_id, self.unpack_record_hostname, None],
-		    29 : ["LOC", None, None, None, None],
-		    30 : ["NXT", None, None, None, None],
-		    31 : ["EID", None, None, None, None],
-		    32 : ["NIMLOC", None, None, None, None],
-		    33 : ["SRV", self.build_record_SRV, self.pack_record_hostname, self.unpack_record_hostname, None],
-		    34 : ["ATMA", None, None, None, None],
-		    35 : ["NAPTR", None, None, None, None],
-		    36 : ["KX", None, None, None, None],
-		    37 : ["CERT", None, None, None, None],
-		    38 : ["A6", None, None, None, None],
-		    39 : ["DNAME", None, None, None, None],
-		    40 : ["SINK", None, None, None, None],
-		    41 : ["OPT", None, None, None, None],
-		    42 : ["APL", None, None, None, None],
-		    43 : ["DS", None, None, None, None],
-		    44 : ["SSHFP", None, None, None, None],
-		    45 : ["IPSECKEY", None, None, None, None],
-		    46 : ["RRSIG", self.build_record_RRSIG, self.pack_record_id, None, None],
-		    47 : ["NSEC", None, None, None, None],
-		    48 : ["DNSKEY", self.build_record_DNSKEY, self.pack_record_id, None, None],
-		    49 : ["DHCID", None, None, None, None],
-		    50 : ["NSEC3", None, None, None, None],
-		    51 : ["NSEC3PARAM", None, None, None, None],
-		    52 : ["TLSA", None, None, None, None],
-		    53 : ["SMIMEA", None, None, None, None],
-		    #54 : ["Unassigned", None, None, None, None],
-		    55 : ["HIP", None, None, None, None],
-		    56 : ["NINFO", None, None, None, None],
-		    57 : ["RKEY", None, None, None, None],
-		    58 : ["TALINK", None, None, None, None],
-		    59 : ["CDS", None, None, None, None],
-		    60 : ["CDNSKEY", None, None, None, None],
-		    61 : ["OPENPGPKEY", None, None, None, None],
-		    62 : ["CSYNC", None, None, None, None],
-		    ## TEST
-		    #63-98 : ["Unassigned", None, None, None, None],
-		    99 : ["SPF", None, None, None, None],
-		    100 : ["UINFO", None, None, None, None],
-		    101 : ["UID", None, None, None, None],
-		    102 : ["GID", None, None, None, None],
-		    103 : ["UNSPEC", None, None, None, None],
-		    104 : ["NID", None, None, None, None],
-		    105 : ["L32", None, None, None, None],
-		    106 : ["L64", None, None, None, None],
-		    107 : ["LP", None, None, None, None],
-		    108 : ["EUI48", None, None, None, None],
-		    109 : ["EUI64", None, None, None, None],
-		    ## TEST
-		    #110-248 : ["Unassigned", None, None, None, None],
-		    249 : ["TKEY", None, None, None, None],
-		    250 : ["TSIG", None, None, None, None],
-		    251 : ["IXFR", None, None, None, None],
-		    252 : ["AXFR", None, None, None, None],
-		    253 : ["MAILB", None, None, None, None],
-		    254 : ["MAILA", None, None, None, None],
-		    255 : ["*", self.build_record_ANY, self.pack_record_id, self.unpack_record_id, self.calc_max_throughput_id],
-		    256 : ["URI", None, None, None, None],
-		    257 : ["CAA", None, None, None, None],
-		    258 : ["AVC", None, None, None, None],
-		    ## TEST
-		    #259-32767 : ["Unassigned", None, None, None, None],
-		    32768 : ["TA", None, None, None, None],
-		    32769 : ["DLV", None, None, None, None],
-		    65399 : ["PRIVATE", self.build_record_PRIVATE, self.pack_record_id, self.unpack_record_id, self.calc_max_throughput_id]
-		    ## TEST
-			#65280-65534 : ["Private use", None, None, None, None],
-			## TEST
-		    #65535 : "Reserved"
-		}
-		return
-
 	def set_edns(self, value):
 		self.edns = value
 
-	def calc_max_throughput_id(self, max_length, hostname, overhead, encoding_class):
-		return encoding_class.get_maximum_length(max_length - overhead)
-
-	def pack_record_id(self, data):
-		return data
-
-	def unpack_record_id(self, data):
-		return data
-
-	def pack_record_hostname(self, data):
-		hostname = ""
-		for j in range(0,int(math.ceil(float(len(data))/63.0))):
-			hostname += data[j*63:(j+1)*63]+"."
-
-		return hostname
-
-	def unpack_record_hostname(self, data):
-		hostname = self.hostnamebin_to_hostname(data)[1].replace(".", "")
-
-		return hostname.replace(".", "")
-
-	def calc_max_throughput_A(self, max_length, hostname, overhead, encoding_class):
-		# max - len("hostname.") - 1 - overhead - plus dots
-		max_length -= len(hostname) + 1
-		cap = 0
-		while max_length > 64:
-			cap += 63
-			max_length -= 64
-		cap += max_length - 1
-
-		return encoding_class.get_maximum_length(cap) - overhead
+	def set_edns_size(self, size):
+		self.edns_size = size
 
 	def build_record_OPT(self):
-		return struct.pack(">BHHBBHH", 0x00, 41, 4096, 0, 0, 0x8000, 0)
-
-	def build_record_A(self, record):
-		additional_record_num = 0
-		additional_records = ""
-
-		answer_num = record[3]
-		#answers = struct.pack(">HHHIH", 0xc00c, 1, 1, 5, 4) + socket.inet_aton(record[2]) 
-		answers = ""
-		for i in xrange(record[3]):
-			answers += struct.pack(">HHHIH", 0xc00c, 1, 1, 5, 4) + record[2][i]
-
-		return (answer_num, answers, additional_record_num, additional_records)
-
-	def build_record_AAAA(self, record):
-		additional_record_num = 0
-		additional_records = ""
-
-		answer_num = record[3]
-		#answers = struct.pack(">HHHIH", 0xc00c, 1, 1, 5, 4) + socket.inet_aton(record[2]) 
-		answers = ""
-		for i in xrange(record[3]):
-			answers += struct.pack(">HHHIH", 0xc00c, 28, 1, 5, 16) + record[2][i]
-
-		return (answer_num, answers, additional_record_num, additional_records)
-
-	def build_record_NS(self, record):
-		additional_record_num = 0
-		additional_records = ""
-		compress_hostname = self.hostname_to_hostnamebin(record[2])
-
-		answer_num = 1
-		answers = struct.pack(">HHHIH", 0xc00c, 2, 1, 3600, len(compress_hostname)) + compress_hostname
-		
-		#additional_record_num = 1
-		#additional_records = compress_hostname + struct.pack(">HHIH", 1, 1, 5, 4) + socket.inet_aton("1.1.1.1")
-
-		return (answer_num, answers, additional_record_num, additional_records)
-
-	def calc_max_throughput_CNAME(self, max_length, hostname, overhead, encoding_class):
-		# -1 for the zero byte at the end
-		max_length -= 1
-		cap = 0
-		while max_length > 64:
-			cap += 63
-			max_length -= 64
-		cap += max_length - 1
-
-		return encoding_class.get_maximum_length(cap) - overhead
-
-	def build_record_CNAME(self, record):
-		additional_record_num = 0
-		additional_records = ""
-
-		answer_num = record[3]
-		answers = ""
-		for i in xrange(record[3]):	
-			compress_hostname = self.hostname_to_hostnamebin(record[2][i])
-			answers += struct.pack(">HHHIH", 0xc00c, 5, 1, 5, len(compress_hostname)) + compress_hostname
-
-		return (answer_num, answers, additional_record_num, additional_records)
-
-	def build_record_MX(self, record):
-		additional_record_num = 0
-		additional_records = ""
-
-		answer_num = record[3]
-		answers = ""
-		for i in xrange(record[3]):	
-			compress_hostname = self.hostname_to_hostnamebin(record[2][i])
-			answers += struct.pack(">HHHIHH", 0xc00c, 15, 1, 5, len(compress_hostname)+2, 10*i+10) + compress_hostname
-
-		return (answer_num, answers, additional_record_num, additional_records)
-
-	def build_record_SRV(self, record):
-		additional_record_num = 0
-		additional_records = ""
-
-		answer_num = record[3]
-		answers = ""
-		for i in xrange(record[3]):	
-			compress_hostname = self.hostname_to_hostnamebin(record[2][i])
-			answers += struct.pack(">HHHIHHHH", 0xc00c, 33, 1, 5, len(compress_hostname)+6, 10*i+10, 20*i+10, 1337) + compress_hostname
-
-		return (answer_num, answers, additional_record_num, additional_records)
-
-	def build_record_DNSKEY(self, record):
-		additional_record_num = 0
-		additional_records = ""
-
-		answer_num = record[3]
-		answers = ""
-		for i in xrange(record[3]):	
-			answers += struct.pack(">HHHIHHBB", 0xc00c, 48, 1, 5, len(record[2][i])+4, 0x0100, 3, 8) + record[2][i]
-
-		return (answer_num, answers, additional_record_num, additional_records)
-
-	def build_record_RRSIG(self, record):
-		additional_record_num = 0
-		additional_records = ""
-
-		answer_num = record[3]
-		answers = ""
-		for i in xrange(record[3]):	
-			compress_hostname = self.hostname_to_hostnamebin(record[4])
-			answers += struct.pack(">HHHIHHBBIIIH", 0xc00c, 46, 1, 5, len(compress_hostname + record[2][i])+18, 16, 10, 2, 5, int(time.time()) + 3600*36, 
-				int(time.time()) + 3600*12, 31005) + compress_hostname + record[2][i]
-
-		return (answer_num, answers, additional_record_num, additional_records)
-
-
-	def build_record_ANY(self, record):
-		compress_hostname = self.hostname_to_hostnamebin(record[2])
-		additional_record_num = 0
-		additional_records = ""
-
-		answer_num = 2
-		answers =  struct.pack(">HHHIH", 0xc00c, 5, 1, 5, len(compress_hostname)) + compress_hostname
-		answers += struct.pack(">HHHIH", 0xc00c, 1, 1, 5, 4) + socket.inet_aton(record[3])
-		
-		return (answer_num, answers, additional_record_num, additional_records)
-
-	def build_record_SOA(self, record):
-		compress_hostname = self.hostname_to_hostnamebin(record[2])
-		additional_record_num = 0
-		additional_records = ""
-
-		answer_num = 1
-		#data = self.hostname_to_hostnamebin(record[2]) + self.hostname_to_hostnamebin(record[3]) + struct.pack(">IIIII", record[4], record[5], record[6], record[7], record[8])
-		data = compress_hostname + self.hostname_to_hostnamebin(record[3]) + struct.pack(">IIIII", record[4], record[5], record[6], record[7], record[8])
-
-		answers = struct.pack(">HHHIH", 0xc00c, 6, 1, 5, len(data)) + data
-		
-		return (answer_num, answers, additional_record_num, additional_records)
-
-	def build_record_NULL(self, record):
-		additional_record_num = 0
-		additional_records = ""
-
-		answer_num = record[3]
-
-		answers = ""
-		for i in xrange(record[3]):
-			answers += struct.pack(">HHHIH", 0xc00c, 10, 1, 0, len(record[2][i])) + record[2][i]
-		
-		return (answer_num, answers, additional_record_num, additional_records)
-
-	def build_record_PRIVATE(self, record):
-		additional_record_num = 0
-		additional_records = ""
-
-		answer_num = record[3]
-
-		answers = ""
-		for i in xrange(record[3]):
-			answers += struct.pack(">HHHIH", 0xc00c, 65399, 1, 0, len(record[2][i])) + record[2][i]
-		
-		return (answer_num, answers, additional_record_num, additional_records)
-
-	def build_record_TXT(self, record):
-		additional_record_num = 0
-		additional_records = ""
-
-		answer_num = record[3]
-
-		answers = ""
-		for i in xrange(record[3]):
-			answers += struct.pack(">HHHIHB", 0xc00c, 16, 1, 0, len(record[2][i])+1, len(record[2][i])) + record[2][i]
-		
-		return (answer_num, answers, additional_record_num, additional_records)
+		return opt_struct.pack(0x00, 41, self.edns_size, 0, 0, 0x8000, 0)
 
 	def get_RR_type(self, num):
 		if num in self.RR_types:
@@ -358,16 +639,12 @@ class DNS_Proto():
 			return None
 
 	def reverse_RR_type(self, RRtype):
-		for i in self.RR_types:
-			if self.RR_types[i][0] == RRtype:
-				return self.RR_types[i]
-
-		return 0
+		return self.RR_types.get_by_name(RRtype, 0)
 
 	def reverse_RR_type_num(self, RRtype):
-		for i in self.RR_types:
-			if self.RR_types[i][0] == RRtype:
-				return i
+		RRtype = self.RR_types.get_by_name(RRtype)
+		if RRtype:
+			return RRtype.code
 
 		return 0
 
@@ -383,40 +660,10 @@ class DNS_Proto():
 		return None
 
 	def hostname_to_hostnamebin(self, hostname):
-		if hostname[len(hostname)-1:len(hostname)] != ".":
-			hostname += "."
-		i = 0
+		return hostname_to_hostnamebin(hostname)
 
-		hostnamebin = ""
-		while not hostname[i:].find(".") == -1:
-			hostnamebin += struct.pack("B", hostname[i:].find(".")) + hostname[i:i+hostname[i:].find(".")]
-			i = i + hostname[i:].find(".")+1
-
-		hostnamebin += "\x00"
-
-		return hostnamebin
-
-	def hostnamebin_to_hostname(self, hostnamebin):
-		hostname = ""
-		i = 0
-		length = 0
-
-		while True:
-			if len(hostnamebin) > i:
-				l = struct.unpack("B",hostnamebin[i:i+1])[0]
-				if l > 63:
-					length += 2
-					break
-				if l == 0:
-					length += 1
-					break
-				hostname += hostnamebin[i+1:i+1+l] + "."
-				length += l + 1
-				i = i + l + 1
-			else:
-				break
-
-		return (length, hostname)
+	def hostnamebin_to_hostname(self, hostnamebin, offset=0):
+		return hostnamebin_to_hostname(hostnamebin, offset)
 
 	def is_valid_dns(self, msg, hostname):
 		# check if the message's len is more than the minimum
@@ -424,123 +671,169 @@ class DNS_Proto():
 		if len(msg) < (17 + len(hostname)):
 			return False
 
-		flags = struct.unpack(">H",msg[2:4])[0]
+		(transaction_id, flags, questions, nanswers, nauthority, nadditional) = header_struct.unpack_from(msg, 0)
 
 		# if the message is not query
 		#if ((flags >> 15) & 0x1):
 		#	return False
 
-		questions = struct.unpack(">H",msg[4:6])[0]
-
 		# if the message does not have any questions
 		if questions != 1:
 			return False
 
-		(hlen, question_hostname) = self.hostnamebin_to_hostname(msg[12:])
+		(hlen, question_hostname) = hostnamebin_to_hostname(msg, 12)
 
 		if hostname != question_hostname[len(question_hostname)-len(hostname):]:
 			return False
 
 		return True
 
+	# validates and parses a message in one pass, returns None if it is not
+	# a DNS message with a single question under the hostname
+	def parse_message(self, msg, hostname):
+		end = len(msg)
+		if end < (17 + len(hostname)):
+			return None
+
+		(transaction_id, flags, nquestions, nanswers, nauthority, nadditional) = header_struct.unpack_from(msg, 0)
+		if nquestions != 1:
+			return None
+
+		(hlen, question_hostname) = hostnamebin_to_hostname(msg, 12)
+		i = 12 + hlen
+		if (hlen == 0) or (i + 4 > end):
+			return None
+		# resolvers may randomise the case of the name (0x20 encoding)
+		if not question_hostname.lower().endswith(hostname.lower()):
+			return None
+
+		(qtype, qclass) = question_struct.unpack_from(msg, i)
+		i += 4
+		new_record = tuple.__new__
+		questions = [new_record(Question, (question_hostname, qtype, qclass))]
+		question_length = i - 12
+
+		answers = []
+		append = answers.append
+		unpack_from = answer_struct.unpack_from
+		for q in xrange(nanswers):
+			owner = i
+			# owner names are usually a pointer to the question, only the
+			# length is needed here
+			if (i < end) and (msg[i] >= "\xc0"):
+				i += 2
+			else:
+				hlen = skip_hostname(msg, i)
+				if hlen == 0:
+					return None
+				i += hlen
+			if i + 10 > end:
+				return None
+			(rtype, rclass, ttl, datalen) = unpack_from(msg, i)
+			i += 10
+			if i + datalen > end:
+				return None
+			append(new_record(ResourceRecord, (owner, rtype, rclass, ttl, datalen, msg, i)))
+			i += datalen
+
+		return new_record(Message, (transaction_id, flags, questions, answers, nauthority, nadditional, question_length, i, msg))
+
 	def build_answer(self, transaction_id, record, orig_question):
+		builder = self.builder
+		builder.reset()
+		# placeholder for the header, it is set when the counts are known. It
+		# has the size of the header, so the offsets of compressed names are
+		# right.
+		builder.parts.append(header_placeholder)
+		builder.parts.append(orig_question)
+
+		answer_num = 0
+		additional_record_num = 0
 		if record == None:
 			flag = 0x8503 # 1000 0100 0000 0011
-			answer_num = 0
-			answers = ""
-			additional_record_num = 0
-			additional_records = ""
 		else:
 			flag = 0x8500 #	1000 0100 0000 0000
 			RRtype = self.reverse_RR_type(record[0])
-			if RRtype[1] == None:
-				answer_num = 0
-				answers = ""
-				additional_record_num = 0
-				additional_records = ""
-			else:
-				answer_num = 1
-				(answer_num, answers, additional_record_num, additional_records) = RRtype[1](record)
+			if RRtype and RRtype[1]:
+				(answer_num, additional_record_num) = RRtype[1](builder, record)
 
-		dns_header = struct.pack(">HHHHHH", transaction_id, flag, 1, answer_num, 0, additional_record_num)
+		builder.parts[0] = header_struct.pack(transaction_id, flag, 1, answer_num, 0, additional_record_num)
 
-		return dns_header + orig_question + answers + additional_records
+		return builder.getvalue()
 
 	def build_query(self, transaction_id, data, hostname, RRtype):
 		flag = 0x0100 #0000 0010 0000 0000
-		additional_num = self.edns
-		dns_header = struct.pack(">HHHHHH", transaction_id, flag, 1, 0, 0, additional_num)
-		additional_records = ""
+		builder = self.builder
+		builder.reset()
+		builder.parts.append(header_struct.pack(transaction_id, flag, 1, 0, 0, self.edns))
+		builder.parts.append(hostname_to_hostnamebin(data+hostname))
+		builder.parts.append(question_struct.pack(RRtype, 1))
 		if self.edns:
-			additional_records = self.build_record_OPT()
-		qhostname = self.hostname_to_hostnamebin(data+hostname)
+			builder.parts.append(self.build_record_OPT())
 
-		return dns_header + qhostname + struct.pack(">HH", RRtype, 1) + additional_records
+		return builder.getvalue()
 
-	def parse_questions(self, msg, nq):
+	def parse_questions(self, msg, nq, offset=0):
 		ret = {"length": -1}
-		i = 0
+		i = offset
+		end = len(msg)
 		for q in xrange(nq):
-			ret[q] = {}
-			(hlen, question_hostname) = self.hostnamebin_to_hostname(msg[i:])
-			if hlen == 0:
-				ret = {length: -1}
-				return ret
-			ret[q]["name"] = question_hostname
+			(hlen, question_hostname) = hostnamebin_to_hostname(msg, i)
+			if (hlen == 0) or (i + hlen + 4 > end):
+				return {"length": -1}
 			i += hlen
-			ret[q]["type"] = struct.unpack(">H",msg[i:i+2])[0]
-			i += 2
-			ret[q]["class"] = struct.unpack(">H",msg[i:i+2])[0]
-			i += 2
+			(qtype, qclass) = question_struct.unpack_from(msg, i)
+			i += 4
+			ret[q] = {"name": question_hostname, "type": qtype, "class": qclass}
 
-		ret["length"] = i
+		ret["length"] = i - offset
 
 		return ret
 
-	def parse_answers(self, msg, nq):
+	def parse_answers(self, msg, nq, offset=0):
 		ret = {"length": -1}
-		i = 0
+		i = offset
+		end = len(msg)
+		unpack_from = answer_struct.unpack_from
 		for q in xrange(nq):
-			ret[q] = {}
-			(hlen, question_hostname) = self.hostnamebin_to_hostname(msg[i:])
-			if hlen == 0:
-				ret = {"length": -1}
-				return ret
-			ret[q]["name"] = question_hostname
+			if (i < end) and (ord(msg[i]) > 63):
+				# compressed owner name, nothing to copy
+				(hlen, question_hostname) = (2, "")
+			else:
+				(hlen, question_hostname) = hostnamebin_to_hostname(msg, i)
+			if (hlen == 0) or (i + hlen + 10 > end):
+				return {"length": -1}
 			i += hlen
-			ret[q]["type"] = struct.unpack(">H",msg[i:i+2])[0]
-			i += 2
-			ret[q]["class"] = struct.unpack(">H",msg[i:i+2])[0]
-			i += 2
-			ret[q]["ttl"] = struct.unpack(">I",msg[i:i+4])[0]
-			i += 4
-			ret[q]["datalen"] = struct.unpack(">H",msg[i:i+2])[0]
-			i += 2
-			ret[q]["data"] = msg[i:i+ret[q]["datalen"]]
-			i += ret[q]["datalen"]
-
-		ret["length"] = i
+			(rtype, rclass, ttl, datalen) = unpack_from(msg, i)
+			i += 10
+			if i + datalen > end:
+				return {"length": -1}
+			ret[q] = {"name": question_hostname, "type": rtype, "class": rclass, "ttl": ttl, "datalen": datalen, "data": msg[i:i+datalen]}
+			i += datalen
+
+		ret["length"] = i - offset
 		return ret
 
 	def parse_dns(self, msg, hostname):
-		rdata = ""
-		transaction_id = struct.unpack(">H",msg[0:2])[0]
-		flags = struct.unpack(">H",msg[2:4])[0]
-		nquestions = struct.unpack(">H",msg[4:6])[0]
-		nanswers = struct.unpack(">H",msg[6:8])[0]
-		nauthority = struct.unpack(">H",msg[8:10])[0]
-		nadditional = struct.unpack(">H",msg[10:12])[0]
+		if len(msg) < 12:
+			return (None, None, None, None, None, None, None, None)
+
+		(transaction_id, flags, nquestions, nanswers, nauthority, nadditional) = header_struct.unpack_from(msg, 0)
 
 		i = 12
 
 		if ((flags & 0xF) > 0) and ((flags & 0xF) != 3):
 			# Format error/Server failure/Not Implemented/Refused
 			return (None, None, None, None, None, None, None, None)
-		
-		questions = self.parse_questions(msg[i:], nquestions)
+
+		questions = self.parse_questions(msg, nquestions, i)
+		if (questions["length"] == -1) or (not 0 in questions):
+			return (None, None, None, None, None, None, None, None)
 		orig_question = msg[i:i+questions["length"]]
 		i += questions["length"]
-		answers = self.parse_answers(msg[i:], nanswers)
+		answers = self.parse_answers(msg, nanswers, i)
+		if answers["length"] == -1:
+			return (None, None, None, None, None, None, None, None)
 		i += answers["length"]
 
 		return (transaction_id, not ((flags >> 15) & 0x01), questions[0]["type"], nquestions, questions, orig_question, nanswers, answers)
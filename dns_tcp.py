@@ -0,0 +1,262 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+
+if "dns_tcp.py" in sys.argv[0]:
+	print("[-] Instead of poking around just try: python main.py --help")
+	sys.exit(-1)
+
+import socket
+import struct
+import errno
+
+import common
+
+# every message is prefixed with its length (RFC 1035 4.2.2)
+length_struct = struct.Struct(">H")
+MAX_MESSAGE_SIZE = 65535
+
+# idle connections are closed by the server after this many seconds
+# (RFC 7766 6.2.3 suggests a few seconds)
+IDLE_TIMEOUT = 10.0
+MAX_CONNECTIONS = 256
+
+def frame(message):
+	return length_struct.pack(len(message)) + message
+
+def create_listener(address, reuseport):
+	listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+	if reuseport:
+		# Python 2 does not export the constant, 15 is the Linux value
+		listener.setsockopt(socket.SOL_SOCKET, getattr(socket, "SO_REUSEPORT", 15), 1)
+	listener.bind(address)
+	listener.listen(64)
+	listener.setblocking(0)
+
+	return listener
+
+# Non-blocking TCP connection that carries length prefixed DNS messages.
+# Several messages can be written before the answers arrive (pipelining),
+# the unsent part waits in outbuf until the socket is writable. The end of
+# the stream closes the connection, with half_close it only stops the
+# reading: a client may shut down its side after its last query and still
+# wait for the answers (RFC 7766 6.2.1).
+class Stream_Connection():
+	def __init__(self, sock, address, connecting=False, half_close=False):
+		self.sock = sock
+		self.address = address
+		self.connecting = connecting
+		self.half_close = half_close
+		self.sock.setblocking(0)
+		# small messages go out at once, Nagle's algorithm would hold back a
+		# query until the previous answer is acknowledged
+		self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		# a closed socket has no descriptor any more
+		self.fd = sock.fileno()
+
+		self.inbuf = ""
+		self.outbuf = ""
+		self.eof = False
+		self.closed = False
+		self.error = None
+		self.last_active = common.monotonic()
+
+	@classmethod
+	def connect(cls, address):
+		sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		sock.setblocking(0)
+		result = sock.connect_ex(address)
+		connection = cls(sock, address, True)
+		if result not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+			connection.close(result)
+
+		return connection
+
+	def fileno(self):
+		return self.fd
+
+	def wants_write(self):
+		return (not self.closed) and (self.connecting or bool(self.outbuf))
+
+	def wants_read(self):
+		return not (self.closed or self.eof)
+
+	def write(self, message):
+		if self.closed:
+			return False
+		if len(message) > MAX_MESSAGE_SIZE:
+			return False
+		self.outbuf += frame(message)
+		if not self.connecting:
+			self.flush()
+
+		return not self.closed
+
+	def flush(self):
+		if self.connecting:
+			# the result of the non-blocking connect
+			error = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+			if error:
+				self.close(error)
+				return
+			self.connecting = False
+		while self.outbuf:
+			try:
+				sent = self.sock.send(self.outbuf)
+			except socket.error as e:
+				if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+					return
+				if e.errno == errno.EINTR:
+					continue
+				self.close(e.errno)
+				return
+			self.outbuf = self.outbuf[sent:]
+			self.last_active = common.monotonic()
+
+	# reads what arrived and returns the complete messages
+	def read(self):
+		while self.wants_read():
+			try:
+				data = self.sock.recv(65536)
+			except socket.error as e:
+				if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+					break
+				if e.errno == errno.EINTR:
+					continue
+				self.close(e.errno)
+				break
+			if not data:
+				if self.half_close:
+					self.eof = True
+				else:
+					self.close()
+				break
+			self.inbuf += data
+			self.last_active = common.monotonic()
+
+		messages = []
+		offset = 0
+		while len(self.inbuf) - offset >= 2:
+			length = length_struct.unpack_from(self.inbuf, offset)[0]
+			if len(self.inbuf) - offset - 2 < length:
+				break
+			messages.append(self.inbuf[offset+2:offset+2+length])
+			offset += 2 + length
+		self.inbuf = self.inbuf[offset:]
+
+		return messages
+
+	def close(self, error=None):
+		if self.closed:
+			return
+		self.closed = True
+		self.error = error
+		self.outbuf = ""
+		try:
+			self.sock.close()
+		except socket.error:
+			pass
+
+# TCP side of the server: accepts connections, answers every message with
+# handler(message, connection), None means no answer (or one written later).
+# Connections stay open for more queries until the client closes them or
+# they are idle for idle_timeout, on_close(connection) is called then. A
+# client that only shut down its side gets the answers to the queries it
+# sent before the connection is closed.
+class Stream_Server():
+	def __init__(self, listener, handler, poller, idle_timeout=IDLE_TIMEOUT, max_connections=MAX_CONNECTIONS, on_close=None):
+		self.listener = listener
+		self.handler = handler
+		self.poller = poller
+		self.on_close = on_close
+		self.idle_timeout = idle_timeout
+		self.max_connections = max_connections
+
+		self.connections = {}
+		self.accepted = 0
+		self.queries = 0
+		self.answered = 0
+		self.failed = 0
+
+		self.poller.register(self.listener.fileno())
+
+	def accept(self):
+		while True:
+			try:
+				(sock, address) = self.listener.accept()
+			except socket.error as e:
+				if e.errno == errno.EINTR:
+					continue
+				return
+			if len(self.connections) >= self.max_connections:
+				# the oldest idle one makes room
+				self.close(min(self.connections.values(), key=lambda connection: connection.last_active))
+			connection = Stream_Connection(sock, address, half_close=True)
+			self.connections[connection.fileno()] = connection
+			self.poller.register(connection.fileno())
+			self.accepted += 1
+
+	def handle(self, fd, readable, writable):
+		if fd == self.listener.fileno():
+			self.accept()
+			return
+		connection = self.connections.get(fd)
+		if not connection:
+			return
+
+		if readable:
+			for message in connection.read():
+				self.queries += 1
+				answer = self.handler(message, connection)
+				if answer is None:
+					continue
+				if connection.write(answer):
+					self.answered += 1
+				else:
+					self.failed += 1
+		if writable:
+			connection.flush()
+
+		if connection.eof and not connection.outbuf:
+			# every answer is out
+			connection.close()
+		if connection.closed:
+			self.close(connection)
+		else:
+			self.poller.modify(fd, connection.wants_write(), connection.wants_read())
+
+	def close(self, connection):
+		fd = connection.fileno()
+		known = self.connections.get(fd) is connection
+		if known:
+			del self.connections[fd]
+			self.poller.unregister(fd)
+		connection.close()
+		if known and self.on_close:
+			self.on_close(connection)
+
+	def expire(self, now):
+		for connection in self.connections.values():
+			if now - connection.last_active > self.idle_timeout:
+				self.close(connection)
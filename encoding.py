@@ -0,0 +1,237 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+
+if "encoding.py" in sys.argv[0]:
+	print("[-] Instead of poking around just try: python main.py --help")
+	sys.exit(-1)
+
+import base64
+import binascii
+import struct
+import hashlib
+
+# Encodings of the tunnelled data, the encoding_class of the capacity
+# functions in dns_proto. get_maximum_length(n) is the number of raw bytes
+# that fit into n encoded characters, get_encoded_length(n) the number of
+# characters that n raw bytes take. Invalid input makes decode() raise
+# ValueError.
+
+# 8-bit data as it is, for record types that carry binary rdata
+class Raw():
+	def get_name(self):
+		return "raw"
+
+	def encode(self, data):
+		return data
+
+	def decode(self, data):
+		return data
+
+	def get_maximum_length(self, length):
+		return max(0, length)
+
+	def get_encoded_length(self, length):
+		return length
+
+# lower case base32 without padding, safe for case-insensitive labels. The
+# base64 module does base32 in pure Python on Python 2, this is faster:
+# groups of 5 bytes are split into 10 bit pairs of characters and the text
+# is decoded as one big base 32 number by int().
+BASE32_ALPHABET = "abcdefghijklmnopqrstuvwxyz234567"
+BASE32_PAIRS = [BASE32_ALPHABET[i >> 5] + BASE32_ALPHABET[i & 0x1F] for i in xrange(1024)]
+# base32 characters (either case) to the digits of int(), the rest to "!"
+# which int() refuses
+BASE32_DIGITS = ["!"] * 256
+for i in xrange(32):
+	BASE32_DIGITS[ord(BASE32_ALPHABET[i])] = BASE32_DIGITS[ord(BASE32_ALPHABET[i].upper())] = "0123456789abcdefghijklmnopqrstuv"[i]
+BASE32_DIGITS = "".join(BASE32_DIGITS)
+# groups of 5 bytes as a big endian 64 bit number
+base32_struct = struct.Struct(">Q")
+
+class Base32():
+	def get_name(self):
+		return "base32"
+
+	def encode(self, data):
+		pairs = BASE32_PAIRS
+		unpack = base32_struct.unpack
+		padded = data + "\x00" * (-len(data) % 5)
+		parts = []
+		append = parts.append
+		for i in xrange(0, len(padded), 5):
+			value = unpack("\x00\x00\x00" + padded[i:i+5])[0]
+			append(pairs[value >> 30] + pairs[(value >> 20) & 0x3FF] + pairs[(value >> 10) & 0x3FF] + pairs[value & 0x3FF])
+
+		return "".join(parts)[:self.get_encoded_length(len(data))]
+
+	def decode(self, data):
+		if len(data) % 8 in (1, 3, 6):
+			raise ValueError("invalid base32 length")
+		length = self.get_maximum_length(len(data))
+		if not length:
+			return ""
+		# the bits of the last character that do not make up a byte
+		value = int(data.translate(BASE32_DIGITS), 32) >> (len(data) * 5 - length * 8)
+
+		return binascii.unhexlify("%0*x" % (length * 2, value))
+
+	# 8 characters carry 5 bytes, a partial group of n characters carries
+	# n*5/8 bytes
+	def get_maximum_length(self, length):
+		return max(0, length * 5 / 8)
+
+	def get_encoded_length(self, length):
+		return (length * 8 + 4) / 5
+
+# base64 with "-" and "_" instead of "+" and "/" and without padding, only
+# works if the resolver keeps the case of the names
+class Base64():
+	def get_name(self):
+		return "base64"
+
+	def encode(self, data):
+		return base64.urlsafe_b64encode(data).rstrip("=")
+
+	def decode(self, data):
+		# b64decode() skips characters that are not in the alphabet
+		if (len(data) % 4 == 1) or data.translate(None, BASE64_ALPHABET):
+			raise ValueError("invalid base64 data")
+		try:
+			return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+		except (TypeError, binascii.Error):
+			raise ValueError("invalid base64 data")
+
+	def get_maximum_length(self, length):
+		return max(0, length * 3 / 4)
+
+	def get_encoded_length(self, length):
+		return (length * 4 + 2) / 3
+
+BASE64_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+
+# 7 bits per character: letters, digits and the 8-bit characters 0xBC-0xFD
+# (the same alphabet as iodine). Needs a resolver that keeps the case and
+# passes 8-bit labels.
+BASE128_ALPHABET = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789" + "".join([chr(i) for i in xrange(0xBC, 0xFE)])
+# groups of 7 bytes are 8 characters, as one big endian 64 bit number
+base128_struct = struct.Struct(">Q")
+
+class Base128():
+	def __init__(self):
+		self.reverse = dict([(BASE128_ALPHABET[i], i) for i in xrange(128)])
+
+	def get_name(self):
+		return "base128"
+
+	def encode(self, data):
+		alphabet = BASE128_ALPHABET
+		unpack = base128_struct.unpack
+		parts = []
+		append = parts.append
+		for i in xrange(0, len(data), 7):
+			group = data[i:i+7]
+			value = unpack("\x00" + group + "\x00" * (7 - len(group)))[0]
+			append(alphabet[(value >> 49) & 0x7F] + alphabet[(value >> 42) & 0x7F] + alphabet[(value >> 35) & 0x7F] + alphabet[(value >> 28) & 0x7F] +
+				alphabet[(value >> 21) & 0x7F] + alphabet[(value >> 14) & 0x7F] + alphabet[(value >> 7) & 0x7F] + alphabet[value & 0x7F])
+		text = "".join(parts)
+
+		return text[:self.get_encoded_length(len(data))]
+
+	def decode(self, data):
+		if len(data) % 8 == 1:
+			raise ValueError("invalid base128 length")
+		reverse = self.reverse
+		pack = base128_struct.pack
+		parts = []
+		append = parts.append
+		try:
+			for i in xrange(0, len(data), 8):
+				value = 0
+				for c in data[i:i+8]:
+					value = (value << 7) | reverse[c]
+				value <<= 7 * (8 - len(data[i:i+8]))
+				append(pack(value)[1:])
+		except KeyError:
+			raise ValueError("invalid base128 data")
+
+		return "".join(parts)[:self.get_maximum_length(len(data))]
+
+	def get_maximum_length(self, length):
+		return max(0, length * 7 / 8)
+
+	def get_encoded_length(self, length):
+		return (length * 8 + 6) / 7
+
+# densest first
+ENCODINGS = [Raw(), Base128(), Base64(), Base32()]
+
+# encodings that can be put into domain names, raw data could contain dots
+NAME_ENCODINGS = [Base128(), Base64(), Base32()]
+
+def get_by_name(name, default=None):
+	for encoding_class in ENCODINGS:
+		if encoding_class.get_name() == name:
+			return encoding_class
+
+	return default
+
+# Reproducible test data of the encoding checks: the client and the server
+# both derive it from the random part of the query name, so the answer can
+# be checked byte by byte. All byte values show up.
+def test_data(seed, length):
+	parts = []
+	size = 0
+	counter = 0
+	while size < length:
+		parts.append(hashlib.md5(seed + str(counter)).digest())
+		size += 16
+		counter += 1
+
+	return "".join(parts)[:length]
+
+# the answer to data that was sent up in a query name: 4 bytes, an A record
+def digest(data):
+	return hashlib.md5(data).digest()[:4]
+
+# Raw data of the num answers of a transfer query, length bytes each. The
+# first one starts with the digest of the chunk that came up in the name,
+# so the client knows that the server got it unchanged.
+def transfer_blocks(seed, chunk, num, length):
+	blocks = [test_data(seed + "/" + str(i), length) for i in xrange(num)]
+	blocks[0] = (digest(chunk) + blocks[0][4:])[:length]
+
+	return blocks
+
+# a transfer chunk on its way up: the digest of the data, then the data
+def seal_chunk(data):
+	return digest(data) + data
+
+# the data of a chunk or None if it was changed on the way
+def open_chunk(chunk):
+	if not chunk:
+		return ""
+	if (len(chunk) < 4) or (digest(chunk[4:]) != chunk[:4]):
+		return None
+
+	return chunk[4:]
@@ -0,0 +1,136 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+
+if "estimator.py" in sys.argv[0]:
+	print("[-] Instead of poking around just try: python main.py --help")
+	sys.exit(-1)
+
+import collections
+
+import dns_proto
+import encoding
+import capacity_search
+
+# longest domain name on the wire (RFC 1035)
+MAX_NAME_LENGTH = 255
+
+# bytes per answer of the record types that carry a fixed size address
+FIXED_SIZES = {"A": 4, "AAAA": 16}
+
+# capacity functions of the record types that have none in the registry,
+# MX and SRV carry the data in the target name like CNAME
+EXTRA_CAPACITY = {
+	"MX": dns_proto.calc_max_throughput_CNAME,
+	"SRV": dns_proto.calc_max_throughput_CNAME,
+	"DNSKEY": dns_proto.calc_max_throughput_id,
+	"RRSIG": dns_proto.calc_max_throughput_id,
+}
+
+# record types with the data in a domain name, the rest carries it in rdata
+NAME_TYPES = ["CNAME", "MX", "SRV"]
+
+# estimated tunnel configuration of one record type
+Estimate = collections.namedtuple("Estimate", "record_type edns encoding num length upstream downstream rtt loss upstream_rate downstream_rate")
+
+# Combines the capacity functions of dns_proto with the numbers measured by
+# a client run: the largest answers per record type, the round trip time
+# and the packet loss. window is the number of queries a tunnel keeps in
+# flight, 1 means one query at a time.
+class Goodput_Estimator():
+	def __init__(self, DNS_proto, domain, overhead=0, window=1):
+		self.DNS_proto = DNS_proto
+		self.domain = domain
+		self.overhead = overhead
+		self.window = window
+
+	# raw bytes that one answer of length payload characters carries
+	def answer_capacity(self, record_type, length, encoding_class):
+		if record_type in FIXED_SIZES:
+			return FIXED_SIZES[record_type]
+
+		capacity = self.DNS_proto.RR_types.get_by_name(record_type).capacity or EXTRA_CAPACITY.get(record_type)
+		if not capacity:
+			return 0
+		if record_type in NAME_TYPES:
+			# the name on the wire: labels of at most 63 characters, a length
+			# byte for each and the closing zero byte
+			name_length = length + (length + 62) / 63 + 1
+			return max(0, capacity(min(name_length, MAX_NAME_LENGTH), "", self.overhead, encoding_class))
+
+		return max(0, capacity(length, "", self.overhead, encoding_class))
+
+	# raw bytes that one query name carries, the same for every record type
+	def upstream_capacity(self, max_name_length, encoding_class):
+		capacity = self.DNS_proto.RR_types.get_by_name("A").capacity
+
+		return max(0, capacity(max_name_length, self.domain, self.overhead, encoding_class))
+
+	def estimate(self, record_type, results, rtt, loss, upstream, encoding_class):
+		# many answers of the base length or one answer as long as possible
+		base_length = dict([(name, length) for (name, length, fixed) in capacity_search.SEARCH_TYPES])[record_type]
+		best = None
+		for result in results:
+			# the tunnel runs over UDP
+			if (result.record_type != record_type) or result.tcp:
+				continue
+			if result.dimension == "num":
+				(num, length) = (result.value, base_length)
+			else:
+				(num, length) = (1, result.value)
+			if not num or not length:
+				continue
+			downstream = num * self.answer_capacity(record_type, length, encoding_class)
+			if (best is None) or (downstream > best[0]) or ((downstream == best[0]) and (result.edns < best[1])):
+				best = (downstream, result.edns, num, length)
+		if not best:
+			return None
+
+		(downstream, edns, num, length) = best
+		queries = self.window / rtt * (1.0 - loss)
+
+		return Estimate(record_type, edns, encoding_class.get_name(), num, length, upstream, downstream, rtt, loss, upstream * queries, downstream * queries)
+
+	# estimates of all record types, the fastest downstream first. rtts is
+	# a record type -> seconds dictionary, encodings a record type ->
+	# encoding dictionary (base32 where missing), upstream_encoding the
+	# encoding of the query names (base32 if None).
+	def rank(self, results, rtts, loss, max_name_length, encodings=None, upstream_encoding=None):
+		if encodings is None:
+			encodings = {}
+		upstream = self.upstream_capacity(max_name_length, upstream_encoding or encoding.Base32())
+		estimates = []
+		for (record_type, base_length, fixed_length) in capacity_search.SEARCH_TYPES:
+			if (record_type not in rtts) or not rtts[record_type]:
+				continue
+			if record_type in FIXED_SIZES:
+				# addresses are binary
+				encoding_class = encoding.Raw()
+			else:
+				encoding_class = encodings.get(record_type, encoding.Base32())
+			estimate = self.estimate(record_type, results, rtts[record_type], loss, upstream, encoding_class)
+			if estimate and estimate.downstream:
+				estimates.append(estimate)
+		estimates.sort(key=lambda estimate: estimate.downstream_rate, reverse=True)
+
+		return estimates
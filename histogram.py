@@ -0,0 +1,153 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+
+if "histogram.py" in sys.argv[0]:
+	print("[-] Instead of poking around just try: python main.py --help")
+	sys.exit(-1)
+
+import math
+
+PERCENTILES = [50, 90, 99]
+
+# Latency histogram with logarithmic buckets and fixed memory. Bucket 0 holds
+# the values up to lowest, bucket i the values between lowest*growth^(i-1)
+# and lowest*growth^i, so every value is known within the growth factor no
+# matter how many were recorded.
+class Latency_Histogram():
+	def __init__(self, lowest=0.00001, highest=120.0, growth=1.05):
+		self.lowest = lowest
+		self.highest = highest
+		self.growth = growth
+		self.log_growth = math.log(growth)
+		self.buckets = [0] * (int(math.log(highest / lowest) / self.log_growth) + 2)
+
+		self.count = 0
+		self.total = 0.0
+		self.min = None
+		self.max = None
+
+	def record(self, value):
+		if value <= self.lowest:
+			index = 0
+		else:
+			index = min(int(math.log(value / self.lowest) / self.log_growth) + 1, len(self.buckets) - 1)
+		self.buckets[index] += 1
+
+		self.count += 1
+		self.total += value
+		if (self.min is None) or (value < self.min):
+			self.min = value
+		if (self.max is None) or (value > self.max):
+			self.max = value
+
+	def merge(self, other):
+		for i in xrange(len(self.buckets)):
+			self.buckets[i] += other.buckets[i]
+		self.count += other.count
+		self.total += other.total
+		if other.count:
+			if (self.min is None) or (other.min < self.min):
+				self.min = other.min
+			if (self.max is None) or (other.max > self.max):
+				self.max = other.max
+
+	def mean(self):
+		if not self.count:
+			return None
+
+		return self.total / self.count
+
+	# upper edge of the bucket that holds the pth percentile, never more than
+	# the largest recorded value
+	def percentile(self, p):
+		if not self.count:
+			return None
+
+		rank = max(1, int(math.ceil(self.count * p / 100.0)))
+		seen = 0
+		for i in xrange(len(self.buckets)):
+			seen += self.buckets[i]
+			if seen >= rank:
+				return min(self.lowest * (self.growth ** i), self.max)
+
+		return self.max
+
+	def summary(self):
+		result = {"count": self.count, "min": self.min, "max": self.max, "mean": self.mean()}
+		for p in PERCENTILES:
+			result["p{0}".format(p)] = self.percentile(p)
+
+		return result
+
+# Histograms kept per (test phase, record type). Queries that got no answer
+# have no round trip time and are only counted.
+class Latency_Recorder():
+	def __init__(self):
+		self.histograms = {}
+		self.timeouts = {}
+		self.order = []
+
+	def key(self, phase, record_type):
+		key = (phase, record_type)
+		if key not in self.histograms:
+			self.histograms[key] = Latency_Histogram()
+			self.timeouts[key] = 0
+			self.order.append(key)
+
+		return key
+
+	def record(self, phase, record_type, rtt):
+		key = self.key(phase, record_type)
+		if rtt is None:
+			self.timeouts[key] += 1
+		else:
+			self.histograms[key].record(rtt)
+
+	def total(self):
+		histogram = Latency_Histogram()
+		for key in self.order:
+			histogram.merge(self.histograms[key])
+
+		return histogram
+
+	# median per record type of one phase, the queries of different phases
+	# have different sizes and are not comparable
+	def medians(self, phase):
+		result = {}
+		for (key_phase, record_type) in self.order:
+			if key_phase == phase:
+				result[record_type] = self.histograms[(key_phase, record_type)].percentile(50)
+
+		return result
+
+	def export(self):
+		result = []
+		for (phase, record_type) in self.order:
+			summary = self.histograms[(phase, record_type)].summary()
+			summary["phase"] = phase
+			summary["record_type"] = record_type
+			summary["timeouts"] = self.timeouts[(phase, record_type)]
+			result.append(summary)
+
+		return result
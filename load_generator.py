@@ -0,0 +1,111 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+
+if "load_generator.py" in sys.argv[0]:
+	print("[-] Instead of poking around just try: python main.py --help")
+	sys.exit(-1)
+
+import collections
+
+import common
+import query_engine
+
+# payload length used for each record type during the load test
+LOAD_LENGTHS = {"A": 4, "AAAA": 16}
+DEFAULT_LOAD_LENGTH = 10
+
+# outcome of one rate step
+Load_Step = collections.namedtuple("Load_Step", "rate achieved sent answered lost errors ratio avg_rtt max_rtt")
+
+# Sends queries at a target rate (token bucket) through the query engine and
+# steps the rate upward until the resolver starts dropping or refusing them.
+class Load_Generator():
+	def __init__(self, engine, start_rate, rate_step, max_rate, step_duration, threshold=0.90):
+		self.engine = engine
+		self.start_rate = start_rate
+		self.rate_step = rate_step
+		self.max_rate = max_rate
+		self.step_duration = step_duration
+		self.threshold = threshold
+
+	def run_step(self, record_type, rate):
+		length = LOAD_LENGTHS.get(record_type, DEFAULT_LOAD_LENGTH)
+		# short bursts only, so the rate is what the resolver sees
+		bucket = common.Token_Bucket(rate, max(1.0, rate / 20.0))
+		# enough room for every query that can be in flight at this rate
+		self.engine.max_inflight = max(self.engine.max_inflight, int(rate * self.engine.timeout) + 1)
+
+		self.engine.phase = "load {0:.0f}qps".format(rate)
+		probes = []
+		start = common.monotonic()
+		end = start + self.step_duration
+		while True:
+			now = common.monotonic()
+			if now >= end:
+				break
+			while bucket.consume(now):
+				# sent once with a fixed timeout, retries would add load
+				probe = query_engine.Probe(record_type, record_type, 1, length, 15, 0, timeout=self.engine.timeout)
+				self.engine.submit(probe)
+				probes.append(probe)
+			self.engine.step(min(bucket.wait_time(), end - now))
+		elapsed = common.monotonic() - start
+
+		# wait for the answers of the last queries
+		while [probe for probe in probes if not probe.done]:
+			self.engine.step(self.engine.timeout)
+
+		answered = len([probe for probe in probes if probe.result])
+		errors = len([probe for probe in probes if probe.rcode and (probe.rcode != 3)])
+		lost = len([probe for probe in probes if probe.rtt is None])
+		rtts = [probe.rtt for probe in probes if probe.result]
+		if rtts:
+			(avg_rtt, max_rtt) = (sum(rtts) / len(rtts), max(rtts))
+		else:
+			(avg_rtt, max_rtt) = (None, None)
+		if probes:
+			ratio = float(answered) / len(probes)
+		else:
+			ratio = 0.0
+
+		return Load_Step(rate, len(probes) / elapsed, len(probes), answered, lost, errors, ratio, avg_rtt, max_rtt)
+
+	# runs the steps for one record type, callback is called after each step
+	# returns the steps and the highest rate that still passed (None if no
+	# limit was hit, 0 if even the first step failed)
+	def find_knee(self, record_type, callback=None):
+		steps = []
+		knee = 0
+		rate = self.start_rate
+		while rate <= self.max_rate:
+			step = self.run_step(record_type, rate)
+			steps.append(step)
+			if callback:
+				callback(record_type, step)
+			if (step.ratio < self.threshold) or step.errors:
+				return (steps, knee)
+			knee = step.achieved
+			rate += self.rate_step
+
+		return (steps, None)
@@ -21,14 +21,55 @@
 # SOFTWARE.
 
 import sys
-import re
 import os
 import getopt
-import random
 import socket
-import math
+import struct
+import time
+import json
+import multiprocessing
+import signal
+
+try:
+	import Queue
+except ImportError:
+	# Python 3
+	import queue as Queue
 
 import dns_proto
+import query_engine
+import payload
+import answer_cache
+import load_generator
+import capacity_search
+import scheduler
+import resolver
+import estimator
+import encoding
+import datagram_io
+import dns_tcp
+import metrics
+import result_cache
+import transfer
+from common import internal_print, internal_dot_print, is_hostname, is_ipv4, monotonic, Poller
+
+# characters of test data in the encoding checks
+ENCODING_CHECK_LENGTH = 100
+
+# queries sent on one TCP connection at once by the pipelining check
+PIPELINE_QUERIES = 20
+# the UDP/TCP throughput comparison sends this many queries per transport in
+# waves of THROUGHPUT_WINDOW, each asking for THROUGHPUT_ANSWER (num, length)
+# CNAME answers that fit into 512 bytes
+THROUGHPUT_QUERIES = 48
+THROUGHPUT_WINDOW = 8
+THROUGHPUT_ANSWER = (3, 100)
+# the round trip times of the estimate come from this many rounds of one
+# small query per record type, sent together
+ROUND_TRIP_ROUNDS = 5
+
+# per worker server counters, kept in shared memory when running with workers
+SERVER_STATS = ["queries", "answered", "garbage", "rejected", "template cache hits", "template cache misses", "receive batches", "TCP connections", "TCP queries"]
 
 class Tester():
 	def __init__(self):
@@ -37,13 +78,76 @@ class Tester():
 		self.mode = 0
 		self.nameserver = "8.8.8.8" # default google DNS server
 		self.domain = ""
-		self.short = "hsc"
-		self.long = ["help", "server", "client", "nameserver=", "domain="]
+		self.workers = 1
+		self.io_mode = datagram_io.get_modes()[0]
+		self.rcvbuf = 0
+		self.sndbuf = 0
+		self.buffers_checked = False
+		self.tcp = True
+
+		# live counters of the server, served on metrics_address if set.
+		# Workers send a snapshot every second through metrics_queue.
+		self.metrics = metrics.Server_Metrics()
+		self.metrics_address = None
+		self.metrics_queue = None
+		self.metrics_index = 0
+		self.next_publish = 0.0
+		self.worker_metrics = {}
+		self.retired_metrics = []
+		self.server_stats = []
+		self.restarts = 0
+		self.start_time = time.time()
+		self.loadtest = False
+		self.load_types = ["A", "CNAME", "TXT"]
+		self.rate_start = 10
+		self.rate_step = 10
+		self.rate_max = 500
+		self.step_duration = 3.0
+		self.latency_json = None
+		self.results_json = None
+		self.cache_file = None
+		self.cache_ttl = result_cache.DEFAULT_TTL
+		self.cache = None
+		# task name -> records of its finished probes
+		self.probe_records = {}
+		self.results = None
+		# queries/sec sent to one nameserver at most, 0 is unlimited
+		self.query_rate = 0
+		# list of resolvers to check at the same time, each in a process
+		self.scan_file = None
+		self.scan_workers = 8
+		self.scan_queue = None
+		self.scanning = False
+		self.retries = query_engine.MAX_RETRIES
+		# emulated tunnel transfer through one record type
+		self.transfer_type = None
+		self.transfer_encoding = None
+		self.transfer_upstream = encoding.Base32()
+		self.transfer_answer = None
+		self.transfer_size = 1.0
+		self.concurrency = 4
+		self.port = 53
+		self.upstream = ("127.0.0.1", 53)
+		self.impairments = resolver.Impairments()
+		self.window = 1
+
+		# measured by the client checks for the goodput estimate
+		self.loss = 0.0
+		self.max_name_length = 0
+		self.edns_limit = None
+		self.capacity_results = []
+		self.encodings = {}
+		self.upstream_encoding = None
+		self.engine = None
+		self.short = "hscr"
+		self.long = ["help", "server", "client", "nameserver=", "domain=", "workers=", "loadtest", "load-types=", "rate-start=", "rate-step=", "rate-max=", "step-duration=", "latency-json=", "concurrency=", "port=", "resolver", "upstream=", "loss=", "delay=", "jitter=", "client-rate=", "max-answer=", "block-types=", "strip-edns", "window=", "io=", "rcvbuf=", "sndbuf=", "no-tcp", "mtu=", "metrics=", "results=", "cache=", "cache-ttl=", "query-rate=", "scan=", "scan-workers=", "retries=", "transfer=", "transfer-size=", "transfer-answer=", "transfer-upstream="]
 
 		self.alphabet = "abcdefghijklmnopqrstuvwxyz0123456789"
+		self.payload = payload.Payload_Pool(self.alphabet)
+		self.answer_cache = answer_cache.Answer_Cache(self.DNS_proto, self.payload)
 
 	def usage(self):
-		print("[*] Usage: python main.py [options]:\nOptions:\n-h\t--help\t\tusage of the tool (this help)\n-s\t--server\tserver mode (default)\n-c\t--client\tclient mode\n\t--nameserver\tspecify nameserver (IPv4 address)\n\t--domain\tspecify domain")
+		print("[*] Usage: python main.py [options]:\nOptions:\n-h\t--help\t\tusage of the tool (this help)\n-s\t--server\tserver mode (default)\n-c\t--client\tclient mode\n-r\t--resolver\tlocal forwarding resolver with impairments, for testing\n\t--nameserver\tspecify nameserver (IPv4 address)\n\t--domain\tspecify domain\n\t--workers\tnumber of server processes sharing the port (SO_REUSEPORT)\n\t--loadtest\tclient: find the query rate where the resolver starts dropping\n\t--load-types\tcomma separated record types for the load test (default: A,CNAME,TXT)\n\t--rate-start\tfirst rate of the load test in queries/sec (default: 10)\n\t--rate-step\trate increase per step in queries/sec (default: 10)\n\t--rate-max\thighest rate to try in queries/sec (default: 500)\n\t--step-duration\tseconds spent on each rate (default: 3)\n\t--latency-json\tclient: save the latency percentiles to this JSON file\n\t--concurrency\tclient: number of checks running at the same time (default: 4)\n\t--port\t\tport of the server/resolver, or of the nameserver in client mode (default: 53)\n\t--upstream\tresolver: server to forward to as IP:port (default: 127.0.0.1:53)\n\t--loss\t\tresolver: packet loss in percent\n\t--delay\t\tresolver: added latency in ms\n\t--jitter\tresolver: random latency variation in ms\n\t--client-rate\tresolver: queries/sec allowed per client IP\n\t--max-answer\tresolver: bigger answers are truncated (bytes)\n\t--block-types\tresolver: comma separated record types to refuse\n\t--strip-edns\tresolver: remove EDNS from the queries, answers are limited to 512 bytes\n\t--window\tclient: queries in flight of the transfer and of the goodput estimate (default: 1)\n\t--io\t\tserver: socket I/O, mmsg (recvmmsg/sendmmsg), epoll or plain (default: {0})\n\t--rcvbuf\tsocket receive buffer of the server/client in bytes\n\t--sndbuf\tsocket send buffer of the server/client in bytes\n\t--no-tcp\tserver/resolver: UDP only, client: skip the TCP checks\n\t--mtu\t\tresolver: answers that do not fit into one IP packet of this size are lost\n\t--metrics\tserver: serve live metrics for Prometheus on [IP:]port/metrics (default IP: 127.0.0.1)\n\t--results\tclient: save every check and probe to this JSON file\n\t--cache\t\tclient: keep the results in this JSON file and reuse the checks that worked\n\t--cache-ttl\tclient: seconds a cached check stays fresh (default: {1:.0f})\n\t--query-rate\tclient: queries/sec sent to a nameserver at most (default: no limit)\n\t--scan\t\tclient: check the resolvers listed in this file (IP or IP:port per line, - for stdin)\n\t--scan-workers\tclient: number of resolvers checked at the same time (default: 8)\n\t--retries\tclient: a lost query is sent again this many times (default: {2})\n\t--transfer\tclient: send data up and down through TYPE[:ENCODING] like a tunnel, e.g. TXT:raw\n\t--transfer-size\tclient: megabytes of the transfer in each direction (default: 1)\n\t--transfer-answer\tclient: answers of a transfer query as NUMxLENGTH (default: depends on the type)\n\t--transfer-upstream\tclient: encoding of the data in the query names (default: base32)".format(datagram_io.get_modes()[0], result_cache.DEFAULT_TTL, query_engine.MAX_RETRIES))
 
 	def run(self, argv):
 		sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', 0)
@@ -61,17 +165,154 @@ class Tester():
 				self.mode = 0
 			elif opt in ("-c", "--client"):
 				self.mode = 1
+			elif opt in ("-r", "--resolver"):
+				self.mode = 2
 			elif opt in ("--nameserver"):
 				self.nameserver = arg
 			elif opt in ("--domain"):
 				self.domain = arg
+			elif opt in ("--workers"):
+				self.workers = self.parse_number(opt, arg, int, 1)
+			elif opt in ("--loadtest"):
+				self.loadtest = True
+			elif opt in ("--load-types"):
+				self.load_types = [record_type.strip().upper() for record_type in arg.split(",") if record_type.strip()]
+				for record_type in self.load_types:
+					RRtype = self.DNS_proto.RR_types.get_by_name(record_type)
+					if not (RRtype and RRtype.servable):
+						internal_print("Record type {0} is not implemented".format(record_type), 1, -1)
+						self.usage()
+						sys.exit(-1)
+			elif opt in ("--rate-start"):
+				self.rate_start = self.parse_number(opt, arg, float, 0.1)
+			elif opt in ("--rate-step"):
+				self.rate_step = self.parse_number(opt, arg, float, 0.1)
+			elif opt in ("--rate-max"):
+				self.rate_max = self.parse_number(opt, arg, float, 0.1)
+			elif opt in ("--step-duration"):
+				self.step_duration = self.parse_number(opt, arg, float, 0.1)
+			elif opt in ("--latency-json"):
+				self.latency_json = arg
+			elif opt in ("--concurrency"):
+				self.concurrency = self.parse_number(opt, arg, int, 1)
+			elif opt in ("--port"):
+				self.port = self.parse_number(opt, arg, int, 1)
+				if self.port > 65535:
+					internal_print("Invalid value for {0}: {1}".format(opt, arg), 1, -1)
+					self.usage()
+					sys.exit(-1)
+			elif opt in ("--upstream"):
+				upstream = arg.split(":")
+				if len(upstream) == 1:
+					upstream.append("53")
+				if not ((len(upstream) == 2) and is_ipv4(upstream[0]) and upstream[1].isdigit() and (0 < int(upstream[1]) < 65536)):
+					internal_print("Upstream is not an IPv4 address and port, please correct", 1, -1)
+					self.usage()
+					sys.exit(-1)
+				self.upstream = (upstream[0], int(upstream[1]))
+			elif opt in ("--loss"):
+				self.impairments.loss = self.parse_number(opt, arg, float, 0)
+			elif opt in ("--delay"):
+				self.impairments.latency = self.parse_number(opt, arg, float, 0) / 1000.0
+			elif opt in ("--jitter"):
+				self.impairments.jitter = self.parse_number(opt, arg, float, 0) / 1000.0
+			elif opt in ("--client-rate"):
+				self.impairments.client_rate = self.parse_number(opt, arg, float, 0)
+			elif opt in ("--max-answer"):
+				self.impairments.max_answer = self.parse_number(opt, arg, int, 12)
+			elif opt in ("--block-types"):
+				self.impairments.blocked_types = [record_type.strip().upper() for record_type in arg.split(",") if record_type.strip()]
+				for record_type in self.impairments.blocked_types:
+					if not self.DNS_proto.RR_types.get_by_name(record_type):
+						internal_print("Unknown record type {0}".format(record_type), 1, -1)
+						self.usage()
+						sys.exit(-1)
+			elif opt in ("--strip-edns"):
+				self.impairments.strip_edns = True
+			elif opt in ("--window"):
+				self.window = self.parse_number(opt, arg, int, 1)
+			elif opt in ("--io"):
+				if arg not in datagram_io.get_modes():
+					internal_print("I/O mode {0} is not available, use one of: {1}".format(arg, ", ".join(datagram_io.get_modes())), 1, -1)
+					self.usage()
+					sys.exit(-1)
+				self.io_mode = arg
+			elif opt in ("--rcvbuf"):
+				self.rcvbuf = self.parse_number(opt, arg, int, 1)
+			elif opt in ("--sndbuf"):
+				self.sndbuf = self.parse_number(opt, arg, int, 1)
+			elif opt in ("--no-tcp"):
+				self.tcp = False
+			elif opt in ("--mtu"):
+				self.impairments.mtu = self.parse_number(opt, arg, int, 68)
+			elif opt in ("--metrics"):
+				address = arg.split(":")
+				if len(address) == 1:
+					address.insert(0, "127.0.0.1")
+				if not ((len(address) == 2) and is_ipv4(address[0]) and address[1].isdigit() and (0 < int(address[1]) < 65536)):
+					internal_print("Metrics address is not a port or an IPv4 address and port, please correct", 1, -1)
+					self.usage()
+					sys.exit(-1)
+				self.metrics_address = (address[0], int(address[1]))
+			elif opt in ("--results"):
+				self.results_json = arg
+			elif opt in ("--cache"):
+				self.cache_file = arg
+			elif opt in ("--cache-ttl"):
+				self.cache_ttl = self.parse_number(opt, arg, float, 0)
+			elif opt in ("--query-rate"):
+				self.query_rate = self.parse_number(opt, arg, float, 0.1)
+			elif opt in ("--scan"):
+				self.scan_file = arg
+			elif opt in ("--scan-workers"):
+				self.scan_workers = self.parse_number(opt, arg, int, 1)
+			elif opt in ("--retries"):
+				self.retries = self.parse_number(opt, arg, int, 0)
+			elif opt in ("--transfer"):
+				(record_type, encoding_name) = (arg.split(":") + [""])[:2]
+				self.transfer_type = record_type.strip().upper()
+				if self.transfer_type not in transfer.DEFAULT_ANSWERS:
+					internal_print("Transfer through {0} is not possible, use one of: {1}".format(self.transfer_type, ", ".join(sorted(transfer.DEFAULT_ANSWERS))), 1, -1)
+					self.usage()
+					sys.exit(-1)
+				# addresses are binary, names need an encoding that fits into
+				# labels
+				if self.transfer_type in estimator.FIXED_SIZES:
+					encodings = [encoding.Raw()]
+				elif self.transfer_type in estimator.NAME_TYPES:
+					encodings = encoding.NAME_ENCODINGS
+				else:
+					encodings = encoding.ENCODINGS
+				names = [encoding_class.get_name() for encoding_class in encodings]
+				encoding_name = encoding_name.strip().lower() or names[-1]
+				if encoding_name not in names:
+					internal_print("Encoding {0} cannot be used with {1}, use one of: {2}".format(encoding_name, self.transfer_type, ", ".join(names)), 1, -1)
+					self.usage()
+					sys.exit(-1)
+				self.transfer_encoding = encoding.get_by_name(encoding_name)
+			elif opt in ("--transfer-size"):
+				self.transfer_size = self.parse_number(opt, arg, float, 0.001)
+			elif opt in ("--transfer-answer"):
+				answer = arg.lower().split("x")
+				if not ((len(answer) == 2) and answer[0].isdigit() and answer[1].isdigit() and (0 < int(answer[0]) < 1000) and (0 < int(answer[1]) < 1000)):
+					internal_print("Transfer answer is not NUMxLENGTH, please correct", 1, -1)
+					self.usage()
+					sys.exit(-1)
+				self.transfer_answer = (int(answer[0]), int(answer[1]))
+			elif opt in ("--transfer-upstream"):
+				names = [encoding_class.get_name() for encoding_class in encoding.NAME_ENCODINGS]
+				if arg.strip().lower() not in names:
+					internal_print("Upstream encoding {0} cannot be used in names, use one of: {1}".format(arg, ", ".join(names)), 1, -1)
+					self.usage()
+					sys.exit(-1)
+				self.transfer_upstream = encoding.get_by_name(arg.strip().lower())
 
 		if not is_ipv4(self.nameserver):
 			internal_print("Nameserver is not an IPv4 address, please correct", 1, -1)
 			self.usage()
 			sys.exit(-1)
 
-		if not is_hostname(self.domain):
+		if (self.mode != 2) and not is_hostname(self.domain):
 			internal_print("Domain is not a proper domain name, please correct", 1, -1)
 			self.usage()
 			sys.exit(-1)
@@ -81,284 +322,1174 @@ class Tester():
 		try:
 			if not self.mode:
 				self.serve()
+			elif self.mode == 2:
+				self.resolve()
 			else:
-				self.connect()
+				failed = False
+				try:
+					if self.scan_file:
+						failed = self.scan()
+					elif self.transfer_type:
+						failed = self.transfer()
+					elif self.loadtest:
+						self.load_test()
+					else:
+						failed = self.connect()
+				finally:
+					self.report_latency()
+				if failed:
+					sys.exit(-1)
 		except KeyboardInterrupt:
 			internal_print("Exiting")
 
+	def parse_number(self, opt, arg, number_type, minimum):
+		try:
+			value = number_type(arg)
+		except ValueError:
+			value = None
+		if (value is None) or (value < minimum):
+			internal_print("Invalid value for {0}: {1}".format(opt, arg), 1, -1)
+			self.usage()
+			sys.exit(-1)
+
+		return value
+
 	def serve(self):
 		print("[*] Server mode started")
+		internal_print("Using {0} socket I/O".format(self.io_mode))
+		if self.tcp:
+			internal_print("Listening on UDP and TCP port {0}".format(self.port))
+		if self.metrics_address:
+			try:
+				metrics.Metrics_Server(self.metrics_address, self.collect_metrics).start()
+			except socket.error as e:
+				internal_print("Metrics endpoint cannot be started: {0}".format(e), 1, -1)
+				sys.exit(-1)
+			internal_print("Metrics on http://{0}:{1}/metrics".format(self.metrics_address[0], self.metrics_address[1]))
+
+		if self.workers > 1:
+			self.supervise()
+			return
 
+		stats = [0] * len(SERVER_STATS)
+		self.server_stats = stats
+		try:
+			self.serve_loop(self.create_server_socket(False), self.create_tcp_socket(False), stats)
+		finally:
+			self.print_server_stats(stats, 0)
+
+	def create_server_socket(self, reuseport):
 		server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 		server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-		server_tuple = ("0.0.0.0", 53)
+		if reuseport:
+			# Python 2 does not export the constant, 15 is the Linux value
+			server_socket.setsockopt(socket.SOL_SOCKET, getattr(socket, "SO_REUSEPORT", 15), 1)
+		server_tuple = ("0.0.0.0", self.port)
 		server_socket.bind(server_tuple)
 
+		(rcvbuf, sndbuf) = datagram_io.set_buffer_sizes(server_socket, self.rcvbuf, self.sndbuf)
+		# Linux reports twice the size that was set. Every worker has a
+		# socket, the limit is only reported once.
+		if (not self.buffers_checked) and ((self.rcvbuf and (rcvbuf < self.rcvbuf)) or (self.sndbuf and (sndbuf < self.sndbuf))):
+			internal_print("Socket buffers are limited to {0}/{1} bytes, see net.core.rmem_max and net.core.wmem_max".format(rcvbuf, sndbuf), 1, -1)
+		self.buffers_checked = True
+
+		return server_socket
+
+	def create_tcp_socket(self, reuseport):
+		if not self.tcp:
+			return None
+
+		return dns_tcp.create_listener(("0.0.0.0", self.port), reuseport)
+
+	def supervise(self):
+		internal_print("Starting {0} worker processes".format(self.workers))
+
+		# the sockets are owned by the supervisor, so a restarted worker takes
+		# over the same slot in the kernel's SO_REUSEPORT group
+		sockets = [self.create_server_socket(True) for i in xrange(self.workers)]
+		tcp_sockets = [self.create_tcp_socket(True) for i in xrange(self.workers)]
+		stats = [multiprocessing.Array("L", len(SERVER_STATS), lock=False) for i in xrange(self.workers)]
+		self.server_stats = stats
+		if self.metrics_address:
+			self.metrics_queue = multiprocessing.Queue()
+		workers = [None] * self.workers
+
+		try:
+			while True:
+				for i in xrange(self.workers):
+					if workers[i]:
+						if workers[i].is_alive() or (workers[i].exitcode == 0):
+							continue
+						internal_print("Worker {0} died with exit code {1}, restarting".format(i, workers[i].exitcode), 1, -1)
+						self.restarts += 1
+						# the new worker starts from zero
+						if i in self.worker_metrics:
+							self.retired_metrics = [metrics.merge(self.retired_metrics + [self.worker_metrics.pop(i)])]
+					workers[i] = multiprocessing.Process(target=self.serve_worker, args=(sockets[i], tcp_sockets[i], stats[i], i))
+					workers[i].daemon = True
+					workers[i].start()
+				self.receive_metrics(1.0)
+		finally:
+			for worker in workers:
+				if worker and worker.is_alive():
+					worker.terminate()
+			for worker in workers:
+				if worker:
+					worker.join()
+
+			total = [0] * len(SERVER_STATS)
+			for worker_stats in stats:
+				for i in xrange(len(SERVER_STATS)):
+					total[i] += worker_stats[i]
+			self.print_server_stats(total, self.restarts)
+
+	def resolve(self):
+		internal_print("Resolver mode started")
+		internal_print("Forwarding from port {0} to {1}:{2}".format(self.port, self.upstream[0], self.upstream[1]))
+		if (self.port == self.upstream[1]) and (self.upstream[0] in ("127.0.0.1", "0.0.0.0")):
+			internal_print("The resolver would forward to itself, use a different --port or --upstream", 1, -1)
+			sys.exit(-1)
+
+		impaired_resolver = resolver.Impaired_Resolver(("0.0.0.0", self.port), self.upstream, self.impairments, self.tcp)
+		try:
+			impaired_resolver.serve()
+		finally:
+			impaired_resolver.print_stats()
+
+	# the latest snapshot of every worker, waits up to timeout seconds
+	def receive_metrics(self, timeout):
+		if not self.metrics_queue:
+			time.sleep(timeout)
+			return
+
+		deadline = monotonic() + timeout
 		while True:
-			raw_message, addr = server_socket.recvfrom(4096)
-			if not self.DNS_proto.is_valid_dns(raw_message, self.domain):
-				internal_print("Some garbage was received, not DNS query", 1, -1)
+			try:
+				(index, snapshot) = self.metrics_queue.get(True, max(0.0, deadline - monotonic()))
+			except Queue.Empty:
+				return
+			self.worker_metrics[index] = snapshot
+
+	def publish_metrics(self):
+		if not self.metrics_queue:
+			return
+		now = monotonic()
+		if now < self.next_publish:
+			return
+		self.next_publish = now + 1.0
+		self.metrics_queue.put((self.metrics_index, self.metrics.snapshot()))
+
+	# text of the metrics endpoint, called from its thread
+	def collect_metrics(self):
+		if self.workers > 1:
+			snapshot = metrics.merge(self.retired_metrics + list(self.worker_metrics.values()))
+			totals = [sum([worker_stats[i] for worker_stats in self.server_stats]) for i in xrange(len(SERVER_STATS))]
+		else:
+			snapshot = self.metrics.snapshot()
+			totals = list(self.server_stats)
+
+		counters = [("server_" + SERVER_STATS[i].lower().replace(" ", "_") + "_total", "Server statistics: {0}.".format(SERVER_STATS[i]), totals[i]) for i in xrange(len(totals))]
+		counters.append(("worker_restarts_total", "Restarted worker processes.", self.restarts))
+		gauges = [("workers", "Worker processes.", self.workers), ("start_time_seconds", "Start time of the server since the epoch.", self.start_time)]
+
+		return metrics.exposition(snapshot, counters, gauges)
+
+	def serve_worker(self, server_socket, tcp_socket, stats, index):
+		# forked workers inherit the parent's payload pool
+		self.payload.refill()
+		self.metrics = metrics.Server_Metrics()
+		self.metrics_index = index
+		if self.metrics_queue:
+			# a full queue must not keep the worker from exiting
+			self.metrics_queue.cancel_join_thread()
+		try:
+			self.serve_loop(server_socket, tcp_socket, stats)
+		except KeyboardInterrupt:
+			pass
+
+	def print_server_stats(self, stats, restarts):
+		print("")
+		internal_print("Server statistics:")
+		for i in xrange(len(SERVER_STATS)):
+			internal_print("{0}: {1}".format(SERVER_STATS[i], stats[i]))
+		if self.workers > 1:
+			internal_print("worker restarts: {0}".format(restarts))
+
+	def serve_loop(self, server_socket, tcp_socket, stats):
+		io = datagram_io.Datagram_IO(server_socket, self.io_mode)
+		if not tcp_socket:
+			while True:
+				self.answer_datagrams(io, io.receive(1.0), stats)
+				self.publish_metrics()
+
+		# the UDP socket, the TCP listener and the connections are waited for
+		# together
+		poller = Poller()
+		poller.register(server_socket.fileno())
+		streams = dns_tcp.Stream_Server(tcp_socket, lambda raw_message, connection: self.answer_stream(raw_message, connection.address, stats), poller)
+		next_expiry = monotonic() + 1.0
+		while True:
+			for (fd, readable, writable) in poller.poll(1.0):
+				if fd == server_socket.fileno():
+					self.answer_datagrams(io, io.drain(), stats)
+					continue
+				(answered, failed) = (streams.answered, streams.failed)
+				streams.handle(fd, readable, writable)
+				stats[1] += streams.answered - answered
+				# e.g. bigger than 64KB
+				stats[3] += streams.failed - failed
+				if streams.failed - failed:
+					self.metrics.error("send failed", streams.failed - failed)
+			now = monotonic()
+			if now >= next_expiry:
+				streams.expire(now)
+				next_expiry = now + 1.0
+			stats[7] = streams.accepted
+			stats[8] = streams.queries
+			self.publish_metrics()
+
+	def answer_datagrams(self, io, packets, stats):
+		for (raw_message, addr) in packets:
+			stats[0] += 1
+			packet = self.answer_query(raw_message, addr, "udp", stats)
+			if packet and io.queue(packet, addr):
+				self.flush_answers(io, stats)
+		# the answers of a batch go out together
+		self.flush_answers(io, stats)
+		stats[6] = io.batches
+
+	def answer_stream(self, raw_message, address, stats):
+		stats[0] += 1
+
+		return self.answer_query(raw_message, address, "tcp", stats)
+
+	def flush_answers(self, io, stats):
+		(sent, failed) = io.flush()
+		stats[1] += sent
+		if failed:
+			# e.g. bigger than the largest UDP datagram
+			stats[3] += failed
+			self.metrics.error("send failed", failed)
+			internal_print("{0} answer(s) could not be sent.".format(failed), 1, -1)
+
+	# answer to one query or None if it is not answered, address and
+	# transport are counted in the metrics
+	def answer_query(self, raw_message, address, transport, stats):
+		message = self.DNS_proto.parse_message(raw_message, self.domain)
+		if not message:
+			stats[2] += 1
+			self.metrics.error("garbage")
+			internal_print("Some garbage was received, not DNS query", 1, -1)
+			return None
+		if not message.is_query:
+			stats[2] += 1
+			self.metrics.error("not a query")
+			internal_print("DNS answer instead of query, strange!?", 1, -1)
+			return None
+
+		qtype = message.questions[0].type
+		if qtype in self.DNS_proto.RR_types:
+			self.metrics.query(self.DNS_proto.RR_types[qtype][0], transport, address)
+		else:
+			self.metrics.query(str(qtype), transport, address)
+
+		name = message.questions[0].name
+		if len(name)>5:
+			try:
+				num = int(name[0:3])
+				length = int(name[3:6])
+			except ValueError:
+				stats[3] += 1
+				self.metrics.error("invalid request")
+				return None
+			record_type = name[6:].split(".")[0].upper()
+			encoding_class = None
+			upstream_class = None
+			if "-" in record_type:
+				# encoding check, e.g. 001100TXT-BASE64, or a transfer query
+				# with the encoding of the name and a tag, e.g.
+				# 001200TXT-RAW-BASE32-1A2B3C000001R0
+				parts = record_type.split("-")
+				(record_type, encoding_name) = parts[:2]
+				encoding_class = encoding.get_by_name(encoding_name.lower())
+				if len(parts) == 4:
+					upstream_class = encoding.get_by_name(parts[2].lower())
+				if (not encoding_class) or ((len(parts) != 2) and not upstream_class):
+					stats[3] += 1
+					self.metrics.error("invalid encoding")
+					internal_print("Invalid encoding requested.", 1, -1)
+					return None
+			RRtype = self.DNS_proto.RR_types.get_by_name(record_type)
+			if not RRtype:
+				stats[3] += 1
+				self.metrics.error("invalid record type")
+				internal_print("Invalid record type requested.", 1, -1)
+				return None
+			if not RRtype.servable:
+				stats[3] += 1
+				self.metrics.error("not implemented")
+				internal_print("Record type not implemented yet.", 1, -1)
+				return None
+
+			try:
+				if upstream_class:
+					packet = self.build_transfer_answer(message, record_type, RRtype, num, length, encoding_class, upstream_class)
+					if not packet:
+						stats[3] += 1
+						self.metrics.error("corrupt transfer data")
+						internal_print("Transfer data was changed on the way.", 1, -1)
+						return None
+				elif encoding_class:
+					packet = self.build_encoded_answer(message, record_type, RRtype, num, length, encoding_class)
+				else:
+					packet = self.answer_cache.build_answer(message.transaction_id, record_type, RRtype, num, length, self.domain, message.orig_question)
+			except Exception:
+				# e.g. TXT string or label longer than the field allows, a
+				# broken builder must not stop the server either
+				stats[3] += 1
+				self.metrics.error("cannot be built")
+				internal_print("Answer cannot be built for this request.", 1, -1)
+				return None
+			stats[4] = self.answer_cache.hits
+			stats[5] = self.answer_cache.misses
+			self.metrics.answer(len(packet), address)
+			return packet
+
+		self.metrics.error("invalid request")
+		return None
+
+	# answer of an encoding check: test data derived from the random part of
+	# the name in the requested encoding, or for A the digest of the data
+	# that was sent up encoded in the name
+	def build_encoded_answer(self, message, record_type, RRtype, num, length, encoding_class):
+		name = message.questions[0].name
+		random_string = name[len(name.split(".")[0])+1:len(name)-len(self.domain)].replace(".", "")
+		if record_type == "A":
+			try:
+				data = encoding.digest(encoding_class.decode(random_string))
+			except ValueError:
+				data = "\x00" * 4
+		else:
+			data = encoding_class.encode(encoding.test_data(random_string.lower(), encoding_class.get_maximum_length(length)))
+
+		return self.DNS_proto.build_answer(message.transaction_id, [record_type, "", [RRtype.packer(data)] * num, num, self.domain], message.orig_question)
+
+	# answer of a transfer query: the chunk in the name is checked, the
+	# answers carry test data derived from the name and the acknowledgement
+	# of the chunk. None if the chunk was changed on the way.
+	def build_transfer_answer(self, message, record_type, RRtype, num, length, encoding_class, upstream_class):
+		name = message.questions[0].name
+		first_label = name.split(".")[0]
+		random_string = name[len(first_label)+1:len(name)-len(self.domain)].replace(".", "")
+		try:
+			chunk = upstream_class.decode(random_string)
+		except ValueError:
+			return None
+		if encoding.open_chunk(chunk) is None:
+			return None
+
+		blocks = encoding.transfer_blocks((first_label + "." + random_string).lower(), chunk, num, encoding_class.get_maximum_length(length))
+		answers = [RRtype.packer(encoding_class.encode(block)) for block in blocks]
+
+		return self.DNS_proto.build_answer(message.transaction_id, [record_type, "", answers, num, self.domain], message.orig_question)
+
+	def create_engine(self):
+		server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		datagram_io.set_buffer_sizes(server_socket, self.rcvbuf, self.sndbuf)
+		server_tuple = (self.nameserver, self.port)
+		self.engine = query_engine.Query_Engine(self.DNS_proto, self.domain, server_socket, server_tuple, 2.0, self.payload, retries=self.retries)
+		if self.query_rate:
+			self.engine.set_rate(self.query_rate)
+
+	def load_test(self):
+		internal_print("Load test mode started")
+		internal_print("Using {0} as DNS server".format(self.nameserver))
+		self.create_engine()
+
+		generator = load_generator.Load_Generator(self.engine, self.rate_start, self.rate_step, self.rate_max, self.step_duration)
+		knees = []
+		for record_type in self.load_types:
+			print("")
+			internal_print("Load test with record type {0}:".format(record_type))
+			(steps, knee) = generator.find_knee(record_type, self.print_load_step)
+			knees.append((record_type, knee))
+
+		print("")
+		for (record_type, knee) in knees:
+			if knee is None:
+				internal_print("{0}: no drops up to {1:.0f} queries/sec".format(record_type, self.rate_max), 1, 1)
+			elif knee:
+				internal_print("{0}: drops or refusals start above {1:.1f} queries/sec".format(record_type, knee), 1, -1)
+			else:
+				internal_print("{0}: already failing at {1:.1f} queries/sec".format(record_type, self.rate_start), 1, -1)
+
+	def print_load_step(self, record_type, step):
+		if step.avg_rtt is None:
+			latency = "no answers"
+		else:
+			latency = "avg RTT {0:.1f}ms, max RTT {1:.1f}ms".format(step.avg_rtt*1000, step.max_rtt*1000)
+		if (step.ratio < 0.90) or step.errors:
+			feedback = -1
+		else:
+			feedback = 1
+		internal_print("{0:.1f} qps (sent {1:.1f} qps): {2}/{3} answered ({4:.1f}%), {5} lost, {6} errors, {7}".format(step.rate, step.achieved, step.answered, step.sent, step.ratio*100, step.lost, step.errors, latency), 1, feedback)
+
+	def transfer(self):
+		internal_print("Transfer mode started")
+		internal_print("Using {0} as DNS server".format(self.nameserver))
+		self.create_engine()
+		# the answers are bigger than 512 bytes
+		self.DNS_proto.set_edns(1)
+
+		(num, length) = self.transfer_answer or transfer.DEFAULT_ANSWERS[self.transfer_type]
+		if self.transfer_type in estimator.FIXED_SIZES:
+			length = estimator.FIXED_SIZES[self.transfer_type]
+		size = int(self.transfer_size * 1024 * 1024)
+		emulator = transfer.Tunnel_Transfer(self.engine, self.domain, self.transfer_type, self.transfer_encoding, self.transfer_upstream, num, length, size, self.window)
+		if not emulator.usable():
+			internal_print("The query names or the answers are too short to carry data", 1, -1)
+			return True
+		internal_print("Sending {0} bytes up ({1} bytes in {2} per query name) and down ({3} bytes in {4} {5} answer(s) of {6} {7} characters), {8} queries in flight".format(size,
+			emulator.chunk_size, self.transfer_upstream.get_name(), emulator.block_size, num, self.transfer_type, length, self.transfer_encoding.get_name(), self.window))
+
+		result = emulator.run()
+
+		print("")
+		for (direction, elapsed, carried) in (("up", result.upstream_time, result.chunk_size), ("down", result.downstream_time, result.block_size)):
+			if elapsed is None:
+				internal_print("Transfer {0}: not finished".format(direction), 1, -1)
+			else:
+				internal_print("Transfer {0}: {1} bytes in {2:.2f}s, {3:.1f} kB/s goodput ({4} bytes per query)".format(direction, result.size, elapsed, result.size / elapsed / 1024, carried), 1, 1)
+		internal_print("{0} queries, {1} retransmissions, {2} queries sent again under a new name, {3} without an answer".format(result.queries, result.retransmissions,
+			result.resends, result.unanswered))
+		internal_print("{0} late answer(s), {1} duplicate(s), {2} reordered, {3} failed the integrity check".format(result.late, result.duplicates, result.reordered, result.corrupt))
+		if result.complete:
+			internal_print("Every byte arrived unchanged in both directions", 1, 1)
+		elif result.truncated:
+			internal_print("The answers of {0} {1} record(s) of {2} characters were truncated on the way, the transfer stopped".format(num, self.transfer_type, length), 1, -1)
+			fitting = emulator.fitting_answer()
+			if fitting:
+				internal_print("Try smaller answers with --transfer-answer, e.g. {0}x{1} fits into {2} bytes".format(fitting[0], fitting[1], transfer.CLASSIC_SIZE), 1, -1)
+			else:
+				internal_print("Try another record type with smaller answers (--transfer)", 1, -1)
+		else:
+			internal_print("The transfer gave up after {0} tries of a query".format(transfer.MAX_RESENDS + 1), 1, -1)
+
+		if self.results_json:
+			try:
+				f = open(self.results_json, "w")
+				json.dump({"nameserver": self.nameserver, "port": self.port, "domain": self.domain, "record_type": self.transfer_type, "encoding": self.transfer_encoding.get_name(),
+					"upstream_encoding": self.transfer_upstream.get_name(), "num": num, "length": length, "window": self.window, "transfer": result._asdict(),
+					"transmissions": self.engine.transmission_stats()}, f, indent=4, sort_keys=True)
+				f.close()
+				internal_print("Results saved to {0}".format(self.results_json), 1, 1)
+			except (IOError, ValueError) as e:
+				internal_print("Could not save the results: {0}".format(e), 1, -1)
+
+		return not result.complete
+
+	# IP or IP:port per line, # starts a comment
+	def read_resolvers(self):
+		try:
+			if self.scan_file == "-":
+				lines = sys.stdin.readlines()
+			else:
+				f = open(self.scan_file, "r")
+				lines = f.readlines()
+				f.close()
+		except IOError as e:
+			internal_print("Could not read the resolver list: {0}".format(e), 1, -1)
+			sys.exit(-1)
+
+		resolvers = []
+		for line in lines:
+			line = line.split("#")[0].strip()
+			if not line:
 				continue
-			(transaction_id_received, queryornot, qtype, nquestions, questions, orig_question, nanswers, answers) = self.DNS_proto.parse_dns(raw_message, self.domain)
-			if not queryornot:
-				internal_print("DNS answer instead of query, strange!?", 1, -1)
+			address = line.split(":")
+			if len(address) == 1:
+				address.append(str(self.port))
+			if not ((len(address) == 2) and is_ipv4(address[0]) and address[1].isdigit() and (0 < int(address[1]) < 65536)):
+				internal_print("Skipping {0}, not an IPv4 address or address and port".format(line), 1, -1)
 				continue
+			if (address[0], int(address[1])) not in resolvers:
+				resolvers.append((address[0], int(address[1])))
 
-			if nquestions:
-				if len(questions[0]["name"])>5:
-					try:
-						num = int(questions[0]["name"][0:3])
-						length = int(questions[0]["name"][3:6])
-					except ValueError:
-						continue
-					record_type = questions[0]["name"][6:].split(".")[0].upper()
-					qtype = self.DNS_proto.reverse_RR_type_num(record_type)
-					if qtype in self.DNS_proto.RR_types:
-						if not self.DNS_proto.RR_types[qtype][1]:
-							internal_print("Record type not implemented yet.", 1, -1)
-							continue
-					else:
-						internal_print("Invalid record type requested.", 1, -1)
+		return resolvers
+
+	# Every resolver is checked in a process of its own, scan_workers at the
+	# same time. The results are printed and saved as soon as a resolver is
+	# done, --results gets one JSON document per line.
+	def scan(self):
+		resolvers = self.read_resolvers()
+		if not resolvers:
+			internal_print("No resolver to scan", 1, -1)
+			return True
+		internal_print("Scanning {0} resolver(s), {1} at the same time".format(len(resolvers), min(self.scan_workers, len(resolvers))))
+		if self.query_rate:
+			internal_print("At most {0:.1f} queries/sec to each resolver".format(self.query_rate))
+
+		output = None
+		if self.results_json:
+			try:
+				output = open(self.results_json, "w")
+			except IOError as e:
+				internal_print("Could not save the results: {0}".format(e), 1, -1)
+				return True
+		if self.cache_file:
+			self.load_cache()
+
+		self.scan_queue = multiprocessing.Queue()
+		waiting = list(resolvers)
+		running = {}
+		finished = 0
+		failed = 0
+		try:
+			while waiting or running:
+				while waiting and (len(running) < self.scan_workers):
+					address = waiting.pop(0)
+					running[address] = multiprocessing.Process(target=self.scan_resolver, args=(address, ))
+					running[address].daemon = True
+					running[address].start()
+
+				# A worker puts its results on the queue before it exits with 0,
+				# any other exit code means it died without them. It is noticed
+				# at once, so its slot does not wait for a quiet queue. One that
+				# was gone with 0 before a second without results did not send
+				# any either.
+				gone = [address for (address, process) in running.items() if not process.is_alive()]
+				died = [address for address in gone if running[address].exitcode != 0]
+				try:
+					result = self.scan_queue.get(True, 1.0)
+				except Queue.Empty:
+					result = None
+					died = gone
+				for address in died:
+					if (address not in running) or (result and (result[0] == address)):
 						continue
+					process = running.pop(address)
+					process.join()
+					finished += 1
+					failed += 1
+					internal_print("[{0}/{1}] {2}:{3}: check died with exit code {4}".format(finished, len(resolvers), address[0], address[1], process.exitcode), 1, -1)
+				if not result:
+					continue
+
+				(address, document, entries) = result
+				if address not in running:
+					# reported as died already
+					continue
+				running.pop(address).join()
+				finished += 1
+				if not self.print_scan_result(finished, len(resolvers), address, document):
+					failed += 1
+				if entries is not None:
+					self.cache.resolvers[result_cache.cache_key(address[0], address[1], self.domain)] = entries
+				if output:
+					output.write(json.dumps(document, sort_keys=True) + "\n")
+					output.flush()
+		finally:
+			for process in running.values():
+				process.terminate()
+				process.join()
+			if output:
+				output.close()
+			if self.cache:
+				try:
+					self.cache.save()
+				except (IOError, OSError) as e:
+					internal_print("Could not save the result cache: {0}".format(e), 1, -1)
+
+		print("")
+		text = "Scan finished: {0} of {1} resolver(s) passed the basic checks".format(len(resolvers) - failed, len(resolvers))
+		if failed:
+			internal_print(text, 1, -1)
+		else:
+			internal_print(text, 1, 1)
+		if self.results_json:
+			internal_print("Results saved to {0}".format(self.results_json), 1, 1)
 
-					RRtype = self.DNS_proto.RR_types[qtype]
-					encoded_text = []
-					for i in xrange(num):
-						 pre_text = "".join([random.choice(self.alphabet) for i in xrange(length)])
-						 encoded_text.append(RRtype[2](pre_text))
-					packet = self.DNS_proto.build_answer(transaction_id_received, [record_type, "", encoded_text, num, self.domain], orig_question)
-					server_socket.sendto(packet, addr)
+		return bool(failed)
 
+	# runs in the process of one resolver, the output is only the summary
+	# line printed by the scan
+	def scan_resolver(self, address):
+		signal.signal(signal.SIGINT, signal.SIG_IGN)
+		sys.stdout = open(os.devnull, "w")
+		(self.nameserver, self.port) = address
+		self.scanning = True
+		self.start_time = time.time()
+
+		error = None
+		try:
+			self.connect()
+		except Exception as e:
+			error = str(e)
+		document = self.results or {"nameserver": self.nameserver, "port": self.port, "domain": self.domain, "started": self.start_time, "finished": time.time(),
+			"checks": [], "summary": {}}
+		document["error"] = error
+		entries = None
+		if self.cache and self.cache.key:
+			entries = self.cache.resolvers.get(self.cache.key)
+		self.scan_queue.put((address, document, entries))
+
+	# one line per resolver, returns False if a critical check failed
+	def print_scan_result(self, finished, total, address, document):
+		prefix = "[{0}/{1}] {2}:{3} ({4:.1f}s): ".format(finished, total, address[0], address[1], document["finished"] - document["started"])
+		if document["error"]:
+			internal_print(prefix + "error: {0}".format(document["error"]), 1, -1)
+			return False
+		checks = dict([(check["name"], check) for check in document["checks"]])
+		# the first one that failed, the critical checks after it were skipped
+		failed = [check["name"] for check in document["checks"] if check["critical"] and (check["state"] == "done") and not check["result"]]
+		if failed:
+			internal_print(prefix + "{0} failed".format(", ".join(failed)), 1, -1)
+			return False
+
+		worked = [check for check in document["checks"] if check["result"]]
+		text = "{0}/{1} checks worked".format(len(worked), len(document["checks"]))
+		cached = [check for check in document["checks"] if check["cached"] and (check["state"] == "done")]
+		if cached:
+			text += " ({0} cached)".format(len(cached))
+		if checks.get("EDNS", {}).get("result"):
+			text += ", EDNS buffer {0}".format(document["summary"]["edns_size"])
+		else:
+			text += ", no EDNS"
+		if "TCP" in checks:
+			if checks["TCP"]["result"]:
+				text += ", TCP"
+			else:
+				text += ", no TCP"
+		estimates = checks.get("estimate", {}).get("summary", {}).get("estimates")
+		if estimates:
+			text += ", fastest: {0} ~{1:.1f} kB/s down".format(estimates[0]["record_type"], estimates[0]["downstream_rate"]/1024)
+		internal_print(prefix + text, 1, 1)
+
+		return True
 
 	def connect(self):
 		internal_print("Client mode started")
 		internal_print("Using {0} as DNS server".format(self.nameserver))
+		self.create_engine()
+		if self.results_json or self.cache_file:
+			self.engine.recorder = self.record_probe
 
-		server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-		server_socket.settimeout(2.0)
-		server_tuple = (self.nameserver, 53)
+		# checks that worked in an earlier run are not repeated while fresh
+		restore = None
+		if self.cache_file:
+			if not self.cache:
+				self.load_cache()
+			self.cache.key = result_cache.cache_key(self.nameserver, self.port, self.domain)
+			restore = self.restore_check
+
+		# every check is a task, independent checks run at the same time
+		tasks = scheduler.Probe_Scheduler(self.engine, self.concurrency, restore)
 
 		# record A test
-		record_type = "A"
-		if not self.query(True, server_socket, server_tuple, record_type, record_type, 1, 4, 15, 0):
-			internal_print("Basic test failed. Either you network is lossy or the DNS server does not work.", 1, -1)
-			sys.exit(-1)
+		basic_A = tasks.add("basic A", self.check_query, (query_engine.Probe("A", "A", 1, 4, 15, 0), None,
+			"Basic test failed. Either you network is lossy or the DNS server does not work."), critical=True)
 
-		
 		#rate limit test 1
-		print("")
-		num = 30
-		success = 0
-		internal_print("Testing for rate limitation with record type {0}/{1} packets: ".format(record_type, num), 0)
-		for i in xrange(num):
-			if self.query(False, server_socket, server_tuple, record_type, record_type, 1, 4, 15, 0):
-				success += 1
-				internal_dot_print(True)
-			else:
-				internal_dot_print(False)
-		print("")
-		# hard coded 90%, made up number
-		if (success/num)>0.90:
-			internal_print("{0}% packet loss".format(100-(success/num*100)), 1, 1)
-		else:
-			internal_print("{0}% packet loss, lossy network or rate limit in place".format(100-(success/num*100)), 1, -1)
-			internal_print("The following results might be incorrect", 1, -1)
+		tasks.add("rate limit A", self.check_rate_limit, ("A", 30, "{0:.1f}% packet loss"), depends=[basic_A])
 
 		# record A test with CNAME response
-		internal_print("Testing A record type with CNAME answer: ", 0, 0)
-		if self.query(False, server_socket, server_tuple, "A", "CNAME", 1, 4, 15, 0):
-			internal_print("Supported!", 1, 1)
-		else:
-			internal_print("Basic test failed. Either you network is lossy or the DNS does not work properly.", 1, -1)
-			sys.exit(-1)
+		A_CNAME = tasks.add("A with CNAME", self.check_query, (query_engine.Probe("A", "CNAME", 1, 4, 15, 0), "Testing A record type with CNAME answer: ",
+			"Basic test failed. Either you network is lossy or the DNS does not work properly."), depends=[basic_A], critical=True)
 
 		# record CNAME test
-		record_type = "CNAME"
-		if not self.query(True, server_socket, server_tuple, record_type, record_type, 1, 10, 15, 0):
-			internal_print("CNAME record did not work. Exiting.", 1, -1)
-			sys.exit(-1)
-		
+		basic_CNAME = tasks.add("basic CNAME", self.check_query, (query_engine.Probe("CNAME", "CNAME", 1, 10, 15, 0), None,
+			"CNAME record did not work. Exiting."), depends=[A_CNAME], critical=True)
 
 		#rate limit test 2
-		print("")
-		num = 50
+		tasks.add("rate limit CNAME", self.check_rate_limit, ("CNAME", 50, "{0:.1f}% packet loss. Tunnelling could work."), depends=[basic_CNAME])
+
+		# EDNS test
+		edns = tasks.add("EDNS", self.check_edns, depends=[basic_CNAME])
+
+		# the EDNS buffer size that gets the biggest answers through
+		edns_size = tasks.add("EDNS size", self.check_edns_size, depends=[edns])
+
+		# long domain name
+		long_domain = tasks.add("long domain name", self.check_query, (query_engine.Probe("CNAME", "CNAME", 1, 10, 100, 0), "Testing for long domain names in request: ",
+			"Long domain names are not allowed. Exiting."), depends=[basic_CNAME], critical=True)
+
+		record_types = []
+		for (record_type, length) in (("TXT", 10), ("PRIVATE", 10), ("NULL", 10), ("MX", 10), ("SRV", 10), ("DNSKEY", 10), ("RRSIG", 128)):
+			task = tasks.add(record_type, self.check_query, (query_engine.Probe(record_type, record_type, 1, length, 15, 0), None, None), depends=[basic_A])
+			record_types.append((record_type, task))
+
+		# DNS over TCP with several queries pipelined on one connection
+		tcp = None
+		if self.tcp:
+			tcp = tasks.add("TCP", self.check_tcp, depends=[basic_CNAME])
+
+		# largest answers, the EDNS searches only if EDNS works, the TCP
+		# searches only if TCP works
+		capacity = tasks.add("capacity", self.check_capacity, (edns, tcp, record_types), depends=[basic_CNAME], after=[edns, edns_size] + [task for task in [tcp] if task] + [task for (record_type, task) in record_types])
+
+		# encodings that survive in the query name and in the answers
+		encodings = tasks.add("encodings", self.check_encodings, ([("CNAME", basic_CNAME)] + record_types, ), depends=[basic_CNAME], after=[task for (record_type, task) in record_types])
+
+		# the same queries over UDP and TCP, when nothing else is running
+		throughput = None
+		if tcp:
+			throughput = tasks.add("throughput", self.check_throughput, depends=[tcp], after=[capacity, encodings])
+
+		# the same small query for every record type that got answers
+		round_trip = tasks.add("round trip", self.check_round_trip, depends=[capacity], after=[encodings] + [task for task in [throughput] if task])
+
+		# estimated tunnel speed from everything above, always recalculated.
+		# It waits for all checks, so a run from the cache gives the same
+		# estimate.
+		tasks.add("estimate", self.check_goodput, (edns, ), depends=[capacity, long_domain, round_trip], after=[encodings] + [task for task in [throughput] if task] +
+			[task for task in tasks.tasks if task.name.startswith("rate limit")], cache=False)
+
+		# the results are saved even if a critical check failed or the run
+		# was interrupted
+		try:
+			failed = tasks.run()
+		finally:
+			self.save_results(tasks)
+
+		return bool(failed)
+
+	def load_cache(self):
+		self.cache = result_cache.Result_Cache(self.cache_file, None, self.cache_ttl)
+		try:
+			self.cache.load()
+		except (IOError, ValueError) as e:
+			internal_print("Could not read the result cache, all checks run again: {0}".format(e), 1, -1)
+
+	def record_probe(self, probe):
+		self.probe_records.setdefault(probe.phase, []).append(result_cache.probe_record(probe))
+
+	# takes the check from the cache: its measurements, output and probes
+	def restore_check(self, task):
+		entry = self.cache.lookup(task.name)
+		if not entry:
+			return False
+
+		summary = entry.get("summary", {})
+		if "name_length" in summary:
+			self.max_name_length = max(self.max_name_length, summary["name_length"])
+		if "loss" in summary:
+			self.loss = max(self.loss, summary["loss"])
+		if summary.get("edns_size"):
+			self.DNS_proto.set_edns_size(summary["edns_size"])
+			if summary.get("edns_limit"):
+				self.edns_limit = summary["edns_limit"]
+		if "capacity" in summary:
+			self.capacity_results = [capacity_search.Search_Result(**result) for result in summary["capacity"]]
+		if "encodings" in summary:
+			self.encodings = dict([(name, encoding.get_by_name(encoding_name)) for (name, encoding_name) in summary["encodings"].items()])
+			self.upstream_encoding = encoding.get_by_name(summary.get("upstream_encoding"))
+
+		task.result = entry["result"]
+		task.summary = summary
+		task.output = [(kind, tuple(args)) for (kind, args) in entry.get("output", [])]
+		task.cached = True
+		task.finished_at = entry.get("time")
+		# the old round trip times count for the estimate and the report
+		self.probe_records[task.name] = entry.get("probes", [])
+		for record in self.probe_records[task.name]:
+			self.engine.latency.record(task.name, record["answer_type"], record["rtt"])
+
+		return True
+
+	def save_results(self, tasks):
+		checks = [result_cache.check_record(task, self.probe_records.get(task.name, [])) for task in tasks.tasks]
+
+		if self.cache:
+			for (task, record) in zip(tasks.tasks, checks):
+				if task.cache and (task.state == "done") and not task.cached:
+					self.cache.update(task.name, record)
+
+		summary = {
+			"loss": self.loss,
+			"max_name_length": self.max_name_length,
+			"edns_size": self.DNS_proto.edns_size,
+			"edns_limit": self.edns_limit,
+			"capacity": [result._asdict() for result in self.capacity_results],
+			"encodings": dict([(name, encoding_class.get_name()) for (name, encoding_class) in self.encodings.items()]),
+			"upstream_encoding": None,
+		}
+		if self.upstream_encoding:
+			summary["upstream_encoding"] = self.upstream_encoding.get_name()
+		summary["transmissions"] = self.engine.transmission_stats()
+		self.results = {"nameserver": self.nameserver, "port": self.port, "domain": self.domain, "started": self.start_time, "finished": time.time(),
+			"checks": checks, "summary": summary}
+		# the scan collects the results and the cache entries of every resolver
+		if self.scanning:
+			return
+
+		if self.cache:
+			if self.cache.hits:
+				internal_print("{0} check(s) were taken from the result cache".format(self.cache.hits))
+			try:
+				self.cache.save()
+			except (IOError, OSError) as e:
+				internal_print("Could not save the result cache: {0}".format(e), 1, -1)
+
+		if self.results_json:
+			try:
+				f = open(self.results_json, "w")
+				json.dump(self.results, f, indent=4, sort_keys=True)
+				f.close()
+				internal_print("Results saved to {0}".format(self.results_json), 1, 1)
+			except (IOError, ValueError) as e:
+				internal_print("Could not save the results: {0}".format(e), 1, -1)
+
+	def check_query(self, task, probe, title, failure):
+		self.engine.submit(probe)
+		yield [probe]
+
+		if title:
+			task.internal_print(title, 0, 0)
+			if probe.result:
+				task.internal_print("Supported!", 1, 1)
+		else:
+			self.print_probe(task, probe)
+		if failure and not probe.result:
+			task.internal_print(failure, 1, -1)
+		if probe.result:
+			task.summary["name_length"] = len(dns_proto.hostname_to_hostnamebin(probe.hostname + self.domain))
+			self.max_name_length = max(self.max_name_length, task.summary["name_length"])
+		task.result = probe.result
+
+	def check_rate_limit(self, task, record_type, num, message):
+		probes = [query_engine.Probe(record_type, record_type, 1, 4, 15, 0) for i in xrange(num)]
+		for probe in probes:
+			self.engine.submit(probe)
+		yield probes
+
+		task.newline()
+		task.internal_print("Testing for rate limitation with record type {0}/{1} packets: ".format(record_type, num), 0)
 		success = 0
-		internal_print("Testing for rate limitation with record type {0}/{1} packets: ".format(record_type, num), 0)
-		for i in xrange(num):
-			if self.query(False, server_socket, server_tuple, record_type, record_type, 1, 4, 15, 0):
+		for probe in probes:
+			if probe.result:
 				success += 1
-				internal_dot_print(True)
-			else:
-				internal_dot_print(False)
-		print("")
+			task.internal_dot_print(probe.result)
+		task.newline()
+		# lost packets and slow answers are told apart by the retries
+		(lost, sent) = query_engine.transmission_loss(probes)
+		loss = float(lost) / max(1, sent)
+		late = len([probe for probe in probes if probe.late])
+		task.summary = {"loss": loss, "failed": 1 - float(success)/num, "late": late, "transmissions": sent}
+		self.loss = max(self.loss, loss)
 		# hard coded 90%, made up number
-		if (success/num)>0.90:
-			internal_print("{0}% packet loss. Tunnelling could work.".format(100-(success/num*100)), 1, 1)
+		if (float(success)/num)>0.90:
+			task.internal_print(message.format(loss*100), 1, 1)
 		else:
-			internal_print("{0}% packet loss, lossy network or rate limit in place".format(100-(success/num*100)), 1, -1)
-			internal_print("The following results might be incorrect", 1, -1)
+			task.internal_print("{0:.1f}% of the queries failed ({1:.1f}% packet loss), lossy network or rate limit in place".format(100-(float(success)/num*100), loss*100), 1, -1)
+			task.internal_print("The following results might be incorrect", 1, -1)
+		if late:
+			task.internal_print("{0} answer(s) arrived after the retransmission timeout, the network is slow rather than lossy".format(late))
+		task.result = True
 
-
-		# EDNS test
+	def check_edns(self, task):
+		probe = query_engine.Probe("CNAME", "CNAME", 10, 100, 15, 512)
 		self.DNS_proto.set_edns(1)
-		record_type = "CNAME"
-		internal_print("Testing for EDNS support: ", 0, 0)
-		if self.query(False, server_socket, server_tuple, record_type, record_type, 10, 100, 15, 512):
-			internal_print("Supported!", 1, 1)
-		else:
-			internal_print("NOT supported!", 1, -1)
+		self.engine.submit(probe)
 		self.DNS_proto.set_edns(0)
+		yield [probe]
 
+		task.internal_print("Testing for EDNS support: ", 0, 0)
+		if probe.result:
+			task.internal_print("Supported!", 1, 1)
+		else:
+			task.internal_print("NOT supported!", 1, -1)
+		task.result = probe.result
 
-		# long domain name
-		internal_print("Testing for long domain names in request: ", 0, 0)
-		if self.query(False, server_socket, server_tuple, record_type, record_type, 1, 10, 100, 0):
-			internal_print("Supported!", 1, 1)
+	def check_edns_size(self, task):
+		search = capacity_search.Capacity_Search(self.engine, self.DNS_proto, self.domain)
+		results = []
+		for probes in search.size_rounds(results):
+			yield probes
+
+		task.summary["sizes"] = [result._asdict() for result in results]
+		task.newline()
+		task.internal_print("Discovering the EDNS buffer size (advertised size: largest answer that arrived):")
+		for result in results:
+			if result.received:
+				text = "{0} bytes: {1} bytes".format(result.edns_size, result.received)
+			else:
+				text = "{0} bytes: -".format(result.edns_size)
+			if result.failure == "truncated":
+				text += ", bigger answers are truncated"
+			elif result.failure == "lost":
+				text += ", bigger answers are lost (IP fragments dropped?)"
+			elif result.failure:
+				text += ", bigger answers failed: {0}".format(result.failure)
+			if result.failure:
+				task.internal_print(text, 1, -1)
+			else:
+				task.internal_print(text, 1, 1)
+
+		# the smallest advertised size that gets the biggest answers through
+		working = [result for result in results if result.received]
+		if not working:
+			task.internal_print("No answer arrived, keeping the default of {0} bytes".format(self.DNS_proto.edns_size), 1, -1)
+			task.result = False
+			return
+		best = max([result.value for result in working])
+		edns_size = min([result.edns_size for result in working if result.value == best])
+		self.DNS_proto.set_edns_size(edns_size)
+		task.summary["edns_size"] = edns_size
+		if [result for result in results if result.failure and (result.edns_size > best)]:
+			# a real ceiling, the EDNS capacity searches stop there
+			self.edns_limit = best
+			task.summary["edns_limit"] = best
+			task.internal_print("Using an EDNS buffer size of {0} bytes, answers up to {1} bytes get through".format(edns_size, best), 1, 1)
 		else:
-			internal_print("Long domain names are not allowed. Exiting.", 1, -1)
-			sys.exit(-1)
+			task.internal_print("Using an EDNS buffer size of {0} bytes, no limit was found up to that".format(edns_size), 1, 1)
+		task.result = True
+
+	def check_tcp(self, task):
+		probe = query_engine.Probe("CNAME", "CNAME", 1, 10, 15, 0, tcp=True)
+		self.engine.submit(probe)
+		yield [probe]
 
+		task.internal_print("Testing DNS over TCP: ", 0, 0)
+		if not probe.result:
+			task.internal_print("NOT supported! ({0})".format(probe.message), 1, -1)
+			task.result = False
+			return
+		task.internal_print("Supported!", 1, 1)
+
+		# all of them are written to the connection of the first one, a
+		# server that closes it after an answer fails the rest
+		connections = self.engine.stream_connections
+		probes = [query_engine.Probe("CNAME", "CNAME", 1, 10, 15, 0, tcp=True) for i in xrange(PIPELINE_QUERIES)]
+		for probe in probes:
+			self.engine.submit(probe)
+		yield probes
+
+		answered = len([probe for probe in probes if probe.result])
+		opened = self.engine.stream_connections - connections
+		task.summary = {"pipelined": PIPELINE_QUERIES, "answered": answered, "connections": opened}
+		text = "Pipelining {0} queries on one TCP connection: {1} answered, {2} new connection(s)".format(PIPELINE_QUERIES, answered, opened)
+		if (answered == PIPELINE_QUERIES) and not opened:
+			task.internal_print(text, 1, 1)
+		else:
+			task.internal_print(text, 1, -1)
+		task.result = True
 
-		# long domain name + long answer
-		internal_print("Testing for big answer sizes: ", 0, 0)
-		for i in xrange(10):
-			internal_print("+{0}bytes: ".format(25*(i+1)), 0, 0)
-			if self.query(False, server_socket, server_tuple, record_type, record_type, i+1, 25, 100, 0):
-				internal_print("Supported!", 1, 1)
+	def check_throughput(self, task):
+		(num, length) = THROUGHPUT_ANSWER
+		measurements = []
+		for tcp in (False, True):
+			probes = []
+			start = monotonic()
+			for i in xrange(0, THROUGHPUT_QUERIES, THROUGHPUT_WINDOW):
+				wave = [query_engine.Probe("CNAME", "CNAME", num, length, 15, 0, tcp=tcp) for j in xrange(THROUGHPUT_WINDOW)]
+				for probe in wave:
+					self.engine.submit(probe)
+				yield wave
+				probes += wave
+			measurements.append((tcp, probes, monotonic() - start))
+
+		task.newline()
+		task.internal_print("Comparing UDP and TCP throughput ({0} queries of {1} CNAME answer(s) of {2} bytes, {3} in flight):".format(THROUGHPUT_QUERIES, num, length, THROUGHPUT_WINDOW))
+		for (tcp, probes, elapsed) in measurements:
+			if tcp:
+				transport = "TCP"
 			else:
-				internal_print("Too big", 1, -1)
-
-		# AAAA with multiple answers
-		record_type = "AAAA"
-		internal_print("Testing for IPv6 AAAA tunnelling: ", 1, 0)
-		for i in xrange(10):
-			internal_print("{0} answers: ".format((i+1)), 0, 0)
-			if self.query(False, server_socket, server_tuple, record_type, record_type, i+1, 16, 100, 0):
-				internal_print("Supported!", 1, 1)
+				transport = "UDP"
+			answered = [probe for probe in probes if probe.result]
+			size = sum([probe.size for probe in answered])
+			task.summary[transport] = {"answered": len(answered), "queries": len(probes), "seconds": elapsed, "bytes": size}
+			text = "{0}: {1}/{2} answered, {3:.1f} queries/sec, {4:.1f} kB/s".format(transport, len(answered), len(probes), len(answered) / elapsed, size / elapsed / 1024)
+			if len(answered) == len(probes):
+				task.internal_print(text, 1, 1)
 			else:
-				internal_print("Too big", 1, -1)
-
-		record_type = "TXT"
-		self.query(True, server_socket, server_tuple, record_type, record_type, 1, 10, 15, 0)
-		record_type = "PRIVATE"
-		self.query(True, server_socket, server_tuple, record_type, record_type, 1, 10, 15, 0)
-		record_type = "NULL"
-		self.query(True, server_socket, server_tuple, record_type, record_type, 1, 10, 15, 0)
-		record_type = "MX"
-		self.query(True, server_socket, server_tuple, record_type, record_type, 1, 10, 15, 0)
-		record_type = "SRV"
-		self.query(True, server_socket, server_tuple, record_type, record_type, 1, 10, 15, 0)
-		record_type = "DNSKEY"
-		self.query(True, server_socket, server_tuple, record_type, record_type, 1, 10, 15, 0)
-		record_type = "RRSIG"
-		self.query(True, server_socket, server_tuple, record_type, record_type, 1, 128, 15, 512)
-
-	def query(self, verbose, server_socket, server_tuple, record_type1, record_type2, num, length, domain_length, edns):
-		random_suffix = ""
-		random_string = "".join( [random.choice(self.alphabet) for j in xrange(domain_length)] )
-		for j in range(0,int(math.ceil(float(len(random_string))/63.0))):
-			random_suffix += random_string[j*63:(j+1)*63]+"."
-		record_hostname = format(num, "03d")+format(length, "03d")+record_type2.lower()+"."+random_suffix
-		transaction_id = int(random.random() * 65535)
-
-		if verbose:
-			internal_print("Testing {0} record type with {1} answer(s): ".format(record_type2, num), 0)
-		RRtype_num_r = self.DNS_proto.reverse_RR_type_num(record_type1)
-		RRtype_num_a = self.DNS_proto.reverse_RR_type_num(record_type2)
-		query = self.DNS_proto.build_query(transaction_id, record_hostname, self.domain, RRtype_num_r)
-		server_socket.sendto(query, server_tuple)
+				task.internal_print(text, 1, -1)
+		task.result = True
 
-		try:
-			while True:
-				raw_message, addr = server_socket.recvfrom(4096)
-				if not self.DNS_proto.is_valid_dns(raw_message, self.domain):
-					if verbose:
-						internal_print("Some garbage was received, not DNS answers", 1, -1)
-					continue
-				(transaction_id_received, queryornot, qtype, nquestions, questions, orig_question, nanswers, answers) = self.DNS_proto.parse_dns(raw_message, self.domain)
-				if transaction_id == transaction_id_received:
-					break
-				else:
-					if verbose:
-						internal_print("Wrong transaction_id received, ignoring.", 1, -1)
-					continue
+	def check_capacity(self, task, edns, tcp, record_types):
+		if edns.result:
+			edns_modes = (0, 1)
+		else:
+			edns_modes = (0, )
+		search = capacity_search.Capacity_Search(self.engine, self.DNS_proto, self.domain, self.edns_limit)
+		results = []
+		for probes in search.rounds(["A", "AAAA", "CNAME"] + [record_type for (record_type, record_task) in record_types if record_task.result], edns_modes, results, bool(tcp and tcp.result)):
+			yield probes
 
-			if nanswers and ((RRtype_num_r == qtype)):
-				if not 0 in answers:
-					return False
-				if (answers[0]["type"] == RRtype_num_a):
-					if nanswers == num:
-						if verbose:
-							internal_print("Worked with {0} answer(s).".format(nanswers), 1, 1)
-							if edns:
-								if answers["length"] > edns:
-									return True
-								else:
-									return False
-					else:
-						if verbose:
-							internal_print("Only got back {0} answer(s).".format(nanswers), 1, -1)
-						return False
+		task.newline()
+		task.internal_print("Searching for the largest answers per record type (without EDNS/with EDNS/over TCP):")
+		self.print_capacity(task, results)
+		self.capacity_results = results
+		task.summary["capacity"] = [result._asdict() for result in results]
+		task.result = True
+
+	def check_encodings(self, task, record_types):
+		# the data goes up in the query name with an A answer, the answers
+		# of every record type that worked come down with test data
+		checks = [("query name", encoding_class, query_engine.Probe("A", "A", 1, 4, 0, 0, encoding_class, os.urandom(encoding_class.get_maximum_length(ENCODING_CHECK_LENGTH))))
+			for encoding_class in encoding.NAME_ENCODINGS]
+		for (record_type, record_task) in record_types:
+			if not record_task.result:
+				continue
+			if record_type in estimator.NAME_TYPES:
+				encodings = encoding.NAME_ENCODINGS
+			else:
+				encodings = encoding.ENCODINGS
+			for encoding_class in encodings:
+				checks.append((record_type, encoding_class, query_engine.Probe(record_type, record_type, 1, ENCODING_CHECK_LENGTH, 15, 0, encoding_class)))
+		for (name, encoding_class, probe) in checks:
+			self.engine.submit(probe)
+		yield [probe for (name, encoding_class, probe) in checks]
+
+		task.newline()
+		task.internal_print("Testing which encodings survive:")
+		names = []
+		for (name, encoding_class, probe) in checks:
+			if name not in names:
+				names.append(name)
+		for name in names:
+			working = [encoding_class for (check_name, encoding_class, probe) in checks if (check_name == name) and probe.result]
+			failed = [encoding_class.get_name() for (check_name, encoding_class, probe) in checks if (check_name == name) and not probe.result]
+			text = "{0}: ".format(name)
+			if working:
+				text += "{0} worked".format(", ".join([encoding_class.get_name() for encoding_class in working]))
+				if failed:
+					text += ", "
+			if failed:
+				text += "{0} failed".format(", ".join(failed))
+			if working:
+				task.internal_print(text, 1, 1)
+				# the densest one that worked
+				if name == "query name":
+					self.upstream_encoding = working[0]
 				else:
-					if verbose:
-						internal_print("Unexpected record type {0}.".format(self.DNS_proto.RR_types[answers[0]["type"]][0]), 1, -1)
-					return False
+					self.encodings[name] = working[0]
 			else:
-				if verbose:
-					internal_print("Failed", 1, -1)
-				return False
+				task.internal_print(text, 1, -1)
+		task.summary["encodings"] = dict([(name, encoding_class.get_name()) for (name, encoding_class) in self.encodings.items()])
+		task.summary["upstream_encoding"] = None
+		if self.upstream_encoding:
+			task.summary["upstream_encoding"] = self.upstream_encoding.get_name()
+		task.result = True
 
-		except socket.timeout:
-			if verbose:
-				internal_print("No answer.", 1, -1)			
-			return False
+	def check_round_trip(self, task):
+		working = [result.record_type for result in self.capacity_results if (result.dimension == "num") and not result.edns and not result.tcp and result.value]
+		queries = [(record_type, base_length) for (record_type, base_length, fixed_length) in capacity_search.SEARCH_TYPES if record_type in working]
+		for i in xrange(ROUND_TRIP_ROUNDS):
+			probes = [query_engine.Probe(record_type, record_type, 1, base_length, 15, 0) for (record_type, base_length) in queries]
+			for probe in probes:
+				self.engine.submit(probe)
+			yield probes
 
-		return True
+		rtts = self.engine.latency.medians(task.name)
+		task.newline()
+		task.internal_print("Round trip times of {0} small queries per record type: {1}".format(ROUND_TRIP_ROUNDS,
+			", ".join(["{0} {1}".format(record_type, self.format_rtt(rtts.get(record_type))) for (record_type, base_length) in queries])))
+		task.summary["rtts"] = rtts
+		task.result = True
+
+	def format_rtt(self, rtt):
+		if rtt is None:
+			return "-"
+
+		return "{0:.1f}ms".format(rtt*1000)
+
+	def check_goodput(self, task, edns):
+		# only the round trip check sends the same query for every type
+		rtts = self.engine.latency.medians("round trip")
+
+		goodput = estimator.Goodput_Estimator(self.DNS_proto, self.domain, 0, self.window)
+		estimates = goodput.rank(self.capacity_results, rtts, self.loss, self.max_name_length, self.encodings, self.upstream_encoding)
+		task.summary["estimates"] = [estimate._asdict() for estimate in estimates]
+
+		task.newline()
+		upstream_encoding = self.upstream_encoding or encoding.Base32()
+		if edns.result:
+			edns_buffer = "{0} byte EDNS buffer".format(self.DNS_proto.edns_size)
+		else:
+			edns_buffer = "no EDNS"
+		task.internal_print("Estimated tunnel goodput ({0} byte query names in {1}, {2} queries in flight, {3:.1f}% loss, {4}):".format(self.max_name_length,
+			upstream_encoding.get_name(), self.window, self.loss*100, edns_buffer))
+		task.internal_print("{0:<8} {1:<5} {2:<7} {3:>8} {4:>8} {5:>8} {6:>8} {7:>10} {8:>10}".format("type", "EDNS", "enc", "answers", "up B/q", "down B/q", "RTT ms", "up B/s", "down B/s"))
+		for estimate in estimates:
+			if estimate.edns:
+				edns = "yes"
+			else:
+				edns = "no"
+			if estimate.num > 1:
+				answers = "{0}x{1}".format(estimate.num, estimate.length)
+			else:
+				answers = "1x{0}".format(estimate.length)
+			task.internal_print("{0:<8} {1:<5} {2:<7} {3:>8} {4:>8} {5:>8} {6:>8.1f} {7:>10.0f} {8:>10.0f}".format(estimate.record_type, edns, estimate.encoding, answers,
+				estimate.upstream, estimate.downstream, estimate.rtt*1000, estimate.upstream_rate, estimate.downstream_rate))
 
-def internal_dot_print(feedback):
-	colour = 1
-	if feedback == True:
-		if colour:
-			text = "\033[92m"
-		text += "."
-	if feedback == False:
-		if colour:
-			text = "\033[91m"
-		text += "!"
-	sys.stdout.write(text)
-		
-
-def internal_print(message, newline = 1, feedback = 0, verbosity = 0, severity = 0):
-	debug = ""
-	colour = 1
-	prefix = ""
-	if severity == 2:
-		debug = "DEBUG: "
-	if verbosity >= severity:
-		if feedback == -1:
-			if colour:
-				prefix = "\033[91m"
-			prefix += "[-]"
-		if feedback == 0:
-			if colour:
-				prefix = "\033[39m"
-			prefix += "[*]"
-		if feedback == 1:
-			if colour:
-				prefix = "\033[92m"
-			prefix += "[+]"
-		if colour:
-			sys.stdout.write("{0} {1}{2}\033[39m".format(prefix, debug, message))
+		if estimates:
+			best = estimates[0]
+			if best.edns:
+				edns = "with EDNS"
+			else:
+				edns = "without EDNS"
+			task.internal_print("Fastest usable configuration: {0} {1}, {2} answer(s) of {3} characters, {4} encoded: ~{5:.1f} kB/s down, ~{6:.1f} kB/s up".format(best.record_type, edns,
+				best.num, best.length, best.encoding, best.downstream_rate/1024, best.upstream_rate/1024), 1, 1)
 		else:
-			sys.stdout.write("{0} {1}{2}".format(prefix, debug, message))
-		if newline:
-			sys.stdout.write("\n")
+			task.internal_print("No usable record type was found", 1, -1)
+		task.result = True
+
+	def print_capacity(self, task, results):
+		for (record_type, base_length, fixed_length) in capacity_search.SEARCH_TYPES:
+			found = dict([((result.dimension, result.edns, result.tcp), result.value) for result in results if result.record_type == record_type])
+			if not found:
+				continue
+			queries = sum([result.queries for result in results if result.record_type == record_type])
+			text = "{0}: {1}/{2}/{3} answers of {4} bytes".format(record_type, found[("num", 0, False)], found.get(("num", 1, False), "-"), found.get(("num", 0, True), "-"), base_length)
+			if not fixed_length:
+				text += ", {0}/{1}/{2} bytes in one answer".format(found[("length", 0, False)], found.get(("length", 1, False), "-"), found.get(("length", 0, True), "-"))
+			text += " ({0} queries)".format(queries)
+			if found[("num", 0, False)] or found.get(("num", 1, False)) or found.get(("num", 0, True)):
+				task.internal_print(text, 1, 1)
+			else:
+				task.internal_print(text, 1, -1)
+
+	def report_latency(self):
+		if not self.engine:
+			return
+
+		latency = self.engine.latency
+		if not latency.order:
+			return
+
+		print("")
+		internal_print("Round trip times (ms):")
+		internal_print("{0:<20} {1:<8} {2:>6} {3:>8} {4:>8} {5:>8} {6:>8} {7:>8}".format("phase", "type", "count", "lost", "p50", "p90", "p99", "max"))
+		rows = [(phase, record_type, latency.histograms[(phase, record_type)], latency.timeouts[(phase, record_type)]) for (phase, record_type) in latency.order]
+		rows.append(("all", "", latency.total(), sum(latency.timeouts.values())))
+		for (phase, record_type, histogram, timeouts) in rows:
+			values = []
+			for value in (histogram.percentile(50), histogram.percentile(90), histogram.percentile(99), histogram.max):
+				if value is None:
+					values.append("-")
+				else:
+					values.append("{0:.2f}".format(value*1000))
+			internal_print("{0:<20} {1:<8} {2:>6} {3:>8} {4:>8} {5:>8} {6:>8} {7:>8}".format(phase, record_type, histogram.count, timeouts, *values))
+
+		engine = self.engine
+		if engine.rtt.samples:
+			internal_print("Retransmission timer: smoothed RTT {0:.2f}ms, variation {1:.2f}ms, timeout {2:.0f}ms".format(engine.rtt.srtt*1000, engine.rtt.rttvar*1000, engine.rtt.rto*1000))
+		internal_print("{0} queries sent, {1} of them retransmissions, {2} late answer(s), {3} queries got no answer".format(engine.transmissions, engine.retransmissions,
+			engine.late_answers, engine.unanswered))
 
-def is_hostname(s):
-	return bool(re.match("^(([a-zA-Z0-9]|[a-zA-Z0-9][a-zA-Z0-9\-]*[a-zA-Z0-9])\.)*([A-Za-z0-9]|[A-Za-z0-9][A-Za-z0-9\-]*[A-Za-z0-9])$", s))
+		if self.latency_json:
+			try:
+				f = open(self.latency_json, "w")
+				json.dump({"nameserver": self.nameserver, "domain": self.domain, "unit": "seconds", "latency": latency.export(), "total": latency.total().summary()}, f, indent=4, sort_keys=True)
+				f.close()
+				internal_print("Latency results saved to {0}".format(self.latency_json), 1, 1)
+			except IOError as e:
+				internal_print("Could not save latency results: {0}".format(e), 1, -1)
 
-def is_ipv4(s):
-	return bool(re.match("^(([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])\.){3}([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])$", s))
+	def print_probe(self, task, probe):
+		task.internal_print("Testing {0} record type with {1} answer(s): ".format(probe.record_type2, probe.num), 0)
+		task.internal_print(probe.message, 1, probe.feedback)
 
 # main function
 if __name__ == "__main__":
@@ -0,0 +1,209 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+
+if "metrics.py" in sys.argv[0]:
+	print("[-] Instead of poking around just try: python main.py --help")
+	sys.exit(-1)
+
+import bisect
+import threading
+
+try:
+	import BaseHTTPServer
+except ImportError:
+	# Python 3
+	import http.server as BaseHTTPServer
+
+PREFIX = "dns_checker_"
+
+# upper bounds of the answer size histogram in bytes: the classic limit,
+# common EDNS sizes, one Ethernet frame and the largest messages
+SIZE_BUCKETS = [128, 256, 512, 1024, 1232, 1472, 2048, 4096, 8192, 16384, 32768, 65535]
+
+# resolvers are counted one by one up to this many addresses, the rest is
+# counted as "other" so a scan of the internet does not eat up the memory
+MAX_RESOLVERS = 1000
+
+# Counters of the server, updated on every query. The hot path is one
+# dictionary update per query and per answer, the counters are summed up
+# by query type and by resolver when a snapshot is taken. A snapshot is
+# made of plain dictionaries and lists, so it can be sent to another process
+# and the snapshots of several workers can be added up.
+class Server_Metrics():
+	def __init__(self):
+		# (query type, transport, resolver address) -> queries
+		self.queries = {}
+		# resolver address -> answer bytes
+		self.answer_bytes = {}
+		# reason -> queries that were not answered
+		self.errors = {}
+		# answers per SIZE_BUCKETS slot, the last one is bigger than all
+		self.sizes = [0] * (len(SIZE_BUCKETS) + 1)
+		self.size_sum = 0
+		self.addresses = set()
+
+	def query(self, record_type, transport, address):
+		key = (record_type, transport, address[0])
+		try:
+			self.queries[key] += 1
+		except KeyError:
+			key = (record_type, transport, self.resolver(address))
+			self.queries[key] = self.queries.get(key, 0) + 1
+
+	def answer(self, size, address):
+		self.sizes[bisect.bisect_left(SIZE_BUCKETS, size)] += 1
+		self.size_sum += size
+		try:
+			self.answer_bytes[address[0]] += size
+		except KeyError:
+			resolver = self.resolver(address)
+			self.answer_bytes[resolver] = self.answer_bytes.get(resolver, 0) + size
+
+	def error(self, reason, count=1):
+		self.errors[reason] = self.errors.get(reason, 0) + count
+
+	def resolver(self, address):
+		if (address[0] not in self.addresses) and (len(self.addresses) >= MAX_RESOLVERS):
+			return "other"
+		self.addresses.add(address[0])
+
+		return address[0]
+
+	# copies of the counters, safe to read from another thread or to send to
+	# another process
+	def snapshot(self):
+		queries = {}
+		resolvers = {}
+		# list() copies in one step, the server thread may add keys meanwhile
+		for ((record_type, transport, address), value) in list(self.queries.items()):
+			queries[(record_type, transport)] = queries.get((record_type, transport), 0) + value
+			resolvers[address] = [resolvers.get(address, [0, 0])[0] + value, 0]
+		for (address, value) in list(self.answer_bytes.items()):
+			resolvers[address] = [resolvers.get(address, [0, 0])[0], value]
+
+		return {
+			"queries": queries,
+			"errors": dict(self.errors),
+			"resolvers": resolvers,
+			"sizes": list(self.sizes),
+			"size_sum": self.size_sum,
+		}
+
+def empty_snapshot():
+	return Server_Metrics().snapshot()
+
+# adds up snapshots, e.g. of all workers
+def merge(snapshots):
+	total = empty_snapshot()
+	for snapshot in snapshots:
+		for name in ("queries", "errors"):
+			for (key, value) in snapshot[name].items():
+				total[name][key] = total[name].get(key, 0) + value
+		for (address, counters) in snapshot["resolvers"].items():
+			if address in total["resolvers"]:
+				total["resolvers"][address] = [total["resolvers"][address][0] + counters[0], total["resolvers"][address][1] + counters[1]]
+			else:
+				total["resolvers"][address] = list(counters)
+		total["sizes"] = [total["sizes"][i] + snapshot["sizes"][i] for i in xrange(len(total["sizes"]))]
+		total["size_sum"] += snapshot["size_sum"]
+
+	return total
+
+def escape(value):
+	return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def labels(**pairs):
+	return "{" + ",".join(["{0}=\"{1}\"".format(name, escape(pairs[name])) for name in sorted(pairs)]) + "}"
+
+# Prometheus text exposition format (version 0.0.4). gauges and counters are
+# (name, help, value) lists of values without labels.
+def exposition(snapshot, counters=(), gauges=()):
+	lines = []
+
+	def header(name, help_text, metric_type):
+		lines.append("# HELP {0}{1} {2}".format(PREFIX, name, help_text))
+		lines.append("# TYPE {0}{1} {2}".format(PREFIX, name, metric_type))
+
+	for (name, help_text, value) in counters:
+		header(name, help_text, "counter")
+		lines.append("{0}{1} {2}".format(PREFIX, name, value))
+	for (name, help_text, value) in gauges:
+		header(name, help_text, "gauge")
+		lines.append("{0}{1} {2}".format(PREFIX, name, value))
+
+	header("queries_by_type_total", "Queries by query type and transport.", "counter")
+	for ((record_type, transport), value) in sorted(snapshot["queries"].items()):
+		lines.append("{0}queries_by_type_total{1} {2}".format(PREFIX, labels(type=record_type, transport=transport), value))
+
+	header("errors_total", "Queries that were not answered by reason.", "counter")
+	for (reason, value) in sorted(snapshot["errors"].items()):
+		lines.append("{0}errors_total{1} {2}".format(PREFIX, labels(reason=reason), value))
+
+	header("resolver_queries_total", "Queries by resolver address.", "counter")
+	for (address, counters) in sorted(snapshot["resolvers"].items()):
+		lines.append("{0}resolver_queries_total{1} {2}".format(PREFIX, labels(resolver=address), counters[0]))
+	header("resolver_answer_bytes_total", "Bytes of answers by resolver address.", "counter")
+	for (address, counters) in sorted(snapshot["resolvers"].items()):
+		lines.append("{0}resolver_answer_bytes_total{1} {2}".format(PREFIX, labels(resolver=address), counters[1]))
+
+	header("answer_size_bytes", "Size of the answers.", "histogram")
+	cumulative = 0
+	for i in xrange(len(SIZE_BUCKETS)):
+		cumulative += snapshot["sizes"][i]
+		lines.append("{0}answer_size_bytes_bucket{1} {2}".format(PREFIX, labels(le=SIZE_BUCKETS[i]), cumulative))
+	cumulative += snapshot["sizes"][-1]
+	lines.append("{0}answer_size_bytes_bucket{1} {2}".format(PREFIX, labels(le="+Inf"), cumulative))
+	lines.append("{0}answer_size_bytes_sum {1}".format(PREFIX, snapshot["size_sum"]))
+	lines.append("{0}answer_size_bytes_count {1}".format(PREFIX, cumulative))
+
+	return "\n".join(lines) + "\n"
+
+class Metrics_Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+	def do_GET(self):
+		if self.path.split("?")[0] != "/metrics":
+			self.send_error(404)
+			return
+
+		body = self.server.collect().encode("utf-8")
+		self.send_response(200)
+		self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		# scrapes are not worth a line each
+		pass
+
+# HTTP endpoint on /metrics in a background thread, collect() returns the
+# text to serve
+class Metrics_Server():
+	def __init__(self, address, collect):
+		self.httpd = BaseHTTPServer.HTTPServer(address, Metrics_Handler)
+		self.httpd.collect = collect
+		self.thread = threading.Thread(target=self.httpd.serve_forever)
+		self.thread.daemon = True
+
+	def start(self):
+		self.thread.start()
@@ -0,0 +1,70 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+
+if "payload.py" in sys.argv[0]:
+	print("[-] Instead of poking around just try: python main.py --help")
+	sys.exit(-1)
+
+import os
+
+# Random text over an alphabet, generated in bulk: os.urandom() output is
+# mapped onto the alphabet with a single str.translate() call. Text is drawn
+# from a pre-generated pool that is refilled when it runs out.
+class Payload_Pool():
+	def __init__(self, alphabet, size=65536):
+		self.alphabet = alphabet
+		self.size = size
+
+		# bytes above the last full multiple of the alphabet length are
+		# dropped, otherwise the first characters would be more frequent
+		n = len(alphabet)
+		self.table = "".join([alphabet[i % n] for i in xrange(256)])
+		self.reject = "".join([chr(i) for i in xrange(256 - (256 % n), 256)])
+		self.ratio = 256.0 / (256 - (256 % n))
+
+		self.pool = ""
+		self.offset = 0
+
+	def generate(self, length):
+		text = ""
+		while len(text) < length:
+			missing = length - len(text)
+			text += os.urandom(int(missing * self.ratio) + 16).translate(self.table, self.reject)
+
+		return text[:length]
+
+	def refill(self):
+		self.pool = self.generate(self.size)
+		self.offset = 0
+
+	def get(self, length):
+		if length > self.size:
+			return self.generate(length)
+
+		if self.offset + length > len(self.pool):
+			self.refill()
+		text = self.pool[self.offset:self.offset+length]
+		self.offset += length
+
+		return text
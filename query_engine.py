@@ -0,0 +1,523 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+
+if "query_engine.py" in sys.argv[0]:
+	print("[-] Instead of poking around just try: python main.py --help")
+	sys.exit(-1)
+
+import socket
+import select
+import struct
+import random
+import heapq
+import errno
+import collections
+
+import common
+import histogram
+import encoding
+import dns_tcp
+
+# transaction ID and flags from the DNS header
+header_struct = struct.Struct(">HH")
+transaction_id_struct = struct.Struct(">H")
+
+# retransmission timer of the UDP queries in seconds (RFC 6298, with a lower
+# minimum than TCP's 1 second, a DNS answer is one packet)
+INITIAL_RTO = 1.0
+MIN_RTO = 0.2
+MAX_RTO = 10.0
+# a query is sent at most 1 + MAX_RETRIES times
+MAX_RETRIES = 2
+# transaction IDs of finished queries are kept back this long, so an answer
+# to them is counted as late or, if it was answered before, as a duplicate
+RETIRED_IDS = 4096
+
+# result message of an answer that did not carry the expected data
+DATA_CHANGED = "Data was changed on the way."
+
+# Smoothed round trip time and its variation (Jacobson/Karels, RFC 6298) of
+# one nameserver, the retransmission timeout follows them. Every sample is
+# unambiguous: each transmission of a query has its own transaction ID.
+class Rtt_Estimator():
+	def __init__(self):
+		self.srtt = None
+		self.rttvar = None
+		self.rto = INITIAL_RTO
+		self.samples = 0
+
+	def sample(self, rtt):
+		if self.srtt is None:
+			self.srtt = rtt
+			self.rttvar = rtt / 2
+		else:
+			self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+			self.srtt = 0.875 * self.srtt + 0.125 * rtt
+		self.rto = min(MAX_RTO, max(MIN_RTO, self.srtt + 4 * self.rttvar))
+		self.samples += 1
+
+	# the timeout doubles with every retry
+	def timeout(self, attempt):
+		return min(MAX_RTO, self.rto * (2 ** attempt))
+
+# transmissions that were lost, and all that count, of UDP probes: the ones
+# before the answered one are lost, the ones after it are unknown
+def transmission_loss(probes):
+	lost = 0
+	sent = 0
+	for probe in probes:
+		if probe.tcp or not probe.attempts:
+			continue
+		if probe.answered_by is None:
+			lost += probe.attempts
+			sent += probe.attempts
+		else:
+			lost += probe.answered_by
+			sent += probe.answered_by + 1
+
+	return (lost, sent)
+
+# One test query: ask for record_type1 and expect num answers of record_type2
+# carrying length bytes each. The outcome is filled in by the engine.
+# With an encoding the answers carry test data in that encoding and they
+# are checked byte by byte. If data is set as well, it goes up encoded in the
+# query name instead of the random text and an A answer with its digest is
+# expected. With tcp the query goes over the engine's TCP connection. UDP
+# queries are sent again when the retransmission timer expires, unless a
+# fixed timeout is given. name and expected can be set before the probe is
+# submitted, a list in expected is one rdata per answer in any order.
+# name is then used as it is, without the domain.
+class Probe():
+	def __init__(self, record_type1, record_type2, num, length, domain_length, edns, encoding_class=None, data=None, tcp=False, timeout=None):
+		self.record_type1 = record_type1
+		self.record_type2 = record_type2
+		self.num = num
+		self.length = length
+		self.domain_length = domain_length
+		self.edns = edns
+		self.encoding = encoding_class
+		self.data = data
+		self.tcp = tcp
+		self.timeout = timeout
+		self.name = None
+		self.expected = None
+
+		self.phase = None
+		# EDNS buffer size advertised in the query, 0 without EDNS
+		self.edns_size = 0
+		self.transaction_id = None
+		self.hostname = None
+		self.query = None
+		self.sent = None
+		self.deadline = None
+		self.callback = None
+		# every transmission with its own transaction ID
+		self.transaction_ids = []
+		self.sent_times = []
+		self.attempts = 0
+		# the transmission that was answered, late if the timer of it had
+		# already expired
+		self.answered_by = None
+		self.late = False
+
+		# round trip time, response code and size of the reply, set when a
+		# reply was matched
+		self.rtt = None
+		self.rcode = None
+		self.size = None
+		self.truncated = False
+
+		self.done = False
+		self.result = False
+		self.message = None
+		self.feedback = 0
+
+# Pipelined client: many probes are in flight on the same socket, the replies
+# are matched to the requests by transaction ID and every request has its own
+# deadline. TCP probes share one persistent connection (RFC 7766), it is
+# opened on the first TCP probe and again after the server closed it. With
+# set_rate() the queries wait in the backlog so the server never gets more
+# than that many per second.
+class Query_Engine():
+	def __init__(self, DNS_proto, domain, server_socket, server_tuple, timeout, payload, max_inflight=64, retries=MAX_RETRIES):
+		self.DNS_proto = DNS_proto
+		self.domain = domain
+		self.server_socket = server_socket
+		self.server_tuple = server_tuple
+		self.timeout = timeout
+		self.payload = payload
+		self.max_inflight = max_inflight
+		self.retries = retries
+
+		self.server_socket.setblocking(0)
+
+		self.pending = {}
+		self.transaction_ids = set()
+		self.deadlines = []
+		self.backlog = collections.deque()
+
+		self.garbage = 0
+		self.unmatched = 0
+
+		self.rtt = Rtt_Estimator()
+		self.transmissions = 0
+		self.retransmissions = 0
+		self.late_answers = 0
+		self.unanswered = 0
+		self.duplicates = 0
+		self.retired = collections.OrderedDict()
+
+		self.stream = None
+		self.stream_connections = 0
+		self.bucket = None
+
+		# every finished probe is timed under the current phase
+		self.phase = ""
+		self.latency = histogram.Latency_Recorder()
+		# called with every finished probe if set
+		self.recorder = None
+
+	def idle(self):
+		return not (self.pending or self.backlog)
+
+	def set_rate(self, rate):
+		# short bursts only, like the load generator
+		self.bucket = common.Token_Bucket(rate, max(1.0, rate / 20.0))
+
+	def make_hostname(self, probe):
+		record_type = probe.record_type2.lower()
+		if probe.encoding:
+			record_type += "-" + probe.encoding.get_name()
+		if probe.data is not None:
+			random_string = probe.encoding.encode(probe.data)
+		else:
+			random_string = self.payload.get(probe.domain_length)
+		random_suffix = ""
+		for j in xrange(0, (len(random_string) + 62) / 63):
+			random_suffix += random_string[j*63:(j+1)*63]+"."
+
+		if probe.encoding:
+			# the answer the server derives from the name
+			if probe.data is not None:
+				probe.expected = encoding.digest(probe.data)
+			else:
+				test_data = encoding.test_data(random_string.lower(), probe.encoding.get_maximum_length(probe.length))
+				probe.expected = probe.encoding.encode(test_data)
+
+		return format(probe.num, "03d")+format(probe.length, "03d")+record_type+"."+random_suffix
+
+	def submit(self, probe, callback=None):
+		probe.callback = callback
+		probe.phase = self.phase
+		probe.hostname = probe.name or self.make_hostname(probe)
+		probe.qtype_r = self.DNS_proto.reverse_RR_type_num(probe.record_type1)
+		probe.qtype_a = self.DNS_proto.reverse_RR_type_num(probe.record_type2)
+
+		# the query is built right away, so the current EDNS setting is used
+		# even if the probe has to wait in the backlog
+		transaction_id = self.new_transaction_id()
+		probe.transaction_id = transaction_id
+		probe.transaction_ids = [transaction_id]
+		probe.query = self.DNS_proto.build_query(transaction_id, probe.hostname, self.domain, probe.qtype_r)
+		if self.DNS_proto.edns:
+			probe.edns_size = self.DNS_proto.edns_size
+
+		self.backlog.append(probe)
+		self.fill()
+
+	def new_transaction_id(self):
+		transaction_id = random.randint(0, 65535)
+		while transaction_id in self.transaction_ids:
+			transaction_id = random.randint(0, 65535)
+		self.transaction_ids.add(transaction_id)
+
+		return transaction_id
+
+	# seconds until the current transmission of the probe counts as lost.
+	# TCP retransmits by itself, it gets the time of all UDP tries.
+	def probe_timeout(self, probe):
+		if probe.timeout:
+			return probe.timeout
+		if probe.tcp:
+			return sum([self.rtt.timeout(attempt) for attempt in xrange(self.retries + 1)])
+
+		return self.rtt.timeout(probe.attempts - 1)
+
+	def fill(self):
+		while self.backlog and (len(self.pending) < self.max_inflight):
+			if self.bucket and not self.bucket.consume(common.monotonic()):
+				return
+			probe = self.backlog[0]
+			if probe.tcp:
+				if (not self.stream) or self.stream.closed:
+					self.stream = dns_tcp.Stream_Connection.connect(self.server_tuple)
+					self.stream_connections += 1
+				# queued until the connection is up, the queries of the
+				# connection are pipelined
+				self.stream.write(probe.query)
+			else:
+				try:
+					self.server_socket.sendto(probe.query, self.server_tuple)
+				except socket.error as e:
+					if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS):
+						# send buffer is full, try again on the next step
+						return
+					raise
+			self.backlog.popleft()
+			probe.sent = common.monotonic()
+			probe.sent_times.append(probe.sent)
+			probe.attempts = 1
+			self.transmissions += 1
+			probe.deadline = probe.sent + self.probe_timeout(probe)
+			self.pending[probe.transaction_id] = probe
+			heapq.heappush(self.deadlines, (probe.deadline, probe.transaction_id, probe))
+			if probe.tcp and self.stream.closed:
+				self.stream_closed()
+
+	def run(self, probes):
+		for probe in probes:
+			self.submit(probe)
+
+		return self.wait(probes)
+
+	def wait(self, probes):
+		while [probe for probe in probes if not probe.done]:
+			self.step(self.timeout)
+
+		return probes
+
+	def step(self, timeout):
+		wait = timeout
+		if self.deadlines:
+			wait = min(wait, max(0.0, self.deadlines[0][0] - common.monotonic()))
+		if self.bucket and self.backlog:
+			# the next query can go out then
+			wait = min(wait, self.bucket.wait_time())
+
+		readers = [self.server_socket]
+		writers = []
+		if self.stream and not self.stream.closed:
+			readers.append(self.stream)
+			if self.stream.wants_write():
+				writers.append(self.stream)
+		try:
+			(readable, writable) = select.select(readers, writers, [], wait)[:2]
+		except select.error as e:
+			if e.args[0] != errno.EINTR:
+				raise
+			(readable, writable) = ([], [])
+
+		if self.server_socket in readable:
+			self.receive()
+		if self.stream in writable:
+			self.stream.flush()
+		if self.stream in readable:
+			for raw_message in self.stream.read():
+				self.handle(raw_message)
+		if self.stream and self.stream.closed:
+			self.stream_closed()
+		self.expire()
+		self.fill()
+
+	def receive(self):
+		# drain everything that is queued on the socket
+		while True:
+			try:
+				raw_message, addr = self.server_socket.recvfrom(65535)
+			except socket.error as e:
+				break
+			self.handle(raw_message)
+
+	# the TCP queries in flight are lost with the connection
+	def stream_closed(self):
+		self.stream = None
+		for probe in self.pending.values():
+			if probe.tcp:
+				self.finish(probe, False, "TCP connection closed.", -1)
+
+	def expire(self):
+		now = common.monotonic()
+		while self.deadlines and (self.deadlines[0][0] <= now):
+			(deadline, transaction_id, probe) = heapq.heappop(self.deadlines)
+			# the timer of an earlier transmission
+			if probe.done or (transaction_id != probe.transaction_id):
+				continue
+			if (not probe.tcp) and (not probe.timeout) and (probe.attempts <= self.retries):
+				self.retransmit(probe, now)
+				continue
+			self.unanswered += 1
+			if probe.attempts > 1:
+				self.finish(probe, False, "No answer after {0} tries.".format(probe.attempts), -1)
+			else:
+				self.finish(probe, False, "No answer.", -1)
+
+	# the same query with a new transaction ID, a late answer to the
+	# earlier one is still accepted
+	def retransmit(self, probe, now):
+		transaction_id = self.new_transaction_id()
+		try:
+			self.server_socket.sendto(transaction_id_struct.pack(transaction_id) + probe.query[2:], self.server_tuple)
+		except socket.error as e:
+			# a full send buffer is like a lost packet, the timer runs anyway
+			if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS):
+				raise
+		probe.transaction_id = transaction_id
+		probe.transaction_ids.append(transaction_id)
+		probe.sent_times.append(now)
+		probe.attempts += 1
+		self.transmissions += 1
+		self.retransmissions += 1
+		probe.deadline = now + self.probe_timeout(probe)
+		self.pending[transaction_id] = probe
+		heapq.heappush(self.deadlines, (probe.deadline, transaction_id, probe))
+
+	# the round trip time of the transmission that was answered
+	def matched(self, probe, transaction_id):
+		index = probe.transaction_ids.index(transaction_id)
+		probe.answered_by = index
+		probe.rtt = common.monotonic() - probe.sent_times[index]
+		if not probe.tcp:
+			self.rtt.sample(probe.rtt)
+			if index < probe.attempts - 1:
+				probe.late = True
+				self.late_answers += 1
+
+	def transmission_stats(self):
+		return {
+			"srtt": self.rtt.srtt,
+			"rttvar": self.rtt.rttvar,
+			"rto": self.rtt.rto,
+			"samples": self.rtt.samples,
+			"transmissions": self.transmissions,
+			"retransmissions": self.retransmissions,
+			"late_answers": self.late_answers,
+			"unanswered": self.unanswered,
+			"duplicates": self.duplicates,
+		}
+
+	def finish(self, probe, result, message, feedback):
+		probe.done = True
+		probe.result = result
+		probe.message = message
+		probe.feedback = feedback
+		answered = None
+		if probe.answered_by is not None:
+			answered = probe.transaction_ids[probe.answered_by]
+		for transaction_id in probe.transaction_ids:
+			if self.pending.get(transaction_id) is probe:
+				del self.pending[transaction_id]
+			# True once the transmission got its answer
+			self.retired[transaction_id] = (transaction_id == answered)
+		while len(self.retired) > RETIRED_IDS:
+			self.transaction_ids.discard(self.retired.popitem(False)[0])
+		self.latency.record(probe.phase, probe.record_type2, probe.rtt)
+		if self.recorder:
+			self.recorder(probe)
+		if probe.callback:
+			probe.callback(probe)
+
+	def handle(self, raw_message):
+		if len(raw_message) < 12:
+			self.garbage += 1
+			return
+
+		(transaction_id, flags) = header_struct.unpack_from(raw_message, 0)
+		probe = self.pending.get(transaction_id)
+		if not probe:
+			if transaction_id not in self.retired:
+				self.unmatched += 1
+			elif self.retired[transaction_id]:
+				self.duplicates += 1
+			else:
+				# the probe was given up or another transmission was
+				# answered first
+				self.late_answers += 1
+				self.retired[transaction_id] = True
+			return
+
+		probe.size = len(raw_message)
+		rcode = flags & 0xF
+		if flags & 0x0200:
+			# truncated, the rest would only come over TCP
+			probe.truncated = True
+			probe.rcode = rcode
+			self.matched(probe, transaction_id)
+			self.finish(probe, False, "Answer was truncated.", -1)
+			return
+		if rcode and (rcode != 3):
+			probe.rcode = rcode
+			self.matched(probe, transaction_id)
+			if rcode < len(self.DNS_proto.response_codes):
+				self.finish(probe, False, self.DNS_proto.response_codes[rcode], -1)
+			else:
+				self.finish(probe, False, "Failed with response code {0}".format(rcode), -1)
+			return
+
+		message = self.DNS_proto.parse_message(raw_message, self.domain)
+		if not message:
+			self.garbage += 1
+			return
+		# resolvers may randomise the case of the name (0x20 encoding)
+		if message.questions[0].name.lower() != (probe.hostname + self.domain).lower():
+			self.unmatched += 1
+			return
+
+		probe.rcode = rcode
+		self.matched(probe, transaction_id)
+		self.evaluate(probe, message)
+
+	def evaluate(self, probe, message):
+		answers = message.answers
+		if (not answers) or (probe.qtype_r != message.questions[0].type):
+			self.finish(probe, False, "Failed", -1)
+			return
+
+		if answers[0].type != probe.qtype_a:
+			if answers[0].type in self.DNS_proto.RR_types:
+				type_name = self.DNS_proto.RR_types[answers[0].type][0]
+			else:
+				type_name = answers[0].type
+			self.finish(probe, False, "Unexpected record type {0}.".format(type_name), -1)
+			return
+
+		if len(answers) != probe.num:
+			self.finish(probe, False, "Only got back {0} answer(s).".format(len(answers)), -1)
+			return
+
+		if isinstance(probe.expected, list):
+			if sorted([answer.rdata for answer in answers]) != sorted(probe.expected):
+				self.finish(probe, False, DATA_CHANGED, -1)
+				return
+		elif probe.expected is not None:
+			for answer in answers:
+				if answer.rdata != probe.expected:
+					self.finish(probe, False, DATA_CHANGED, -1)
+					return
+
+		# size of the whole packet as it arrived
+		if probe.edns and (probe.size <= probe.edns):
+			self.finish(probe, False, "Answer was not bigger than {0} bytes.".format(probe.edns), -1)
+			return
+
+		self.finish(probe, True, "Worked with {0} answer(s).".format(len(answers)), 1)
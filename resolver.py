@@ -0,0 +1,353 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+
+if "resolver.py" in sys.argv[0]:
+	print("[-] Instead of poking around just try: python main.py --help")
+	sys.exit(-1)
+
+import socket
+import struct
+import random
+import heapq
+import errno
+
+import common
+import dns_proto
+import dns_tcp
+from common import internal_print
+
+RESOLVER_STATS = ["queries", "forwarded", "answered", "lost", "rate limited", "blocked", "truncated", "EDNS stripped", "garbage", "expired", "TCP connections", "fragmented"]
+
+# largest answer for clients that do not advertise EDNS (RFC 1035)
+CLASSIC_SIZE = 512
+
+# upstream queries that got no answer are forgotten after this many seconds
+UPSTREAM_TIMEOUT = 10.0
+
+# IPv4 and UDP headers, a datagram fits into one packet of the MTU if it is
+# not bigger than MTU-28 bytes
+UDP_IP_OVERHEAD = 28
+
+# Settings of the stand-in resolver. Percentages are 0-100, times are
+# seconds, rates are queries per second, 0 or None turns an impairment off.
+class Impairments():
+	def __init__(self):
+		self.loss = 0.0
+		self.latency = 0.0
+		self.jitter = 0.0
+		self.client_rate = 0.0
+		self.max_answer = 0
+		self.blocked_types = []
+		self.strip_edns = False
+		# answers that would be sent in IP fragments are dropped, like on
+		# paths that filter fragments
+		self.mtu = 0
+
+# Query from a client that waits for the upstream answer
+class Pending_Query():
+	__slots__ = ("client", "transaction_id", "udp_size", "expires")
+
+	def __init__(self, client, transaction_id, udp_size, expires):
+		self.client = client
+		self.transaction_id = transaction_id
+		self.udp_size = udp_size
+		self.expires = expires
+
+# Forwarding resolver for testing on one machine: it sits between the client
+# and the server and can lose, delay and rate limit packets, truncate big
+# answers, refuse record types and strip EDNS like a restrictive resolver.
+# With tcp the queries of every client TCP connection go upstream on a TCP
+# connection of their own. Nothing is lost or truncated there, the rest of
+# the impairments apply.
+class Impaired_Resolver():
+	def __init__(self, listen_tuple, upstream_tuple, impairments, tcp=True):
+		self.listen_tuple = listen_tuple
+		self.upstream_tuple = upstream_tuple
+		self.impairments = impairments
+
+		self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.client_socket.bind(listen_tuple)
+		self.client_socket.setblocking(0)
+		self.upstream_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.upstream_socket.setblocking(0)
+
+		self.poller = common.Poller()
+		self.poller.register(self.client_socket.fileno())
+		self.poller.register(self.upstream_socket.fileno())
+		self.streams = None
+		if tcp:
+			self.streams = dns_tcp.Stream_Server(dns_tcp.create_listener(listen_tuple, False), self.handle_stream_query, self.poller, on_close=self.client_closed)
+		# client connection -> upstream connection and upstream fd -> client
+		# connection
+		self.upstreams = {}
+		self.clients = {}
+
+		self.blocked = set([dns_proto.RR_types.get_by_name(name).code for name in impairments.blocked_types])
+		self.buckets = {}
+		self.pending = {}
+		self.expiry = []
+		# delayed packets: (due, sequence, socket, packet, destination)
+		self.delayed = []
+		self.sequence = 0
+
+		self.stats = [0] * len(RESOLVER_STATS)
+
+	def lost(self):
+		if self.impairments.loss and (random.random() * 100 < self.impairments.loss):
+			self.stats[3] += 1
+			return True
+
+		return False
+
+	def send(self, sock, packet, destination):
+		delay = self.impairments.latency
+		if self.impairments.jitter:
+			delay = max(0.0, delay + random.uniform(-self.impairments.jitter, self.impairments.jitter))
+		if delay:
+			self.sequence += 1
+			heapq.heappush(self.delayed, (common.monotonic() + delay, self.sequence, sock, packet, destination))
+			return
+		self.sendto(sock, packet, destination)
+
+	def sendto(self, sock, packet, destination):
+		if destination is None:
+			# a TCP connection, it may have been closed in the meantime
+			sock.write(packet)
+			if not sock.closed:
+				self.poller.modify(sock.fileno(), sock.wants_write())
+			return
+		try:
+			sock.sendto(packet, destination)
+		except socket.error as e:
+			if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS, errno.EMSGSIZE):
+				raise
+
+	def rate_limited(self, client):
+		if not self.impairments.client_rate:
+			return False
+
+		bucket = self.buckets.get(client[0])
+		if bucket is None:
+			bucket = self.buckets[client[0]] = common.Token_Bucket(self.impairments.client_rate, max(1.0, self.impairments.client_rate))
+		if bucket.consume(common.monotonic()):
+			return False
+		self.stats[4] += 1
+
+		return True
+
+	# offset after the question and the query type, None if it is malformed
+	def parse_question(self, packet):
+		(hlen, hostname) = dns_proto.hostnamebin_to_hostname(packet, 12)
+		end = 12 + hlen + 4
+		if (hlen == 0) or (end > len(packet)):
+			return (None, None)
+
+		return (end, dns_proto.question_struct.unpack_from(packet, 12 + hlen)[0])
+
+	# error or truncated reply with the question of the query and no records
+	def build_reply(self, packet, question_end, flags):
+		(transaction_id, query_flags) = struct.unpack_from(">HH", packet, 0)
+		header = dns_proto.header_struct.pack(transaction_id, 0x8000 | (query_flags & 0x0100) | 0x0080 | flags, 1, 0, 0, 0)
+
+		return header + packet[12:question_end]
+
+	# connection is the client's TCP connection, None for UDP
+	def handle_query(self, packet, client, connection=None):
+		self.stats[0] += 1
+		if connection:
+			if self.rate_limited(client):
+				return
+		elif self.lost() or self.rate_limited(client):
+			return
+
+		if len(packet) < 12:
+			self.stats[8] += 1
+			return
+		(transaction_id, flags, nquestions, nanswers, nauthority, nadditional) = dns_proto.header_struct.unpack_from(packet, 0)
+		(question_end, qtype) = self.parse_question(packet)
+		if (nquestions != 1) or (question_end is None):
+			self.stats[8] += 1
+			return
+
+		if qtype in self.blocked:
+			self.stats[5] += 1
+			# REFUSED
+			if connection:
+				self.send(connection, self.build_reply(packet, question_end, 5), None)
+			else:
+				self.send(self.client_socket, self.build_reply(packet, question_end, 5), client)
+			return
+
+		# the OPT record of the client tells the largest answer it takes
+		udp_size = CLASSIC_SIZE
+		if (nadditional == 1) and (not nanswers) and (not nauthority) and (len(packet) >= question_end + dns_proto.opt_struct.size):
+			(name, rtype, size, extended_rcode, version, opt_flags, rdlen) = dns_proto.opt_struct.unpack_from(packet, question_end)
+			if rtype == 41:
+				if self.impairments.strip_edns:
+					self.stats[7] += 1
+					packet = dns_proto.header_struct.pack(transaction_id, flags, 1, 0, 0, 0) + packet[12:question_end]
+				else:
+					udp_size = max(CLASSIC_SIZE, size)
+		if connection:
+			# the transaction IDs are the client's own on its connection
+			self.stats[1] += 1
+			self.send(self.get_upstream(connection), packet, None)
+			return
+		if self.impairments.max_answer:
+			udp_size = min(udp_size, self.impairments.max_answer)
+
+		# the upstream transaction ID is picked here, clients may collide
+		upstream_id = random.randint(0, 65535)
+		while upstream_id in self.pending:
+			upstream_id = random.randint(0, 65535)
+		expires = common.monotonic() + UPSTREAM_TIMEOUT
+		self.pending[upstream_id] = Pending_Query(client, transaction_id, udp_size, expires)
+		heapq.heappush(self.expiry, (expires, upstream_id))
+
+		self.stats[1] += 1
+		self.send(self.upstream_socket, struct.pack(">H", upstream_id) + packet[2:], self.upstream_tuple)
+
+	def handle_answer(self, packet):
+		if len(packet) < 12:
+			self.stats[8] += 1
+			return
+		upstream_id = struct.unpack_from(">H", packet, 0)[0]
+		query = self.pending.pop(upstream_id, None)
+		if query is None:
+			self.stats[8] += 1
+			return
+		if self.lost():
+			return
+
+		packet = struct.pack(">H", query.transaction_id) + packet[2:]
+		if len(packet) > query.udp_size:
+			(question_end, qtype) = self.parse_question(packet)
+			if question_end is None:
+				self.stats[8] += 1
+				return
+			self.stats[6] += 1
+			# TC bit, the client should retry over TCP
+			packet = self.build_reply(packet, question_end, 0x0200 | (struct.unpack_from(">H", packet, 2)[0] & 0x040F))
+		if self.impairments.mtu and (len(packet) + UDP_IP_OVERHEAD > self.impairments.mtu):
+			self.stats[11] += 1
+			return
+
+		self.stats[2] += 1
+		self.send(self.client_socket, packet, query.client)
+
+	def handle_stream_query(self, packet, connection):
+		self.handle_query(packet, connection.address, connection)
+
+		# answered later from the upstream connection
+		return None
+
+	def get_upstream(self, connection):
+		upstream = self.upstreams.get(connection)
+		if upstream and upstream.closed:
+			del self.clients[upstream.fileno()]
+			self.poller.unregister(upstream.fileno())
+			upstream = None
+		if upstream is None:
+			upstream = dns_tcp.Stream_Connection.connect(self.upstream_tuple)
+			self.upstreams[connection] = upstream
+			self.clients[upstream.fileno()] = connection
+			self.poller.register(upstream.fileno(), True)
+			self.stats[10] += 1
+
+		return upstream
+
+	def handle_upstream(self, fd, readable, writable):
+		connection = self.clients[fd]
+		upstream = self.upstreams[connection]
+		if writable:
+			upstream.flush()
+		if readable:
+			for packet in upstream.read():
+				self.stats[2] += 1
+				self.send(connection, packet, None)
+		if upstream.closed:
+			# the client sees the connection closing as well
+			self.streams.close(connection)
+		else:
+			self.poller.modify(fd, upstream.wants_write())
+
+	def client_closed(self, connection):
+		upstream = self.upstreams.pop(connection, None)
+		if upstream:
+			del self.clients[upstream.fileno()]
+			self.poller.unregister(upstream.fileno())
+			upstream.close()
+
+	def expire(self, now):
+		while self.expiry and (self.expiry[0][0] <= now):
+			(expires, upstream_id) = heapq.heappop(self.expiry)
+			query = self.pending.get(upstream_id)
+			if query and (query.expires == expires):
+				del self.pending[upstream_id]
+				self.stats[9] += 1
+
+	def flush_delayed(self, now):
+		while self.delayed and (self.delayed[0][0] <= now):
+			(due, sequence, sock, packet, destination) = heapq.heappop(self.delayed)
+			self.sendto(sock, packet, destination)
+
+	def drain(self, sock, handler):
+		while True:
+			try:
+				(packet, addr) = sock.recvfrom(65535)
+			except socket.error:
+				break
+			if (sock is self.upstream_socket) and (addr != self.upstream_tuple):
+				continue
+			handler(packet, addr)
+
+	def serve(self):
+		while True:
+			now = common.monotonic()
+			wait = 1.0
+			if self.delayed:
+				wait = max(0.0, min(wait, self.delayed[0][0] - now))
+
+			for (fd, readable, writable) in self.poller.poll(wait):
+				if fd == self.client_socket.fileno():
+					self.drain(self.client_socket, self.handle_query)
+				elif fd == self.upstream_socket.fileno():
+					self.drain(self.upstream_socket, lambda packet, addr: self.handle_answer(packet))
+				elif fd in self.clients:
+					self.handle_upstream(fd, readable, writable)
+				elif self.streams:
+					self.streams.handle(fd, readable, writable)
+
+			now = common.monotonic()
+			self.flush_delayed(now)
+			self.expire(now)
+			if self.streams:
+				self.streams.expire(now)
+
+	def print_stats(self):
+		print("")
+		internal_print("Resolver statistics:")
+		for i in xrange(len(RESOLVER_STATS)):
+			internal_print("{0}: {1}".format(RESOLVER_STATS[i], self.stats[i]))
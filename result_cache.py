@@ -0,0 +1,149 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+
+if "result_cache.py" in sys.argv[0]:
+	print("[-] Instead of poking around just try: python main.py --help")
+	sys.exit(-1)
+
+import os
+import json
+import time
+
+CACHE_VERSION = 1
+# seconds a cached check stays fresh
+DEFAULT_TTL = 3600.0
+
+# the outcome of a finished probe as plain JSON types
+def probe_record(probe):
+	record = {
+		"type": probe.record_type1,
+		"answer_type": probe.record_type2,
+		"num": probe.num,
+		"length": probe.length,
+		"domain_length": probe.domain_length,
+		"edns": probe.edns_size,
+		"tcp": probe.tcp,
+		"encoding": None,
+		"result": probe.result,
+		"rtt": probe.rtt,
+		"attempts": probe.attempts,
+		"late": probe.late,
+		"rcode": probe.rcode,
+		"size": probe.size,
+		"truncated": probe.truncated,
+		"message": probe.message,
+	}
+	if probe.encoding:
+		record["encoding"] = probe.encoding.get_name()
+
+	return record
+
+# a finished (or skipped) check with its probes, the same in the results
+# and in the cache
+def check_record(task, probes):
+	return {
+		"name": task.name,
+		"critical": task.critical,
+		"state": task.state,
+		"cached": task.cached,
+		"result": task.result,
+		"time": task.finished_at,
+		"summary": task.summary,
+		"output": [[kind, list(args)] for (kind, args) in task.output],
+		"probes": probes,
+	}
+
+def cache_key(nameserver, port, domain):
+	return "{0}:{1} {2}".format(nameserver, port, domain)
+
+# A check that worked, or one that failed although every probe of it was
+# answered, e.g. a resolver that strips EDNS. A lost packet may go through
+# the next time, so such failures are not settled.
+def settled(entry):
+	if entry.get("result"):
+		return True
+	probes = entry.get("probes", [])
+
+	return bool(probes) and not [probe for probe in probes if probe.get("rtt") is None]
+
+# Results of earlier runs in a JSON file, the checks of every nameserver,
+# port and domain by name. Only settled checks are taken from the cache and
+# only while they are younger than ttl seconds, the others run again and
+# replace the old entries.
+class Result_Cache():
+	def __init__(self, filename, key, ttl=DEFAULT_TTL):
+		self.filename = filename
+		self.key = key
+		self.ttl = ttl
+		self.resolvers = {}
+		self.hits = 0
+
+	# a missing file is an empty cache, a broken one raises IOError or
+	# ValueError
+	def load(self):
+		if not os.path.exists(self.filename):
+			return
+		f = open(self.filename, "r")
+		try:
+			document = json.load(f)
+		finally:
+			f.close()
+		if (not isinstance(document, dict)) or (document.get("version") != CACHE_VERSION):
+			raise ValueError("unknown cache format")
+		self.resolvers = document.get("resolvers", {})
+
+	def fresh(self, entry, now):
+		return (0 <= now - entry.get("time", 0) < self.ttl)
+
+	def lookup(self, name):
+		entry = self.resolvers.get(self.key, {}).get(name)
+		if (not entry) or (not settled(entry)) or (not self.fresh(entry, time.time())):
+			return None
+		self.hits += 1
+
+		return entry
+
+	def update(self, name, record):
+		entry = dict(record)
+		for field in ("name", "critical", "state", "cached"):
+			entry.pop(field, None)
+		self.resolvers.setdefault(self.key, {})[name] = entry
+
+	# stale entries are dropped, the file is replaced in one step
+	def save(self):
+		now = time.time()
+		resolvers = {}
+		for (key, checks) in self.resolvers.items():
+			checks = dict([(name, entry) for (name, entry) in checks.items() if self.fresh(entry, now)])
+			if checks:
+				resolvers[key] = checks
+
+		temporary = self.filename + ".tmp"
+		f = open(temporary, "w")
+		try:
+			json.dump({"version": CACHE_VERSION, "resolvers": resolvers}, f, indent=1, sort_keys=True)
+		finally:
+			f.close()
+		os.rename(temporary, self.filename)
+		self.resolvers = resolvers
@@ -0,0 +1,165 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+
+if "scheduler.py" in sys.argv[0]:
+	print("[-] Instead of poking around just try: python main.py --help")
+	sys.exit(-1)
+
+import time
+
+from common import internal_print, internal_dot_print
+
+def newline():
+	sys.stdout.write("\n")
+
+# the buffered output is kept as (kind, arguments), so it can be saved
+OUTPUT_FUNCTIONS = {"print": internal_print, "dot": internal_dot_print, "newline": newline}
+
+# One check of the client. function(task, *args) is a generator: it submits
+# probes to the query engine and yields them, it is resumed when all of them
+# are done. It sets task.result, tasks in depends need a True result, tasks
+# in after only have to be finished. Output is buffered and printed in the
+# order the tasks were added, so concurrent checks do not mix their lines.
+# task.summary holds what the check measured, with cache a finished check
+# can be restored from an earlier run instead of running it again.
+class Task():
+	def __init__(self, name, function, args=(), depends=(), after=(), critical=False, cache=True):
+		self.name = name
+		self.function = function
+		self.args = args
+		self.depends = list(depends)
+		self.after = list(after)
+		self.critical = critical
+		self.cache = cache
+
+		self.state = "waiting"
+		self.result = False
+		self.generator = None
+		self.probes = []
+		self.output = []
+		self.summary = {}
+		self.cached = False
+		self.finished_at = None
+
+	def finished(self):
+		return self.state in ("done", "skipped")
+
+	def internal_print(self, message, newline = 1, feedback = 0):
+		self.output.append(("print", (message, newline, feedback)))
+
+	def internal_dot_print(self, feedback):
+		self.output.append(("dot", (feedback, )))
+
+	def newline(self):
+		self.output.append(("newline", ()))
+
+	def flush(self):
+		for (kind, args) in self.output:
+			OUTPUT_FUNCTIONS[kind](*args)
+
+# restore(task) is tried before a task with cache is started, if it returns
+# True the task is done without running. Only tasks whose dependencies were
+# restored as well, a check that ran again may have changed their input. A
+# task skipped because of restored failures counts as restored too.
+class Probe_Scheduler():
+	def __init__(self, engine, concurrency=4, restore=None):
+		self.engine = engine
+		self.concurrency = concurrency
+		self.restore = restore
+		self.tasks = []
+		self.printed = 0
+
+	def add(self, name, function, args=(), depends=(), after=(), critical=False, cache=True):
+		task = Task(name, function, args, depends, after, critical, cache)
+		self.tasks.append(task)
+
+		return task
+
+	def running(self):
+		return [task for task in self.tasks if task.state == "running"]
+
+	def start_ready(self):
+		changed = True
+		while changed:
+			changed = False
+			for task in self.tasks:
+				if task.state != "waiting":
+					continue
+				failed = [dependency for dependency in task.depends if dependency.finished() and not dependency.result]
+				if failed:
+					task.state = "skipped"
+					task.cached = not [dependency for dependency in failed if not dependency.cached]
+					changed = True
+					continue
+				if [dependency for dependency in task.depends + task.after if not dependency.finished()]:
+					continue
+				if self.restore and task.cache and not [dependency for dependency in task.depends + task.after if not dependency.cached] and self.restore(task):
+					task.state = "done"
+					changed = True
+					continue
+				if len(self.running()) >= self.concurrency:
+					return
+				task.state = "running"
+				task.generator = task.function(task, *task.args)
+				self.advance(task)
+				changed = True
+
+	def advance(self, task):
+		# probes submitted by the task are timed under its name
+		self.engine.phase = task.name
+		try:
+			if task.generator is None:
+				raise StopIteration
+			task.probes = task.generator.next()
+		except StopIteration:
+			task.state = "done"
+			task.probes = []
+			task.finished_at = time.time()
+
+	def flush(self):
+		while (self.printed < len(self.tasks)) and self.tasks[self.printed].finished():
+			self.tasks[self.printed].flush()
+			self.printed += 1
+
+	def run(self):
+		while True:
+			self.start_ready()
+			self.flush()
+			running = self.running()
+			if not running:
+				break
+
+			if [task for task in running if [probe for probe in task.probes if not probe.done]]:
+				self.engine.step(self.engine.timeout)
+			for task in running:
+				if not [probe for probe in task.probes if not probe.done]:
+					self.advance(task)
+
+		# nothing can run any more, e.g. a dependency was never added
+		for task in self.tasks:
+			if task.state == "waiting":
+				task.state = "skipped"
+		self.flush()
+
+		return [task for task in self.tasks if task.critical and not task.result]
@@ -0,0 +1,93 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import unittest
+
+import dns_proto
+import answer_cache
+import estimator
+
+DOMAIN = "example.com."
+
+# the same characters in the same order however they are asked for
+class Stream_Payload():
+	def __init__(self):
+		self.position = 0
+
+	def get(self, length):
+		text = "".join([chr(ord("a") + (i * 7) % 26) for i in xrange(self.position, self.position + length)])
+		self.position += length
+		return text
+
+class Answer_Cache_Test(unittest.TestCase):
+	def setUp(self):
+		self.DNS_proto = dns_proto.DNS_Proto()
+
+	def question(self, RRtype, num, length):
+		hostname = "{0:03d}{1:03d}{2}.abcdef.".format(num, length, RRtype.name.lower())
+		return dns_proto.hostname_to_hostnamebin(hostname + DOMAIN) + dns_proto.question_struct.pack(RRtype.code, 1)
+
+	def direct(self, RRtype, num, length, question):
+		payload = Stream_Payload()
+		data = [RRtype.packer(payload.get(length)) for i in xrange(num)]
+		return dns_proto.DNS_Proto().build_answer(4321, [RRtype.name, "", data, num, DOMAIN], question)
+
+	def test_same_as_build_answer(self):
+		for RRtype in [self.DNS_proto.RR_types[code] for code in sorted(self.DNS_proto.RR_types)]:
+			if not RRtype.servable:
+				continue
+			for (num, length) in ((1, 10), (5, 60), (16, 200)):
+				length = estimator.FIXED_SIZES.get(RRtype.name, length)
+				question = self.question(RRtype, num, length)
+				cache = answer_cache.Answer_Cache(self.DNS_proto, Stream_Payload())
+				(cached, direct) = (cache.build_answer(4321, RRtype.name, RRtype, num, length, DOMAIN, question), self.direct(RRtype, num, length, question))
+				if RRtype.name == "RRSIG":
+					# the validity follows the clock, which may tick in between
+					self.assertEqual(len(cached), len(direct))
+				else:
+					self.assertEqual(cached, direct, RRtype.name)
+				self.assertEqual(cache.misses, 1)
+
+	def test_template_is_reused(self):
+		RRtype = self.DNS_proto.RR_types.get_by_name("TXT")
+		question = self.question(RRtype, 3, 50)
+		cache = answer_cache.Answer_Cache(self.DNS_proto, Stream_Payload())
+		first = cache.build_answer(1, "TXT", RRtype, 3, 50, DOMAIN, question)
+		second = cache.build_answer(2, "TXT", RRtype, 3, 50, DOMAIN, question)
+
+		self.assertEqual((cache.hits, cache.misses), (1, 1))
+		self.assertEqual(len(first), len(second))
+		# new transaction ID and fresh payload
+		self.assertNotEqual(first[:2], second[:2])
+		self.assertNotEqual(first[12:], second[12:])
+
+	def test_least_recently_used_is_evicted(self):
+		RRtype = self.DNS_proto.RR_types.get_by_name("NULL")
+		cache = answer_cache.Answer_Cache(self.DNS_proto, Stream_Payload(), size=2)
+		for length in (10, 20, 10, 30):
+			cache.build_answer(1, "NULL", RRtype, 1, length, DOMAIN, self.question(RRtype, 1, length))
+
+		self.assertEqual(sorted([key[2] for key in cache.templates]), [10, 30])
+
+if __name__ == "__main__":
+	unittest.main()
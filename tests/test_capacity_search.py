@@ -0,0 +1,94 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import unittest
+
+import dns_proto
+import query_engine
+import capacity_search
+
+DOMAIN = "example.com."
+
+# answers a probe like a resolver that lets through everything up to limit
+def answer(probe, value, limit, lost=False):
+	if lost:
+		return probe
+	probe.rtt = 0.01
+	probe.result = value <= limit
+
+	return probe
+
+class Search_Test(unittest.TestCase):
+	def search(self, limit, found, lost=()):
+		search = capacity_search.Search("TXT", "num", 0, False, 10, limit)
+		lost = list(lost)
+		while not search.done():
+			value = search.next_value()
+			probe = search.probe(value)
+			search.update(value, answer(probe, value, found, value in lost))
+			if value in lost:
+				lost.remove(value)
+
+		return search.result()
+
+	def test_finds_the_largest(self):
+		for found in (0, 1, 17, 500, 998, 999):
+			result = self.search(999, found)
+			self.assertEqual(result.value, found)
+			# a binary search of 1000 values
+			self.assertTrue(result.queries <= 10, found)
+
+	def test_lost_answer_is_asked_again(self):
+		result = self.search(999, 700, lost=[500])
+
+		self.assertEqual(result.value, 700)
+		self.assertEqual(result.queries, self.search(999, 700).queries + 1)
+
+	def test_probe_dimension(self):
+		search = capacity_search.Search("CNAME", "length", 1, True, 10, 255)
+		probe = search.probe(100)
+
+		self.assertEqual((probe.num, probe.length, probe.tcp), (1, 100, True))
+
+class Capacity_Search_Test(unittest.TestCase):
+	def setUp(self):
+		self.capacity = capacity_search.Capacity_Search(None, dns_proto.DNS_Proto(), DOMAIN)
+
+	def test_local_limit(self):
+		# a TXT string has a one byte length
+		self.assertEqual(self.capacity.local_limit("TXT", "length", 10), 255)
+		num = self.capacity.local_limit("A", "num", 4, 512)
+		self.assertTrue(self.capacity.answer_size("A", num, 4) <= 512)
+		self.assertTrue(self.capacity.answer_size("A", num + 1, 4) > 512)
+
+	def test_size_answers(self):
+		steps = []
+		for length in xrange(1, 256):
+			first = self.capacity.answer_size("CNAME", 1, length)
+			steps.append((length, first, self.capacity.answer_size("CNAME", 2, length) - first))
+		for size in (512, 1232, 4096):
+			(num, length) = self.capacity.size_answers(steps, size)
+			self.assertTrue(size - 100 < self.capacity.answer_size("CNAME", num, length) <= size, size)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,130 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import unittest
+import struct
+
+import dns_proto
+
+def pointer(offset):
+	return struct.pack(">H", 0xC000 | offset)
+
+class Name_Parsing_Test(unittest.TestCase):
+	def test_plain(self):
+		name = dns_proto.hostname_to_hostnamebin("www.example.com.")
+
+		self.assertEqual(dns_proto.hostnamebin_to_hostname(name), (len(name), "www.example.com."))
+		self.assertEqual(dns_proto.skip_hostname(name), len(name))
+		self.assertEqual(dns_proto.hostnamebin_to_hostname("\x00"), (1, ""))
+
+	def test_pointer(self):
+		msg = "\x00" * 12 + dns_proto.hostname_to_hostnamebin("example.com.")
+		offset = len(msg)
+		msg += "\x03www" + pointer(12)
+
+		# the length ends at the pointer, the name follows it
+		self.assertEqual(dns_proto.hostnamebin_to_hostname(msg, offset), (6, "www.example.com."))
+		self.assertEqual(dns_proto.skip_hostname(msg, offset), 6)
+		# a name that is only a pointer
+		self.assertEqual(dns_proto.hostnamebin_to_hostname(msg + pointer(offset), len(msg)), (2, "www.example.com."))
+
+	def test_chained_pointers(self):
+		msg = "\x00" * 12 + "\x03com\x00"
+		msg += "\x07example" + pointer(12)
+		msg += "\x03www" + pointer(17)
+
+		self.assertEqual(dns_proto.hostnamebin_to_hostname(msg, 27), (6, "www.example.com."))
+
+	def test_loops(self):
+		# a pointer to itself and two pointers to each other
+		self.assertEqual(dns_proto.hostnamebin_to_hostname("\x00" * 12 + pointer(12), 12), (0, ""))
+		msg = "\x00" * 12 + "\x01a" + pointer(16) + "\x01b" + pointer(12)
+		self.assertEqual(dns_proto.hostnamebin_to_hostname(msg, 16), (0, ""))
+
+	def test_forward_pointer(self):
+		msg = "\x00" * 12 + pointer(14) + dns_proto.hostname_to_hostnamebin("example.com.")
+
+		self.assertEqual(dns_proto.hostnamebin_to_hostname(msg, 12), (0, ""))
+
+	def test_too_many_pointers(self):
+		# every pointer goes back to the previous one
+		msg = "\x00" * 12 + "\x00"
+		for i in xrange(dns_proto.MAX_POINTERS + 1):
+			msg += pointer(len(msg) - (1 if i == 0 else 2))
+		self.assertEqual(dns_proto.hostnamebin_to_hostname(msg, len(msg) - 2), (0, ""))
+		self.assertEqual(dns_proto.hostnamebin_to_hostname(msg, len(msg) - 4), (2, ""))
+
+	def test_malformed(self):
+		for (msg, offset) in (("", 0), ("\x03ww", 0), ("\x03www", 0), ("\x40abc\x00", 0), ("\x80abc\x00", 0), ("\xc0", 0)):
+			self.assertEqual(dns_proto.hostnamebin_to_hostname(msg, offset), (0, ""), repr(msg))
+			self.assertEqual(dns_proto.skip_hostname(msg, offset), 0, repr(msg))
+
+class Name_Compression_Test(unittest.TestCase):
+	def builder(self, question_name):
+		builder = dns_proto.Packet_Builder()
+		builder.parts.append(dns_proto.header_placeholder)
+		builder.parts.append(dns_proto.hostname_to_hostnamebin(question_name) + dns_proto.question_struct.pack(1, 1))
+		return builder
+
+	def test_suffix_of_the_question(self):
+		builder = self.builder("abc.example.com.")
+		name = dns_proto.compress_hostname(builder, "ns1.example.com.", builder.tell())
+
+		# one label and a pointer to example.com. in the question
+		self.assertEqual(name, "\x03ns1" + pointer(16))
+		msg = builder.getvalue() + name
+		self.assertEqual(dns_proto.hostnamebin_to_hostname(msg, len(msg) - len(name))[1], "ns1.example.com.")
+
+	def test_case_insensitive(self):
+		builder = self.builder("abc.Example.COM.")
+
+		self.assertEqual(dns_proto.compress_hostname(builder, "example.com", builder.tell()), pointer(16))
+
+	def test_new_names_are_indexed(self):
+		builder = self.builder("abc.example.com.")
+		offset = builder.tell()
+		first = dns_proto.compress_hostname(builder, "mail.other.org.", offset)
+		builder.parts.append(first)
+		second = dns_proto.compress_hostname(builder, "www.other.org.", builder.tell())
+
+		self.assertEqual(first, dns_proto.hostname_to_hostnamebin("mail.other.org."))
+		self.assertEqual(second, "\x03www" + pointer(offset + 5))
+		msg = builder.getvalue() + second
+		self.assertEqual(dns_proto.hostnamebin_to_hostname(msg, len(msg) - len(second))[1], "www.other.org.")
+
+	def test_soa_round_trip(self):
+		DNS_proto = dns_proto.DNS_Proto()
+		question = dns_proto.hostname_to_hostnamebin("example.com.") + dns_proto.question_struct.pack(6, 1)
+		answer = DNS_proto.build_answer(1, ["SOA", "", "ns1.example.com.", "hostmaster.example.com.", 1, 2, 3, 4, 5], question)
+		message = DNS_proto.parse_message(answer, "example.com.")
+		data = message.answers[0].data
+
+		(length, mname) = dns_proto.hostnamebin_to_hostname(answer, message.answers[0].offset)
+		self.assertEqual(mname, "ns1.example.com.")
+		self.assertEqual(dns_proto.hostnamebin_to_hostname(answer, message.answers[0].offset + length)[1], "hostmaster.example.com.")
+		self.assertEqual(struct.unpack(">IIIII", data[-20:]), (1, 2, 3, 4, 5))
+		# both names end in a pointer
+		self.assertTrue(len(data) < len("ns1.example.com.hostmaster.example.com.") + 20)
+
+if __name__ == "__main__":
+	unittest.main()
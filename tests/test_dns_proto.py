@@ -0,0 +1,101 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import unittest
+import struct
+
+import dns_proto
+
+DOMAIN = "example.com."
+
+def make_answer(DNS_proto, record_type, num, length, edns=False):
+	RRtype = DNS_proto.RR_types.get_by_name(record_type)
+	hostname = "{0:03d}{1:03d}{2}.abcdef.".format(num, length, record_type.lower())
+	question = dns_proto.hostname_to_hostnamebin(hostname + DOMAIN) + dns_proto.question_struct.pack(RRtype.code, 1)
+	data = [RRtype.packer(("0123456789abcdef" * 16)[i:i+length]) for i in xrange(num)]
+	answer = DNS_proto.build_answer(4321, [record_type, "", data, num, DOMAIN], question)
+	if edns:
+		# an additional record that is not in the answer section
+		answer = answer[:10] + struct.pack(">H", 1) + answer[12:] + DNS_proto.build_record_OPT()
+
+	return (answer, hostname + DOMAIN, data)
+
+class Parse_Message_Test(unittest.TestCase):
+	def setUp(self):
+		self.DNS_proto = dns_proto.DNS_Proto()
+
+	def test_same_as_parse_dns(self):
+		for (record_type, num, length) in (("A", 1, 4), ("A", 30, 4), ("AAAA", 3, 16), ("CNAME", 1, 10), ("CNAME", 20, 180), ("MX", 4, 30),
+			("SRV", 4, 30), ("TXT", 16, 250), ("NULL", 2, 100), ("PRIVATE", 2, 100), ("DNSKEY", 2, 100), ("RRSIG", 2, 100)):
+			for edns in (False, True):
+				(answer, hostname, data) = make_answer(self.DNS_proto, record_type, num, length, edns)
+				message = self.DNS_proto.parse_message(answer, DOMAIN)
+				(transaction_id, is_query, qtype, nquestions, questions, orig_question, nanswers, answers) = self.DNS_proto.parse_dns(answer, DOMAIN)
+
+				self.assertEqual(message.transaction_id, transaction_id)
+				self.assertEqual(message.is_query, is_query)
+				self.assertEqual(message.questions[0].type, qtype)
+				self.assertEqual(message.questions[0].name, questions[0]["name"])
+				self.assertEqual(message.orig_question, orig_question)
+				self.assertEqual(len(message.answers), nanswers)
+				self.assertEqual(message.nadditional, int(edns))
+				for i in xrange(nanswers):
+					record = message.answers[i]
+					self.assertEqual(record.type, answers[i]["type"])
+					self.assertEqual(record.rclass, answers[i]["class"])
+					self.assertEqual(record.ttl, answers[i]["ttl"])
+					self.assertEqual(record.data, answers[i]["data"])
+					# the owner is a pointer to the question, decoded on request
+					self.assertEqual(record.name, hostname)
+				self.assertEqual(sorted([record.rdata for record in message.answers]), sorted([d.replace(".", "") for d in data]))
+
+	def test_uncompressed_owner(self):
+		(answer, hostname, data) = make_answer(self.DNS_proto, "A", 2, 4)
+		owner = dns_proto.hostname_to_hostnamebin(hostname)
+		answer = answer.replace("\xc0\x0c", owner)
+		message = self.DNS_proto.parse_message(answer, DOMAIN)
+
+		self.assertEqual(len(message.answers), 2)
+		self.assertEqual([record.name for record in message.answers], [hostname, hostname])
+		self.assertEqual([record.rdata for record in message.answers], data)
+		self.assertEqual(message.length, len(answer))
+
+	def test_case_randomised_question(self):
+		(answer, hostname, data) = make_answer(self.DNS_proto, "TXT", 1, 10)
+		answer = answer[:12] + answer[12:12+len(hostname)+1].upper() + answer[12+len(hostname)+1:]
+
+		self.assertNotEqual(self.DNS_proto.parse_message(answer, DOMAIN), None)
+
+	def test_rejects(self):
+		(answer, hostname, data) = make_answer(self.DNS_proto, "CNAME", 3, 20)
+
+		self.assertEqual(self.DNS_proto.parse_message(answer, "other.com."), None)
+		self.assertEqual(self.DNS_proto.parse_message(answer[:11], DOMAIN), None)
+		# every truncation inside the answers
+		for end in xrange(len(hostname) + 17, len(answer)):
+			self.assertEqual(self.DNS_proto.parse_message(answer[:end], DOMAIN), None)
+		# two questions
+		self.assertEqual(self.DNS_proto.parse_message(answer[:4] + "\x00\x02" + answer[6:], DOMAIN), None)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,98 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import unittest
+import socket
+
+import common
+import dns_tcp
+
+class Stream_Server_Test(unittest.TestCase):
+	def setUp(self):
+		self.listener = dns_tcp.create_listener(("127.0.0.1", 0), False)
+		self.poller = common.Poller()
+		self.server = dns_tcp.Stream_Server(self.listener, lambda message, connection: "answer " + message, self.poller)
+		self.client = socket.create_connection(self.listener.getsockname(), 5)
+
+	def tearDown(self):
+		self.client.close()
+		for connection in self.server.connections.values():
+			self.server.close(connection)
+		self.listener.close()
+
+	# runs the server until the client sees the end of the stream
+	def answers(self):
+		self.client.setblocking(0)
+		data = ""
+		for i in xrange(100):
+			for (fd, readable, writable) in self.poller.poll(0.05):
+				self.server.handle(fd, readable, writable)
+			try:
+				received = self.client.recv(65536)
+			except socket.error:
+				continue
+			if not received:
+				break
+			data += received
+
+		messages = []
+		while data:
+			length = dns_tcp.length_struct.unpack_from(data, 0)[0]
+			messages.append(data[2:2+length])
+			data = data[2+length:]
+
+		return messages
+
+	def test_answers_after_half_close(self):
+		self.client.sendall(dns_tcp.frame("one") + dns_tcp.frame("two"))
+		self.client.shutdown(socket.SHUT_WR)
+
+		self.assertEqual(self.answers(), ["answer one", "answer two"])
+		self.assertEqual(self.server.answered, 2)
+		self.assertEqual(self.server.failed, 0)
+		self.assertEqual(self.server.connections, {})
+
+	def test_incomplete_message_is_dropped(self):
+		self.client.sendall(dns_tcp.frame("one") + dns_tcp.frame("two")[:4])
+		self.client.shutdown(socket.SHUT_WR)
+
+		self.assertEqual(self.answers(), ["answer one"])
+		self.assertEqual(self.server.connections, {})
+
+	def test_client_side_closes_at_the_end(self):
+		connection = dns_tcp.Stream_Connection(self.client, None)
+		for i in xrange(100):
+			for (fd, readable, writable) in self.poller.poll(0.05):
+				self.server.handle(fd, readable, writable)
+			if self.server.connections:
+				break
+		for server_connection in self.server.connections.values():
+			self.server.close(server_connection)
+		# waits for the end of the stream
+		self.client.settimeout(5)
+
+		self.assertEqual(connection.read(), [])
+		self.assertTrue(connection.closed)
+
+if __name__ == "__main__":
+	unittest.main()
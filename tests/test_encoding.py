@@ -0,0 +1,72 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import unittest
+import os
+
+import encoding
+
+class Encoding_Test(unittest.TestCase):
+	def test_round_trips(self):
+		samples = ["", "\x00", "\xff" * 3, "".join([chr(i) for i in xrange(256)])] + [os.urandom(length) for length in xrange(1, 40)]
+		for encoding_class in encoding.ENCODINGS:
+			for data in samples:
+				text = encoding_class.encode(data)
+				self.assertEqual(len(text), encoding_class.get_encoded_length(len(data)), encoding_class.get_name())
+				self.assertEqual(encoding_class.decode(text), data, (encoding_class.get_name(), repr(data)))
+				self.assertEqual(encoding_class.get_maximum_length(len(text)), len(data), encoding_class.get_name())
+
+	def test_known_values(self):
+		self.assertEqual(encoding.Base32().encode("hello"), "nbswy3dp")
+		self.assertEqual(encoding.Base64().encode("\xfb\xff"), "-_8")
+		self.assertEqual(encoding.Base128().encode("\x00" * 7), "a" * 8)
+
+	def test_name_encodings_fit_into_labels(self):
+		data = "".join([chr(i) for i in xrange(256)])
+		for encoding_class in encoding.NAME_ENCODINGS:
+			text = encoding_class.encode(data)
+			self.assertFalse("." in text, encoding_class.get_name())
+			self.assertFalse("\x00" in text, encoding_class.get_name())
+
+	def test_base32_ignores_case(self):
+		data = os.urandom(30)
+
+		self.assertEqual(encoding.Base32().decode(encoding.Base32().encode(data).upper()), data)
+
+	def test_invalid(self):
+		for (encoding_class, text) in ((encoding.Base32(), "a"), (encoding.Base32(), "abc"), (encoding.Base32(), "abcdefg1"),
+			(encoding.Base64(), "a"), (encoding.Base64(), "ab+c"), (encoding.Base64(), "ab.c"),
+			(encoding.Base128(), "a"), (encoding.Base128(), "ab.c")):
+			self.assertRaises(ValueError, encoding_class.decode, text)
+
+	def test_get_by_name(self):
+		self.assertEqual(encoding.get_by_name("base64").get_name(), "base64")
+		self.assertEqual(encoding.get_by_name("base16"), None)
+
+	def test_test_data(self):
+		self.assertEqual(len(encoding.test_data("seed", 100)), 100)
+		self.assertEqual(encoding.test_data("seed", 50), encoding.test_data("seed", 100)[:50])
+		self.assertNotEqual(encoding.test_data("seed", 50), encoding.test_data("other", 50))
+
+if __name__ == "__main__":
+	unittest.main()
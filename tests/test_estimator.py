@@ -0,0 +1,103 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import unittest
+
+import dns_proto
+import encoding
+import estimator
+import capacity_search
+import histogram
+
+DOMAIN = "example.com."
+
+def result(record_type, dimension, edns, value, tcp=False):
+	return capacity_search.Search_Result(record_type, dimension, edns, tcp, value, 999, 10)
+
+class Goodput_Estimator_Test(unittest.TestCase):
+	def setUp(self):
+		self.estimator = estimator.Goodput_Estimator(dns_proto.DNS_Proto(), DOMAIN)
+
+	def test_answer_capacity(self):
+		self.assertEqual(self.estimator.answer_capacity("A", 4, encoding.Raw()), 4)
+		self.assertEqual(self.estimator.answer_capacity("AAAA", 16, encoding.Raw()), 16)
+		self.assertEqual(self.estimator.answer_capacity("TXT", 255, encoding.Raw()), 255)
+		self.assertEqual(self.estimator.answer_capacity("TXT", 200, encoding.Base32()), 125)
+
+	def test_data_fits_into_the_answer(self):
+		for record_type in ("CNAME", "MX", "SRV", "TXT", "NULL", "PRIVATE", "DNSKEY", "RRSIG"):
+			for encoding_class in encoding.NAME_ENCODINGS:
+				for length in (10, 63, 64, 180, 999):
+					capacity = self.estimator.answer_capacity(record_type, length, encoding_class)
+					self.assertTrue(0 < capacity, (record_type, length))
+					self.assertTrue(encoding_class.get_encoded_length(capacity) <= length, (record_type, encoding_class.get_name(), length))
+
+	def test_upstream_capacity(self):
+		upstream = self.estimator.upstream_capacity(estimator.MAX_NAME_LENGTH, encoding.Base32())
+		text = encoding.Base32().encode("x" * upstream)
+		labels = [text[i:i+63] for i in xrange(0, len(text), 63)]
+
+		self.assertTrue(len(dns_proto.hostname_to_hostnamebin(".".join(labels) + "." + DOMAIN)) <= estimator.MAX_NAME_LENGTH)
+
+	def test_estimate_picks_the_largest_downstream(self):
+		results = [result("TXT", "num", 0, 20), result("TXT", "num", 1, 300), result("TXT", "length", 1, 255),
+			result("TXT", "num", 0, 900, tcp=True), result("NULL", "num", 1, 999)]
+		estimate = self.estimator.estimate("TXT", results, 0.1, 0.0, 100, encoding.Raw())
+
+		# 300 answers of 10 bytes over UDP, TCP does not count
+		self.assertEqual((estimate.edns, estimate.num, estimate.length, estimate.downstream), (1, 300, 10, 3000))
+		self.assertAlmostEqual(estimate.downstream_rate, 30000.0)
+		self.assertAlmostEqual(estimate.upstream_rate, 1000.0)
+
+	def test_window_and_loss(self):
+		windowed = estimator.Goodput_Estimator(dns_proto.DNS_Proto(), DOMAIN, window=8)
+		estimate = windowed.estimate("TXT", [result("TXT", "length", 0, 255)], 0.2, 0.25, 100, encoding.Raw())
+
+		self.assertAlmostEqual(estimate.downstream_rate, 255 * 8 / 0.2 * 0.75)
+
+	def test_rank(self):
+		results = [result("A", "num", 0, 28), result("TXT", "length", 0, 255), result("CNAME", "num", 0, 18)]
+		estimates = self.estimator.rank(results, {"A": 0.1, "TXT": 0.1, "CNAME": 0.1, "NULL": 0.1}, 0.0, 200, {"TXT": encoding.Raw()})
+
+		self.assertEqual([estimate.record_type for estimate in estimates], ["TXT", "A", "CNAME"])
+		self.assertEqual([estimate.encoding for estimate in estimates], ["raw", "raw", "base32"])
+
+	def test_same_round_trips_rank_the_same(self):
+		latency = histogram.Latency_Recorder()
+		for rtt in (0.002, 0.003, 0.004):
+			latency.record("round trip", "MX", rtt)
+			latency.record("round trip", "SRV", rtt)
+		# big answers of other checks do not count
+		for rtt in (0.08, 0.09, 0.1):
+			latency.record("capacity", "SRV", rtt)
+			latency.record("EDNS size", "SRV", rtt)
+		rtts = latency.medians("round trip")
+		results = [result("MX", "length", 0, 200), result("SRV", "length", 0, 200)]
+		estimates = self.estimator.rank(results, rtts, 0.0, 200)
+
+		self.assertEqual(rtts["MX"], rtts["SRV"])
+		self.assertEqual([estimate.rtt for estimate in estimates], [rtts["MX"]] * 2)
+		self.assertEqual(estimates[0].downstream_rate, estimates[1].downstream_rate)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,92 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import unittest
+
+import histogram
+
+class Latency_Histogram_Test(unittest.TestCase):
+	def test_bucketing(self):
+		h = histogram.Latency_Histogram()
+		for value in (0.0, 0.00001, 0.0000102, 0.001, 1.0, 100.0, 1000.0):
+			h.record(value)
+
+		self.assertEqual(h.buckets[0], 2)
+		# just above the lowest value is the first real bucket
+		self.assertEqual(h.buckets[1], 1)
+		# too big values are kept in the last bucket
+		self.assertEqual(h.buckets[-1], 1)
+		self.assertEqual(sum(h.buckets), 7)
+		self.assertEqual((h.count, h.min, h.max), (7, 0.0, 1000.0))
+
+	def test_bucket_edges(self):
+		h = histogram.Latency_Histogram(lowest=1.0, highest=100.0, growth=2.0)
+		for (value, index) in ((1.0, 0), (1.5, 1), (2.5, 2), (3.9, 2), (4.5, 3), (99.0, 7), (1000.0, len(h.buckets) - 1)):
+			before = h.buckets[index]
+			h.record(value)
+			self.assertEqual(h.buckets[index], before + 1, value)
+
+	def test_percentiles(self):
+		h = histogram.Latency_Histogram()
+		for i in xrange(1, 101):
+			h.record(i / 1000.0)
+
+		# every value is known within the growth factor
+		for p in histogram.PERCENTILES:
+			self.assertTrue(p / 1000.0 <= h.percentile(p) <= p / 1000.0 * h.growth, p)
+		self.assertEqual(h.percentile(100), 0.1)
+		self.assertAlmostEqual(h.mean(), 0.0505)
+
+	def test_empty(self):
+		h = histogram.Latency_Histogram()
+
+		self.assertEqual(h.percentile(50), None)
+		self.assertEqual(h.mean(), None)
+
+	def test_merge(self):
+		(a, b, both) = (histogram.Latency_Histogram(), histogram.Latency_Histogram(), histogram.Latency_Histogram())
+		for value in (0.001, 0.002, 0.5):
+			a.record(value)
+			both.record(value)
+		for value in (0.0001, 3.0):
+			b.record(value)
+			both.record(value)
+		a.merge(b)
+		a.merge(histogram.Latency_Histogram())
+
+		self.assertEqual(a.buckets, both.buckets)
+		self.assertEqual(a.summary(), both.summary())
+
+class Latency_Recorder_Test(unittest.TestCase):
+	def test_export(self):
+		recorder = histogram.Latency_Recorder()
+		recorder.record("basic", "A", 0.01)
+		recorder.record("basic", "A", None)
+		recorder.record("capacity", "TXT", 0.02)
+
+		exported = recorder.export()
+		self.assertEqual([(row["phase"], row["record_type"], row["count"], row["timeouts"]) for row in exported], [("basic", "A", 1, 1), ("capacity", "TXT", 1, 0)])
+		self.assertEqual(recorder.total().count, 2)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,103 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import unittest
+import urllib2
+
+import metrics
+
+def worker(queries, answers, errors=()):
+	worker_metrics = metrics.Server_Metrics()
+	for (record_type, transport, address) in queries:
+		worker_metrics.query(record_type, transport, (address, 5353))
+	for (size, address) in answers:
+		worker_metrics.answer(size, (address, 5353))
+	for reason in errors:
+		worker_metrics.error(reason)
+
+	return worker_metrics.snapshot()
+
+class Server_Metrics_Test(unittest.TestCase):
+	def setUp(self):
+		self.first = worker([("TXT", "udp", "10.0.0.1"), ("TXT", "udp", "10.0.0.2"), ("A", "tcp", "10.0.0.1")], [(100, "10.0.0.1"), (512, "10.0.0.2")], ["garbage"])
+		self.second = worker([("TXT", "udp", "10.0.0.1")], [(513, "10.0.0.1"), (70000, "10.0.0.3")], ["garbage", "not a query"])
+
+	def test_snapshot(self):
+		self.assertEqual(self.first["queries"], {("TXT", "udp"): 2, ("A", "tcp"): 1})
+		self.assertEqual(self.first["resolvers"], {"10.0.0.1": [2, 100], "10.0.0.2": [1, 512]})
+
+	def test_merge(self):
+		total = metrics.merge([self.first, self.second])
+
+		self.assertEqual(total["queries"], {("TXT", "udp"): 3, ("A", "tcp"): 1})
+		self.assertEqual(total["errors"], {"garbage": 2, "not a query": 1})
+		self.assertEqual(total["resolvers"], {"10.0.0.1": [3, 613], "10.0.0.2": [1, 512], "10.0.0.3": [0, 70000]})
+		self.assertEqual(sum(total["sizes"]), 4)
+		self.assertEqual(total["size_sum"], 100 + 512 + 513 + 70000)
+		# the snapshots are not changed
+		self.assertEqual(self.first["resolvers"]["10.0.0.1"], [2, 100])
+
+	def test_exposition(self):
+		text = metrics.exposition(metrics.merge([self.first, self.second]), counters=[("queries_total", "Queries.", 4)], gauges=[("workers", "Worker processes.", 2)])
+		lines = text.splitlines()
+
+		self.assertTrue(text.endswith("\n"))
+		self.assertEqual(lines[:6], [
+			"# HELP dns_checker_queries_total Queries.",
+			"# TYPE dns_checker_queries_total counter",
+			"dns_checker_queries_total 4",
+			"# HELP dns_checker_workers Worker processes.",
+			"# TYPE dns_checker_workers gauge",
+			"dns_checker_workers 2"])
+		self.assertTrue("dns_checker_queries_by_type_total{transport=\"udp\",type=\"TXT\"} 3" in lines)
+		self.assertTrue("dns_checker_errors_total{reason=\"not a query\"} 1" in lines)
+		self.assertTrue("dns_checker_resolver_answer_bytes_total{resolver=\"10.0.0.1\"} 613" in lines)
+		# every family has one HELP and one TYPE line
+		for name in ("queries_by_type_total", "errors_total", "resolver_queries_total", "resolver_answer_bytes_total", "answer_size_bytes"):
+			self.assertEqual(lines.count("# TYPE dns_checker_{0} {1}".format(name, "histogram" if name == "answer_size_bytes" else "counter")), 1)
+			self.assertEqual(len([line for line in lines if line.startswith("# HELP dns_checker_{0} ".format(name))]), 1)
+
+		# cumulative buckets, the bounds are inclusive
+		buckets = dict([(line.split("\"")[1], int(line.split()[-1])) for line in lines if line.startswith("dns_checker_answer_size_bytes_bucket")])
+		self.assertEqual((buckets["256"], buckets["512"], buckets["1024"], buckets["65535"], buckets["+Inf"]), (1, 2, 3, 3, 4))
+		self.assertEqual([buckets[str(bound)] for bound in metrics.SIZE_BUCKETS], sorted([buckets[str(bound)] for bound in metrics.SIZE_BUCKETS]))
+		self.assertTrue("dns_checker_answer_size_bytes_sum 71125" in lines)
+		self.assertTrue("dns_checker_answer_size_bytes_count 4" in lines)
+
+	def test_label_escaping(self):
+		self.assertEqual(metrics.labels(reason="a \"b\"\\\n"), "{reason=\"a \\\"b\\\"\\\\\\n\"}")
+
+	def test_served(self):
+		server = metrics.Metrics_Server(("127.0.0.1", 0), lambda: metrics.exposition(self.first))
+		server.start()
+		try:
+			url = "http://127.0.0.1:{0}/metrics".format(server.httpd.server_address[1])
+			response = urllib2.urlopen(url, timeout=5)
+			self.assertTrue(response.info().getheader("Content-Type").startswith("text/plain; version=0.0.4"))
+			self.assertEqual(response.read(), metrics.exposition(self.first))
+		finally:
+			server.httpd.shutdown()
+			server.httpd.server_close()
+
+if __name__ == "__main__":
+	unittest.main()
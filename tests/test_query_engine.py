@@ -0,0 +1,186 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import unittest
+import socket
+import errno
+
+import common
+import dns_proto
+import payload
+import query_engine
+
+DOMAIN = "example.com."
+SERVER = ("127.0.0.1", 53)
+
+# the time of the engine, moved by the tests
+class Clock():
+	def __init__(self):
+		self.now = 1000.0
+
+	def __call__(self):
+		return self.now
+
+# keeps the sent queries, the tests put the answers into inbox
+class Fake_Socket():
+	def __init__(self):
+		self.sent = []
+		self.inbox = []
+
+	def setblocking(self, flag):
+		pass
+
+	def sendto(self, packet, address):
+		self.sent.append(packet)
+
+	def recvfrom(self, size):
+		if not self.inbox:
+			raise socket.error(errno.EAGAIN, "empty")
+		return (self.inbox.pop(0), SERVER)
+
+class Rtt_Estimator_Test(unittest.TestCase):
+	def test_first_sample(self):
+		rtt = query_engine.Rtt_Estimator()
+		self.assertEqual(rtt.rto, query_engine.INITIAL_RTO)
+		rtt.sample(0.1)
+
+		self.assertAlmostEqual(rtt.srtt, 0.1)
+		self.assertAlmostEqual(rtt.rttvar, 0.05)
+		self.assertAlmostEqual(rtt.rto, 0.3)
+
+	def test_update(self):
+		rtt = query_engine.Rtt_Estimator()
+		rtt.sample(0.1)
+		rtt.sample(0.3)
+
+		# RFC 6298 2.3, RTTVAR first with the old SRTT
+		self.assertAlmostEqual(rtt.rttvar, 0.75 * 0.05 + 0.25 * 0.2)
+		self.assertAlmostEqual(rtt.srtt, 0.875 * 0.1 + 0.125 * 0.3)
+		self.assertAlmostEqual(rtt.rto, rtt.srtt + 4 * rtt.rttvar)
+		self.assertEqual(rtt.samples, 2)
+
+	def test_clamps(self):
+		rtt = query_engine.Rtt_Estimator()
+		rtt.sample(0.001)
+		self.assertEqual(rtt.rto, query_engine.MIN_RTO)
+		rtt = query_engine.Rtt_Estimator()
+		rtt.sample(5.0)
+		self.assertEqual(rtt.rto, query_engine.MAX_RTO)
+
+	def test_backoff(self):
+		rtt = query_engine.Rtt_Estimator()
+		rtt.sample(0.5)
+
+		self.assertAlmostEqual(rtt.timeout(0), 1.5)
+		self.assertAlmostEqual(rtt.timeout(1), 3.0)
+		self.assertAlmostEqual(rtt.timeout(2), 6.0)
+		self.assertEqual(rtt.timeout(3), query_engine.MAX_RTO)
+
+class Query_Engine_Test(unittest.TestCase):
+	def setUp(self):
+		self.monotonic = common.monotonic
+		self.clock = Clock()
+		common.monotonic = self.clock
+		self.DNS_proto = dns_proto.DNS_Proto()
+		self.socket = Fake_Socket()
+		self.engine = query_engine.Query_Engine(self.DNS_proto, DOMAIN, self.socket, SERVER, 2.0, payload.Payload_Pool("abcdefghijklmnopqrstuvwxyz"))
+		self.probe = query_engine.Probe("A", "A", 1, 4, 15, 0)
+		self.engine.submit(self.probe)
+
+	def tearDown(self):
+		common.monotonic = self.monotonic
+
+	# an answer to the nth transmission of the probe
+	def answer(self, transmission):
+		query = self.socket.sent[transmission]
+		RRtype = self.DNS_proto.RR_types.get_by_name("A")
+		question = query[12:]
+		answer = self.DNS_proto.build_answer(0, ["A", "", [RRtype.packer("\x01\x02\x03\x04")], 1, DOMAIN], question)
+		self.socket.inbox.append(query[:2] + answer[2:])
+		self.engine.receive()
+
+	def expire(self, seconds):
+		self.clock.now += seconds
+		self.engine.expire()
+
+	def test_retransmit_with_new_transaction_id(self):
+		self.expire(query_engine.INITIAL_RTO)
+
+		self.assertEqual(len(self.socket.sent), 2)
+		(first, second) = self.socket.sent
+		self.assertNotEqual(first[:2], second[:2])
+		self.assertEqual(first[2:], second[2:])
+		self.assertEqual(self.probe.attempts, 2)
+		self.assertEqual(self.engine.retransmissions, 1)
+		# the timeout doubled
+		self.assertEqual(self.probe.deadline, self.clock.now + 2 * query_engine.INITIAL_RTO)
+
+	def test_answer_to_earlier_transmission(self):
+		self.expire(query_engine.INITIAL_RTO)
+		self.clock.now += 0.5
+		self.answer(0)
+
+		self.assertTrue(self.probe.result)
+		self.assertTrue(self.probe.late)
+		self.assertEqual(self.probe.answered_by, 0)
+		self.assertAlmostEqual(self.probe.rtt, query_engine.INITIAL_RTO + 0.5)
+		self.assertEqual(self.engine.late_answers, 1)
+
+	def test_late_answer_to_retired_id(self):
+		self.expire(query_engine.INITIAL_RTO)
+		self.answer(1)
+		self.assertTrue(self.probe.result)
+		self.assertFalse(self.probe.late)
+		self.answer(0)
+
+		self.assertEqual(self.engine.late_answers, 1)
+		self.assertEqual(self.engine.duplicates, 0)
+		self.assertEqual(self.probe.answered_by, 1)
+
+		# the same transmission answered again
+		self.answer(0)
+		self.assertEqual(self.engine.duplicates, 1)
+
+	def test_answer_after_giving_up(self):
+		for attempt in xrange(query_engine.MAX_RETRIES + 1):
+			self.expire(query_engine.MAX_RTO)
+		self.assertTrue(self.probe.done)
+		self.assertEqual(self.engine.unanswered, 1)
+		self.answer(0)
+
+		self.assertFalse(self.probe.result)
+		self.assertEqual(self.probe.message, "No answer after 3 tries.")
+		self.assertEqual(self.engine.late_answers, 1)
+		self.assertEqual(self.engine.duplicates, 0)
+
+	def test_duplicate(self):
+		self.answer(0)
+		self.answer(0)
+
+		self.assertTrue(self.probe.result)
+		self.assertEqual(self.engine.duplicates, 1)
+		self.assertEqual(self.engine.late_answers, 0)
+		self.assertEqual(self.engine.rtt.samples, 1)
+
+if __name__ == "__main__":
+	unittest.main()
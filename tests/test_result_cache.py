@@ -0,0 +1,107 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import unittest
+import os
+import time
+import tempfile
+import shutil
+
+import result_cache
+
+def entry(result, rtts, age=0):
+	return {"result": result, "time": time.time() - age, "summary": {}, "output": [], "probes": [{"rtt": rtt} for rtt in rtts]}
+
+class Result_Cache_Test(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.filename = os.path.join(self.directory, "cache.json")
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def cache(self, ttl=result_cache.DEFAULT_TTL):
+		return result_cache.Result_Cache(self.filename, result_cache.cache_key("127.0.0.1", 53, "example.com."), ttl)
+
+	def test_settled(self):
+		self.assertTrue(result_cache.settled(entry(True, [0.01])))
+		self.assertTrue(result_cache.settled(entry(True, [None])))
+		# answered, but not what the check wanted
+		self.assertTrue(result_cache.settled(entry(False, [0.01, 0.02])))
+		# lost packets or no probes at all
+		self.assertFalse(result_cache.settled(entry(False, [0.01, None])))
+		self.assertFalse(result_cache.settled(entry(False, [])))
+
+	def test_ttl(self):
+		cache = self.cache(ttl=60)
+		cache.update("fresh", entry(True, [0.01], age=30))
+		cache.update("stale", entry(True, [0.01], age=90))
+		cache.update("future", entry(True, [0.01], age=-30))
+
+		self.assertNotEqual(cache.lookup("fresh"), None)
+		self.assertEqual(cache.lookup("stale"), None)
+		# a clock that went backwards
+		self.assertEqual(cache.lookup("future"), None)
+		self.assertEqual(cache.hits, 1)
+
+	def test_failures(self):
+		cache = self.cache()
+		cache.update("EDNS", entry(False, [0.01]))
+		cache.update("rate limit", entry(False, [0.01, None]))
+
+		self.assertEqual(cache.lookup("EDNS")["result"], False)
+		self.assertEqual(cache.lookup("rate limit"), None)
+
+	def test_save_and_load(self):
+		cache = self.cache(ttl=60)
+		cache.update("fresh", entry(True, [0.01]))
+		cache.update("stale", entry(True, [0.01], age=90))
+		cache.save()
+
+		loaded = self.cache(ttl=60)
+		loaded.load()
+		self.assertNotEqual(loaded.lookup("fresh"), None)
+		# stale entries are not saved
+		self.assertEqual(loaded.resolvers[loaded.key].keys(), ["fresh"])
+		self.assertFalse(os.path.exists(self.filename + ".tmp"))
+
+	def test_keys(self):
+		cache = self.cache()
+		cache.update("basic", entry(True, [0.01]))
+		other = result_cache.Result_Cache(self.filename, result_cache.cache_key("127.0.0.1", 5353, "example.com."))
+		other.resolvers = cache.resolvers
+
+		self.assertEqual(other.lookup("basic"), None)
+
+	def test_broken_file(self):
+		f = open(self.filename, "w")
+		f.write("{\"version\": 0}")
+		f.close()
+
+		self.assertRaises(ValueError, self.cache().load)
+		# a missing file is an empty cache
+		os.remove(self.filename)
+		self.cache().load()
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,70 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import unittest
+
+import dns_proto
+
+class RR_Registry_Test(unittest.TestCase):
+	def test_lookup(self):
+		RR_types = dns_proto.RR_types
+		TXT = RR_types.get_by_name("TXT")
+
+		self.assertEqual(TXT.code, 16)
+		self.assertTrue(RR_types[16] is TXT)
+		self.assertTrue(16 in RR_types)
+		self.assertEqual(RR_types.get(54), None)
+		self.assertEqual(RR_types.get_by_name("NOPE"), None)
+		# the builder is still at index 1 of the old lists
+		self.assertTrue(TXT[1] is dns_proto.build_record_TXT)
+
+	def test_module_level(self):
+		self.assertTrue(dns_proto.DNS_Proto().RR_types is dns_proto.DNS_Proto().RR_types)
+
+	def test_register(self):
+		RR_types = dns_proto.RR_Registry()
+		RR_types.register(65400, "TEST", dns_proto.build_record_NULL, dns_proto.pack_record_id, dns_proto.unpack_record_id)
+
+		self.assertEqual(len(RR_types), 1)
+		self.assertTrue(RR_types.get_by_name("TEST").servable)
+		self.assertRaises(ValueError, RR_types.register, 65400, "OTHER")
+		self.assertRaises(ValueError, RR_types.register, 65401, "TEST")
+
+	def test_replace(self):
+		RR_types = dns_proto.RR_Registry()
+		RR_types.register(65400, "TEST")
+		RR_types.register(65400, "RENAMED", dns_proto.build_record_NULL, replace=True)
+
+		self.assertEqual(list(RR_types), [65400])
+		self.assertEqual(RR_types.get_by_name("TEST"), None)
+		self.assertEqual(RR_types[65400].name, "RENAMED")
+
+	def test_servable(self):
+		RR_types = dns_proto.RR_Registry()
+
+		self.assertFalse(RR_types.register(1, "NONE").servable)
+		self.assertFalse(RR_types.register(2, "ZONE", dns_proto.build_record_NS, servable=False).servable)
+		self.assertTrue(RR_types.register(3, "DATA", dns_proto.build_record_TXT).servable)
+
+if __name__ == "__main__":
+	unittest.main()
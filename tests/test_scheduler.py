@@ -0,0 +1,127 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import unittest
+
+import scheduler
+
+# the tasks of these tests submit no probes, the engine is only told the
+# phase
+class Idle_Engine():
+	def __init__(self):
+		self.phase = None
+		self.timeout = 1.0
+
+def check(result):
+	def function(task):
+		task.result = result
+		return
+		yield
+	return function
+
+class Probe_Scheduler_Test(unittest.TestCase):
+	def setUp(self):
+		self.ran = []
+		self.cache = {}
+
+	def restore(self, task):
+		if task.name not in self.cache:
+			return False
+		task.result = self.cache[task.name]
+		task.cached = True
+		return True
+
+	def scheduler(self):
+		return scheduler.Probe_Scheduler(Idle_Engine(), 4, self.restore)
+
+	def add(self, tasks, name, result, depends=(), after=(), cache=True):
+		def function(task):
+			self.ran.append(name)
+			for step in check(result)(task):
+				yield step
+		return tasks.add(name, function, depends=depends, after=after, cache=cache)
+
+	# basic -> EDNS -> EDNS size, capacity after both, estimate never cached
+	def build(self, edns_result):
+		tasks = self.scheduler()
+		basic = self.add(tasks, "basic", True)
+		edns = self.add(tasks, "EDNS", edns_result, depends=[basic])
+		edns_size = self.add(tasks, "EDNS size", True, depends=[edns])
+		capacity = self.add(tasks, "capacity", True, depends=[basic], after=[edns, edns_size])
+		self.add(tasks, "estimate", True, depends=[capacity], after=[edns], cache=False)
+		return tasks
+
+	def test_without_cache(self):
+		tasks = self.build(True)
+
+		self.assertEqual(tasks.run(), [])
+		self.assertEqual(self.ran, ["basic", "EDNS", "EDNS size", "capacity", "estimate"])
+
+	def test_everything_restored(self):
+		self.cache = {"basic": True, "EDNS": True, "EDNS size": True, "capacity": True, "estimate": True}
+		tasks = self.build(True)
+		tasks.run()
+
+		# only the task that is never cached runs
+		self.assertEqual(self.ran, ["estimate"])
+
+	def test_dependency_ran_again(self):
+		self.cache = {"basic": True, "EDNS size": True, "capacity": True}
+		tasks = self.build(True)
+		tasks.run()
+
+		# EDNS ran, so the tasks after it can not be trusted
+		self.assertEqual(self.ran, ["EDNS", "EDNS size", "capacity", "estimate"])
+
+	def test_cached_failed_dependency(self):
+		self.cache = {"basic": True, "EDNS": False, "capacity": True}
+		tasks = self.build(False)
+		tasks.run()
+		states = dict([(task.name, (task.state, task.cached)) for task in tasks.tasks])
+
+		# EDNS size is skipped because of a cached failure, capacity after it
+		# is still taken from the cache
+		self.assertEqual(states["EDNS"], ("done", True))
+		self.assertEqual(states["EDNS size"], ("skipped", True))
+		self.assertEqual(states["capacity"], ("done", True))
+		self.assertEqual(self.ran, ["estimate"])
+
+	def test_fresh_failed_dependency(self):
+		self.cache = {"basic": True, "capacity": True}
+		tasks = self.build(False)
+		tasks.run()
+		states = dict([(task.name, (task.state, task.cached)) for task in tasks.tasks])
+
+		self.assertEqual(states["EDNS size"], ("skipped", False))
+		self.assertEqual(self.ran, ["EDNS", "capacity", "estimate"])
+
+	def test_critical(self):
+		tasks = self.scheduler()
+		basic = tasks.add("basic", check(False), critical=True)
+		tasks.add("next", check(True), depends=[basic])
+
+		self.assertEqual([task.name for task in tasks.run()], ["basic"])
+		self.assertEqual(tasks.tasks[1].state, "skipped")
+
+if __name__ == "__main__":
+	unittest.main()
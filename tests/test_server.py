@@ -0,0 +1,171 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import unittest
+
+import main
+import dns_proto
+import estimator
+import resolver
+
+DOMAIN = "example.com."
+
+class Answer_Query_Test(unittest.TestCase):
+	def setUp(self):
+		self.tester = main.Tester()
+		self.tester.domain = DOMAIN
+		self.stats = [0] * len(main.SERVER_STATS)
+
+	def query(self, hostname, code):
+		return self.tester.DNS_proto.build_query(1234, hostname, DOMAIN, code)
+
+	# a query for any registered type is answered or refused, it never
+	# raises into the serve loop
+	def test_every_registered_type(self):
+		RR_types = self.tester.DNS_proto.RR_types
+		for code in sorted(RR_types):
+			RRtype = RR_types[code]
+			for (num, length) in ((1, 10), (3, 4), (2, 300)):
+				# addresses have a fixed size
+				length = estimator.FIXED_SIZES.get(RRtype.name, length)
+				hostname = "{0:03d}{1:03d}{2}.abcdef.".format(num, length, RRtype.name.lower())
+				packet = self.tester.answer_query(self.query(hostname, code), ("127.0.0.1", 5353), "udp", self.stats)
+				if not RRtype.servable:
+					self.assertEqual(packet, None, RRtype.name)
+					continue
+				if packet is None:
+					# too long for the record, e.g. a TXT string of 300
+					self.assertTrue(length > 255, RRtype.name)
+					continue
+				message = self.tester.DNS_proto.parse_message(packet, DOMAIN)
+				self.assertEqual(len(message.answers), num, RRtype.name)
+
+	def test_zone_types_are_refused(self):
+		for name in dns_proto.ZONE_TYPES:
+			RRtype = self.tester.DNS_proto.RR_types.get_by_name(name)
+			self.assertTrue(RRtype.builder)
+			self.assertFalse(RRtype.servable)
+			hostname = "001010{0}.abcdef.".format(name.lower())
+			self.assertEqual(self.tester.answer_query(self.query(hostname, RRtype.code), ("127.0.0.1", 5353), "udp", self.stats), None)
+		self.assertEqual(self.tester.metrics.errors.get("not implemented"), len(dns_proto.ZONE_TYPES))
+
+	def test_builder_failure_is_counted(self):
+		RR_types = dns_proto.RR_Registry()
+		def broken(builder, record):
+			raise AttributeError("broken")
+		RR_types.register(65399, "PRIVATE", broken, dns_proto.pack_record_id, dns_proto.unpack_record_id)
+		self.tester.DNS_proto.RR_types = RR_types
+		packet = self.tester.answer_query(self.query("001010private.abcdef.", 65399), ("127.0.0.1", 5353), "udp", self.stats)
+
+		self.assertEqual(packet, None)
+		self.assertEqual(self.tester.metrics.errors.get("cannot be built"), 1)
+
+# The resolver between a client and the real answer code. Nothing is sent,
+# the packets it would send are kept.
+class Impaired_Resolver_Test(unittest.TestCase):
+	def setUp(self):
+		self.tester = main.Tester()
+		self.tester.domain = DOMAIN
+		self.stats = [0] * len(main.SERVER_STATS)
+		self.impairments = resolver.Impairments()
+		self.resolver = resolver.Impaired_Resolver(("127.0.0.1", 0), ("127.0.0.1", 5300), self.impairments, tcp=False)
+		self.sent = []
+		self.resolver.sendto = lambda sock, packet, destination: self.sent.append((sock, packet, destination))
+		self.client = dns_proto.DNS_Proto()
+
+	def tearDown(self):
+		self.resolver.client_socket.close()
+		self.resolver.upstream_socket.close()
+
+	# the reply that reaches the client, None if there is none
+	def resolve(self, record_type, num, length, edns):
+		self.client.set_edns(edns)
+		code = self.client.RR_types.get_by_name(record_type).code
+		self.query = self.client.build_query(4321, "{0:03d}{1:03d}{2}.abcdef.".format(num, length, record_type.lower()), DOMAIN, code)
+		self.resolver.handle_query(self.query, ("127.0.0.1", 40000))
+		forwarded = [packet for (sock, packet, destination) in self.sent if sock is self.resolver.upstream_socket]
+		if forwarded:
+			self.forwarded = forwarded[-1]
+			self.answer = self.tester.answer_query(self.forwarded, ("127.0.0.1", 5353), "udp", self.stats)
+			self.resolver.handle_answer(self.answer)
+		replies = [packet for (sock, packet, destination) in self.sent if sock is self.resolver.client_socket]
+		if not replies:
+			return None
+
+		return replies[-1]
+
+	def header(self, packet):
+		(transaction_id, flags, questions, answers, authority, additional) = dns_proto.header_struct.unpack_from(packet, 0)
+		return {"id": transaction_id, "rcode": flags & 0xF, "tc": bool(flags & 0x0200), "answers": answers, "additional": additional}
+
+	def test_forwarded(self):
+		reply = self.resolve("TXT", 1, 10, 1)
+		header = self.header(reply)
+
+		self.assertEqual((header["id"], header["rcode"], header["tc"], header["answers"]), (4321, 0, False, 1))
+		# the OPT record goes up, the answer comes back as it is
+		self.assertEqual(self.header(self.forwarded)["additional"], 1)
+		self.assertEqual(reply[2:], self.answer[2:])
+
+	def test_truncated_without_edns(self):
+		reply = self.resolve("CNAME", 10, 100, 0)
+		header = self.header(reply)
+
+		self.assertEqual((header["id"], header["rcode"], header["tc"], header["answers"]), (4321, 0, True, 0))
+		# only the question of the query is left
+		self.assertEqual(reply[12:], self.query[12:])
+		self.assertEqual(self.resolver.stats[6], 1)
+
+	def test_truncated_to_max_answer(self):
+		self.impairments.max_answer = 600
+		self.assertTrue(self.header(self.resolve("CNAME", 20, 180, 1))["tc"])
+		self.assertFalse(self.header(self.resolve("CNAME", 2, 180, 1))["tc"])
+		self.assertEqual(self.resolver.stats[6], 1)
+
+	def test_blocked_type_is_refused(self):
+		self.resolver.blocked = set([self.client.RR_types.get_by_name("NULL").code])
+		header = self.header(self.resolve("NULL", 1, 10, 0))
+
+		self.assertEqual((header["id"], header["rcode"], header["tc"], header["answers"]), (4321, 5, False, 0))
+		# it never reached the server
+		self.assertEqual(self.stats[0], 0)
+		self.assertEqual(self.resolver.stats[5], 1)
+
+	def test_strip_edns(self):
+		self.impairments.strip_edns = True
+		reply = self.header(self.resolve("TXT", 1, 10, 1))
+
+		self.assertEqual(self.header(self.forwarded)["additional"], 0)
+		self.assertEqual((reply["rcode"], reply["tc"], reply["answers"], reply["additional"]), (0, False, 1, 0))
+		# the client's buffer size does not count any more
+		self.assertTrue(self.header(self.resolve("CNAME", 10, 100, 1))["tc"])
+		self.assertEqual(self.resolver.stats[7], 2)
+
+	def test_mtu_drop(self):
+		self.impairments.mtu = 576
+		self.assertEqual(self.resolve("CNAME", 10, 100, 1), None)
+		self.assertEqual(self.resolver.stats[11], 1)
+		self.assertTrue(self.resolve("TXT", 1, 10, 1))
+
+if __name__ == "__main__":
+	unittest.main()
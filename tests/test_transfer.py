@@ -0,0 +1,101 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import unittest
+
+import dns_proto
+import encoding
+import transfer
+
+DOMAIN = "example.com."
+
+# keeps the submitted probes, the test answers them in any order
+class Fake_Engine():
+	def __init__(self):
+		self.DNS_proto = dns_proto.DNS_Proto()
+		self.phase = None
+		self.max_inflight = 1
+		self.timeout = 1.0
+		self.retransmissions = 0
+		self.late_answers = 0
+		self.duplicates = 0
+		self.unanswered = 0
+		self.submitted = []
+
+	def submit(self, probe, callback):
+		self.submitted.append((probe, callback))
+
+def answer(submitted, result=True, truncated=False):
+	(probe, callback) = submitted
+	probe.result = result
+	probe.truncated = truncated
+	probe.rtt = 0.01
+	callback(probe)
+
+class Tunnel_Transfer_Test(unittest.TestCase):
+	def setUp(self):
+		self.engine = Fake_Engine()
+		self.transfer = transfer.Tunnel_Transfer(self.engine, DOMAIN, "TXT", encoding.get_by_name("raw"), encoding.get_by_name("base32"), 3, 255, 4000, 4)
+		for sequence in xrange(4):
+			self.transfer.send(sequence, 0)
+
+	def test_truncated_answer_stops_at_once(self):
+		answer(self.engine.submitted[0], False, True)
+
+		self.assertTrue(self.transfer.failed)
+		self.assertTrue(self.transfer.truncated)
+		self.assertEqual(len(self.transfer.resend), 0)
+		self.assertEqual(self.transfer.resends, 0)
+
+	def test_lost_answer_is_sent_again(self):
+		answer(self.engine.submitted[0], False)
+
+		self.assertFalse(self.transfer.failed)
+		self.assertEqual(list(self.transfer.resend), [(0, 1)])
+
+	def test_retried_answer_counts_as_reordered(self):
+		answer(self.engine.submitted[0], False)
+		for submitted in self.engine.submitted[1:4]:
+			answer(submitted)
+		self.transfer.send(*self.transfer.resend.popleft())
+		answer(self.engine.submitted[4])
+
+		self.assertEqual(self.transfer.reordered, 1)
+
+	def test_in_order_is_not_reordered(self):
+		for submitted in self.engine.submitted[:]:
+			answer(submitted)
+
+		self.assertEqual(self.transfer.reordered, 0)
+
+	def test_fitting_answer(self):
+		# one answer of 255 characters does not fit next to a full name
+		(num, length) = self.transfer.fitting_answer(512)
+		self.assertEqual(num, 1)
+		self.assertTrue(length < 255)
+		self.assertEqual(self.transfer.fitting_answer(1000), (2, 255))
+		self.assertEqual(self.transfer.fitting_answer(2000), (3, 255))
+		self.assertEqual(self.transfer.fitting_answer(100), None)
+
+if __name__ == "__main__":
+	unittest.main()
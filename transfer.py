@@ -0,0 +1,237 @@
+# MIT License
+
+# Copyright (c) 2018 Balazs Bucsay
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+
+if "transfer.py" in sys.argv[0]:
+	print("[-] Instead of poking around just try: python main.py --help")
+	sys.exit(-1)
+
+import os
+import struct
+import collections
+
+import common
+import encoding
+import query_engine
+
+# answers of a transfer query (number, characters) per record type. With a
+# query name of full length they fit into a 1232 byte EDNS message.
+DEFAULT_ANSWERS = {
+	"A": (48, 4),
+	"AAAA": (24, 16),
+	"CNAME": (3, 200),
+	"MX": (3, 200),
+	"SRV": (3, 200),
+	"TXT": (3, 255),
+	"NULL": (1, 800),
+	"PRIVATE": (1, 800),
+	"DNSKEY": (1, 800),
+	"RRSIG": (1, 800),
+}
+
+# longest domain name as text, with the closing dot
+MAX_NAME_TEXT = 254
+# a query that did not get through is sent again with a new name at most
+# this many times, then the transfer gives up
+MAX_RESENDS = 5
+# largest message without EDNS
+CLASSIC_SIZE = 512
+
+# truncated is True if the transfer stopped because the answers were
+# truncated, sending them again would not help
+Transfer_Result = collections.namedtuple("Transfer_Result", "complete size chunk_size block_size queries upstream_time downstream_time retransmissions resends late duplicates reordered corrupt unanswered truncated")
+
+# Sends size bytes up and down at the same time, like a tunnel does. Every
+# query carries the next chunk of the upstream data in its name and asks for
+# the next block of downstream data in num answers of length characters.
+# The chunks are sealed with a digest that the server checks, the answers
+# carry test data derived from the name and the digest of the chunk, so both
+# directions are checked byte by byte. Up to window queries are in flight,
+# a query that failed is sent again under its sequence number.
+class Tunnel_Transfer():
+	def __init__(self, engine, domain, record_type, encoding_class, upstream_encoding, num, length, size, window):
+		self.engine = engine
+		self.domain = domain
+		self.record_type = record_type
+		self.encoding = encoding_class
+		self.upstream_encoding = upstream_encoding
+		self.num = num
+		self.length = length
+		self.size = size
+		self.window = window
+
+		self.session = os.urandom(3).encode("hex")
+		# the first label has the same length in every query, so every name
+		# has room for the same number of characters
+		available = MAX_NAME_TEXT - len(domain) - len(self.first_label(0, num, length, 0)) - 1
+		self.name_characters = available - (available + 63) / 64
+		self.chunk_size = upstream_encoding.get_maximum_length(self.name_characters) - 4
+		# the first 4 bytes of the answers are the acknowledgement
+		self.block_size = num * encoding_class.get_maximum_length(length) - 4
+		if record_type in ("A", "AAAA"):
+			self.small_answer = (1, length)
+		else:
+			self.small_answer = (1, encoding_class.get_encoded_length(4))
+
+		self.upstream_data = os.urandom(size)
+		self.upstream_queries = 0
+		self.downstream_queries = 0
+		if self.chunk_size > 0:
+			self.upstream_queries = (size + self.chunk_size - 1) / self.chunk_size
+		if self.block_size > 0:
+			self.downstream_queries = (size + self.block_size - 1) / self.block_size
+
+		self.inflight = {}
+		self.resend = collections.deque()
+		self.upstream_done = 0
+		self.downstream_done = 0
+		self.highest = -1
+		self.failed = False
+		self.truncated = False
+
+		self.start = None
+		self.upstream_time = None
+		self.downstream_time = None
+		self.queries = 0
+		self.resends = 0
+		self.reordered = 0
+		self.corrupt = 0
+
+	def usable(self):
+		return (self.chunk_size > 0) and (self.block_size > 0)
+
+	# (num, length) of the biggest answers that fit into size bytes with a
+	# query name of full length, fewer answers first, then shorter ones.
+	# None if not even one short answer fits.
+	def fitting_answer(self, size=CLASSIC_SIZE):
+		DNS_proto = self.engine.DNS_proto
+		RRtype = DNS_proto.RR_types.get_by_name(self.record_type)
+		# header + full name + question fields
+		question = "\x00" * (12 + MAX_NAME_TEXT + 2 + 4)
+		def fits(num, length):
+			encoded_text = [RRtype.packer("x" * length)] * num
+			try:
+				return len(DNS_proto.build_answer(0, [self.record_type, "", encoded_text, num, self.domain], question)) <= size
+			except (struct.error, ValueError):
+				return False
+
+		for num in xrange(self.num, 0, -1):
+			if fits(num, self.length):
+				return (num, self.length)
+		if self.record_type in ("A", "AAAA"):
+			return None
+		# the block still has to carry data after the acknowledgement
+		length = self.length - 1
+		while self.encoding.get_maximum_length(length) > 4:
+			if fits(1, length):
+				return (1, length)
+			length -= 1
+
+		return None
+
+	def first_label(self, sequence, num, length, attempt):
+		return "{0:03d}{1:03d}{2}-{3}-{4}-{5}{6:06x}r{7}".format(num, length, self.record_type.lower(), self.encoding.get_name(), self.upstream_encoding.get_name(),
+			self.session, sequence, attempt)
+
+	def make_probe(self, sequence, attempt):
+		data = self.upstream_data[sequence*self.chunk_size:(sequence+1)*self.chunk_size]
+		chunk = ""
+		if data:
+			chunk = encoding.seal_chunk(data)
+		# once the downstream data is through, the answers only acknowledge
+		if sequence < self.downstream_queries:
+			(num, length) = (self.num, self.length)
+		else:
+			(num, length) = self.small_answer
+
+		first_label = self.first_label(sequence, num, length, attempt)
+		text = self.upstream_encoding.encode(chunk)
+		probe = query_engine.Probe(self.record_type, self.record_type, num, length, 0, 0, self.encoding)
+		probe.name = first_label + "." + "".join([text[i:i+63] + "." for i in xrange(0, len(text), 63)])
+		blocks = encoding.transfer_blocks((first_label + "." + text).lower(), chunk, num, self.encoding.get_maximum_length(length))
+		probe.expected = [self.encoding.encode(block) for block in blocks]
+
+		return probe
+
+	def send(self, sequence, attempt):
+		probe = self.make_probe(sequence, attempt)
+		self.inflight[probe] = (sequence, attempt)
+		self.queries += 1
+		self.engine.submit(probe, self.finished)
+
+	def finished(self, probe):
+		(sequence, attempt) = self.inflight.pop(probe)
+		if not probe.result:
+			if probe.truncated:
+				# the same answer is truncated under every name
+				self.truncated = True
+				self.failed = True
+				return
+			if probe.message == query_engine.DATA_CHANGED:
+				self.corrupt += 1
+			if attempt >= MAX_RESENDS:
+				self.failed = True
+			else:
+				self.resend.append((sequence, attempt + 1))
+				self.resends += 1
+			return
+
+		# delivered after a later part of the data, retried or not
+		if sequence < self.highest:
+			self.reordered += 1
+		self.highest = max(self.highest, sequence)
+		now = common.monotonic()
+		if sequence < self.upstream_queries:
+			self.upstream_done += 1
+			if self.upstream_done == self.upstream_queries:
+				self.upstream_time = now - self.start
+		if sequence < self.downstream_queries:
+			self.downstream_done += 1
+			if self.downstream_done == self.downstream_queries:
+				self.downstream_time = now - self.start
+
+	def run(self):
+		engine = self.engine
+		engine.phase = "transfer"
+		engine.max_inflight = max(engine.max_inflight, self.window)
+		before = (engine.retransmissions, engine.late_answers, engine.duplicates, engine.unanswered)
+
+		self.start = common.monotonic()
+		total = max(self.upstream_queries, self.downstream_queries)
+		sequence = 0
+		while True:
+			while (not self.failed) and (len(self.inflight) < self.window) and (self.resend or (sequence < total)):
+				if self.resend:
+					self.send(*self.resend.popleft())
+				else:
+					self.send(sequence, 0)
+					sequence += 1
+			if not self.inflight:
+				break
+			engine.step(engine.timeout)
+
+		complete = (not self.failed) and (self.upstream_done == self.upstream_queries) and (self.downstream_done == self.downstream_queries)
+
+		return Transfer_Result(complete, self.size, self.chunk_size, self.block_size, self.queries, self.upstream_time, self.downstream_time,
+			engine.retransmissions - before[0], self.resends, engine.late_answers - before[1], engine.duplicates - before[2], self.reordered, self.corrupt,
+			engine.unanswered - before[3], self.truncated)